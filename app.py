@@ -3,11 +3,13 @@ import numpy as np
 from PIL import Image
 import cv2 as cv
 from src.pipeline import DocumentRestorationPipeline
+from src.utils.cache import StageCache
 
 # --- Kích hoạt cache cho object nặng ---
+# StageCache: khi chỉ đổi 1 slider, các giai đoạn phía trước được lấy lại từ cache
 @st.cache_resource
 def get_pipeline():
-    return DocumentRestorationPipeline()
+    return DocumentRestorationPipeline(cache=StageCache(max_bytes=1 << 30))
 
 pipeline = get_pipeline()
 
@@ -48,6 +50,7 @@ if uploaded_file is not None:
         "denoise": True,
         "denoise_method": "median",
         "median_ksize": int(median_ksize),
+        "retain": "all",                        # app cần hiển thị mọi ảnh trung gian
     }
 
     with st.spinner('Đang xử lý tài liệu...'):
@@ -73,7 +76,9 @@ if uploaded_file is not None:
 
         # Forensic Ink
         with col_f:
-            ink = processed_results["images"].get("ink_restored") or processed_results["images"].get("ink")
+            ink = processed_results["images"].get("ink_restored")
+            if ink is None:
+                ink = processed_results["images"].get("ink")
             if ink is not None:
                 # convert single-channel -> 3-channel nếu cần
                 if isinstance(ink, np.ndarray) and ink.ndim == 2:
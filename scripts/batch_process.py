@@ -0,0 +1,400 @@
+"""
+Xử lý hàng loạt (Batch) cả một cuốn sách / kho tài liệu bằng nhiều tiến trình.
+
+- Đầu vào: thư mục ảnh, mẫu glob (ví dụ "scans/**/*.jpg") hoặc file manifest
+  (.txt/.lst, mỗi dòng một đường dẫn ảnh, tương đối theo thư mục chứa manifest).
+- Mỗi worker giữ sẵn một DocumentRestorationPipeline ("warm"), không khởi tạo lại mỗi trang.
+- Ảnh đã giải mã và ảnh kết quả được truyền qua multiprocessing.shared_memory,
+  chỉ có tên vùng nhớ + shape + dtype đi qua pickle.
+- Bộ nhớ bị chặn trên: số trang đang xử lý dở không vượt quá --max-inflight,
+  worker được khởi động lại sau --max-tasks-per-child trang.
+- Trang không có kết quả sau --page-timeout giây (worker bị kill / treo) được tính là lỗi,
+  vùng nhớ của nó được giải phóng và batch chạy tiếp.
+
+Cách dùng:
+    python scripts/batch_process.py data/book_01 -o output/book_01 -j 4
+    python scripts/batch_process.py "scans/**/*.jpg" -o output --ext .tif
+    python scripts/batch_process.py manifest.txt -o output
+"""
+import argparse
+import glob
+import json
+import multiprocessing as mp
+import os
+import queue
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+# Cho phép chạy trực tiếp `python scripts/batch_process.py` từ thư mục gốc repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.pipeline import DocumentRestorationPipeline
+from src.utils.io import IOManager
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp")
+MANIFEST_EXTENSIONS = (".txt", ".lst")
+
+# Pipeline "warm" của từng worker (khởi tạo 1 lần trong _init_worker)
+_PIPELINE = None
+_PARAMS = None
+
+
+# ------------------------------------------------------------------
+# Thu thập danh sách trang
+# ------------------------------------------------------------------
+def collect_pages(inputs):
+    """
+    Gom danh sách đường dẫn ảnh từ thư mục, glob hoặc manifest.
+    Giữ nguyên thứ tự (thư mục/glob được sắp xếp theo tên) và bỏ trùng lặp.
+    """
+    pages = []
+    for item in inputs:
+        if os.path.isdir(item):
+            found = sorted(
+                os.path.join(item, name) for name in os.listdir(item)
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        elif os.path.isfile(item) and item.lower().endswith(MANIFEST_EXTENSIONS):
+            base_dir = os.path.dirname(os.path.abspath(item))
+            with open(item, "r", encoding="utf-8") as f:
+                lines = [line.strip() for line in f]
+            found = [
+                line if os.path.isabs(line) else os.path.join(base_dir, line)
+                for line in lines if line and not line.startswith("#")
+            ]
+        elif os.path.isfile(item):
+            found = [item]
+        else:
+            found = sorted(
+                p for p in glob.glob(item, recursive=True)
+                if p.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        pages.extend(found)
+
+    seen = set()
+    unique = []
+    for p in pages:
+        key = os.path.abspath(p)
+        if key not in seen:
+            seen.add(key)
+            unique.append(p)
+    return unique
+
+
+# ------------------------------------------------------------------
+# Shared memory helpers
+# ------------------------------------------------------------------
+def _to_shared(array: np.ndarray):
+    """Copy mảng vào một vùng shared memory mới. Trả về (shm, descriptor)."""
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    view[...] = array
+    del view
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def _attach(descriptor):
+    """Gắn vào vùng shared memory có sẵn. Trả về (shm, ndarray view)."""
+    name, shape, dtype = descriptor
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+# ------------------------------------------------------------------
+# Worker
+# ------------------------------------------------------------------
+def _init_worker(params):
+    global _PIPELINE, _PARAMS
+    _PIPELINE = DocumentRestorationPipeline()
+    _PARAMS = params
+
+
+def _process_page(index, path, in_desc):
+    """
+    Chạy pipeline cho 1 trang nằm sẵn trong shared memory.
+    Ảnh final được ghi vào một vùng shared memory mới do worker tạo,
+    tiến trình chính sẽ đọc rồi unlink.
+    """
+    t0 = time.time()
+    in_shm, image = _attach(in_desc)
+    results = final = out_desc = None
+    try:
+        results = _PIPELINE.run(image, _PARAMS)
+        status = results.get("status", "error")
+        error = results.get("error")
+        meta = {k: v for k, v in results.get("meta", {}).items()
+                if isinstance(v, (int, float))}
+
+        final = results.get("images", {}).get("final")
+        if status == "ok" and isinstance(final, np.ndarray):
+            out_shm, out_desc = _to_shared(np.ascontiguousarray(final))
+            out_shm.close()
+        elif status == "ok":
+            status, error = "error", "Pipeline returned no final image"
+    except Exception as e:
+        status, error, meta = "error", str(e), {}
+    finally:
+        # Bỏ mọi tham chiếu tới buffer đầu vào trước khi close()
+        results = final = image = None
+        in_shm.close()
+
+    return {
+        "index": index,
+        "path": path,
+        "status": status,
+        "error": error,
+        "output": out_desc,
+        "meta": meta,
+        "worker_time": time.time() - t0,
+    }
+
+
+def output_paths(pages, output_dir, ext):
+    """
+    Đường dẫn ảnh kết quả cho từng trang: giữ cấu trúc thư mục tương đối theo thư mục gốc chung
+    của các trang (vol1/001.jpg và vol2/001.jpg không ghi đè nhau).
+    Hai trang cùng thư mục chỉ khác đuôi (001.jpg, 001.tif) -> thêm đuôi gốc vào tên (001_tif.png),
+    còn trùng nữa (khác hoa / thường) thì thêm số thứ tự trang.
+    """
+    if not pages:
+        return []
+    abs_pages = [os.path.abspath(p) for p in pages]
+    root = os.path.commonpath([os.path.dirname(p) for p in abs_pages])
+    stems = [os.path.splitext(os.path.relpath(p, root))[0] for p in abs_pages]
+
+    counts = {}
+    for stem in stems:
+        counts[os.path.normcase(stem)] = counts.get(os.path.normcase(stem), 0) + 1
+    outputs, used = [], set()
+    for i, (path, stem) in enumerate(zip(abs_pages, stems)):
+        if counts[os.path.normcase(stem)] > 1:
+            stem += "_" + os.path.splitext(path)[1].lstrip(".")
+        if os.path.normcase(stem) in used:
+            stem += f"_{i}"
+        used.add(os.path.normcase(stem))
+        outputs.append(os.path.join(output_dir, stem + ext))
+    return outputs
+
+
+# ------------------------------------------------------------------
+# Điều phối
+# ------------------------------------------------------------------
+class BatchProcessor:
+    """
+    Chia các trang cho một process pool, mỗi worker giữ 1 pipeline "warm".
+
+    Args:
+        output_dir (str): Thư mục lưu ảnh kết quả.
+        workers (int): Số tiến trình (mặc định = số CPU).
+        params (dict): Tham số truyền vào DocumentRestorationPipeline.run.
+        max_inflight (int): Số trang tối đa đang nằm trong shared memory cùng lúc.
+        max_tasks_per_child (int): Số trang trước khi worker được khởi động lại
+            (giải phóng bộ nhớ phân mảnh của OpenCV/NumPy).
+        ext (str): Định dạng ảnh đầu ra.
+        page_timeout (float): Số giây tối đa từ lúc gửi 1 trang tới lúc nhận kết quả; quá hạn
+            thì trang bị tính là lỗi (mp.Pool không báo khi worker chết giữa chừng, task đó
+            sẽ không bao giờ trả về). None = chờ vô hạn.
+    """
+
+    def __init__(self, output_dir: str, workers: int = None, params: dict = None,
+                 max_inflight: int = None, max_tasks_per_child: int = 50,
+                 ext: str = ".png", page_timeout: float = 600.0):
+        self.output_dir = output_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.params = params if params is not None else {}
+        self.max_inflight = max_inflight or 2 * self.workers
+        self.max_tasks_per_child = max_tasks_per_child
+        self.ext = ext if ext.startswith(".") else "." + ext
+        self.page_timeout = page_timeout
+
+    def _output_path(self, index):
+        return self._outputs[index]
+
+    def _collect(self, res, summary):
+        """Lưu ảnh kết quả từ shared memory và giải phóng vùng nhớ."""
+        if res["output"] is not None:
+            out_shm, final = _attach(res["output"])
+            try:
+                out_path = self._output_path(res["index"])
+                os.makedirs(os.path.dirname(out_path), exist_ok=True)
+                ok = IOManager.save_image(final, out_path)
+                if not ok and res["status"] == "ok":
+                    res["status"], res["error"] = "error", "Could not save output"
+            finally:
+                del final
+                out_shm.close()
+                out_shm.unlink()
+
+        if res["status"] == "ok":
+            summary["ok"] += 1
+        else:
+            self._fail(res["path"], res["error"], summary)
+
+    @staticmethod
+    def _fail(path, error, summary):
+        summary["failed"].append({"path": path, "error": error})
+        print(f"[Batch] Lỗi trang {path}: {error}")
+
+    @staticmethod
+    def _discard(res):
+        """Bỏ kết quả về muộn của trang đã bị tính là quá hạn (chỉ giải phóng vùng nhớ)."""
+        if res["output"] is None:
+            return
+        try:
+            shm = shared_memory.SharedMemory(name=res["output"][0])
+        except FileNotFoundError:
+            return
+        shm.close()
+        shm.unlink()
+
+    def run(self, pages: list) -> dict:
+        """Xử lý toàn bộ danh sách trang. Trả về dict tổng kết (kèm pages/sec)."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._outputs = output_paths(pages, self.output_dir, self.ext)
+        summary = {"total": len(pages), "ok": 0, "failed": []}
+        done = queue.Queue()
+        inputs = {}  # index -> shm đầu vào (tiến trình chính giữ để unlink)
+        deadlines = {}  # index -> thời điểm trang bị tính là quá hạn
+        paths = {}
+        inflight = 0
+
+        # Khởi động resource tracker trước khi fork để mọi worker dùng chung một tracker.
+        # Nếu không, tracker riêng của worker sẽ unlink các vùng nhớ khi worker bị recycle.
+        if hasattr(resource_tracker, "ensure_running") and os.name != "nt":
+            resource_tracker.ensure_running()
+
+        def release(index):
+            nonlocal inflight
+            shm = inputs.pop(index)
+            deadlines.pop(index, None)
+            inflight -= 1
+            try:
+                shm.close()
+            finally:
+                shm.unlink()
+
+        def expire():
+            now = time.time()
+            for index, deadline in list(deadlines.items()):
+                if deadline <= now:
+                    release(index)
+                    self._fail(paths[index], f"No result after {self.page_timeout:g}s "
+                                             "(worker died or page too slow)", summary)
+
+        def drain(block):
+            while inflight > 0:
+                timeout = None
+                if block and deadlines:
+                    timeout = max(0.0, min(deadlines.values()) - time.time())
+                try:
+                    res = done.get(block=block, timeout=timeout)
+                except queue.Empty:
+                    if block:
+                        expire()
+                    return
+                block = False
+                if res["index"] not in inputs:
+                    self._discard(res)
+                    continue
+                release(res["index"])
+                self._collect(res, summary)
+
+        t0 = time.time()
+        try:
+            with mp.Pool(processes=self.workers, initializer=_init_worker,
+                         initargs=(self.params,),
+                         maxtasksperchild=self.max_tasks_per_child) as pool:
+
+                for index, path in enumerate(pages):
+                    # Chặn trên số trang đang giữ trong bộ nhớ
+                    while inflight >= self.max_inflight:
+                        drain(block=True)
+
+                    image = IOManager.load_image(path)
+                    if image is None:
+                        self._fail(path, "Could not decode image", summary)
+                        continue
+
+                    shm, desc = _to_shared(image)
+                    del image
+                    inputs[index] = shm
+                    paths[index] = path
+                    if self.page_timeout is not None:
+                        deadlines[index] = time.time() + self.page_timeout
+                    inflight += 1
+
+                    def on_error(exc, index=index, path=path):
+                        done.put({"index": index, "path": path, "status": "error",
+                                  "error": str(exc), "output": None, "meta": {}})
+
+                    pool.apply_async(_process_page, (index, path, desc),
+                                     callback=done.put, error_callback=on_error)
+                    drain(block=False)
+
+                while inflight > 0:
+                    drain(block=True)
+        finally:
+            # Kết quả về muộn của trang quá hạn còn trong hàng đợi -> giải phóng vùng nhớ đầu ra;
+            # dừng giữa chừng (lỗi / Ctrl+C) -> không để lại vùng nhớ đầu vào nào
+            while not done.empty():
+                res = done.get_nowait()
+                if res["index"] not in inputs:
+                    self._discard(res)
+            for index in list(inputs):
+                release(index)
+
+        elapsed = time.time() - t0
+        summary["elapsed"] = elapsed
+        summary["pages_per_sec"] = summary["ok"] / elapsed if elapsed > 0 else 0.0
+        return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Batch restoration cho nhiều trang tài liệu.")
+    parser.add_argument("inputs", nargs="+",
+                        help="Thư mục ảnh, mẫu glob hoặc file manifest (.txt/.lst)")
+    parser.add_argument("-o", "--output", required=True, help="Thư mục đầu ra")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Số tiến trình")
+    parser.add_argument("--max-inflight", type=int, default=None,
+                        help="Số trang tối đa đang xử lý cùng lúc (mặc định 2 x workers)")
+    parser.add_argument("--max-tasks-per-child", type=int, default=50,
+                        help="Khởi động lại worker sau N trang")
+    parser.add_argument("--ext", default=".png", help="Định dạng ảnh đầu ra")
+    parser.add_argument("--page-timeout", type=float, default=600.0,
+                        help="Số giây tối đa cho 1 trang trước khi tính là lỗi")
+    parser.add_argument("--params", default=None,
+                        help="File JSON chứa params cho pipeline.run")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # IOManager.load_image trả về ảnh BGR; worker chỉ cần ảnh final
+    params = {"assume_rgb": False, "retain": "final"}
+    if args.params:
+        with open(args.params, "r", encoding="utf-8") as f:
+            params.update(json.load(f))
+
+    pages = collect_pages(args.inputs)
+    if not pages:
+        print("[Batch] Không tìm thấy ảnh đầu vào.")
+        return 1
+
+    processor = BatchProcessor(args.output, workers=args.workers, params=params,
+                               max_inflight=args.max_inflight,
+                               max_tasks_per_child=args.max_tasks_per_child,
+                               ext=args.ext, page_timeout=args.page_timeout)
+    summary = processor.run(pages)
+
+    print(f"[Batch] {summary['ok']}/{summary['total']} trang thành công, "
+          f"{len(summary['failed'])} lỗi, {summary['elapsed']:.2f}s "
+          f"-> {summary['pages_per_sec']:.2f} pages/sec")
+    return 0 if not summary["failed"] else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
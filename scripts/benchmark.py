@@ -0,0 +1,276 @@
+"""
+Benchmark từng giai đoạn của DocumentRestorationPipeline trên trang giả lập.
+
+- Trang thử được sinh có seed (lặp lại được) rồi làm hỏng bằng DataAugmentor:
+  nhiễu Gaussian + muối tiêu, bóng đổ, xoay nghiêng và cong trang (cylinder warp).
+- Mỗi giai đoạn (preprocess, geometry, restore, enhance, segment) được đo riêng:
+  chạy warmup, sau đó lặp lại --repeats lần, ghi min/median/mean.
+- Bộ nhớ đỉnh của từng giai đoạn đo bằng tracemalloc (NumPy và mảng trả về
+  từ OpenCV đều được theo dõi), cộng thêm RSS đỉnh của cả tiến trình.
+- Kết quả ghi ra JSON; --compare so sánh với baseline và báo regression.
+
+Cách dùng:
+    python scripts/benchmark.py --sizes 1 4 16 -o bench.json
+    python scripts/benchmark.py --sizes 1 4 --compare bench_baseline.json --threshold 0.1
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import cv2 as cv
+import numpy as np
+
+# Cho phép chạy trực tiếp `python scripts/benchmark.py` từ thư mục gốc repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.pipeline import DocumentRestorationPipeline
+from src.utils.augmentor import DataAugmentor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Tỷ lệ khổ giấy A (cao / rộng)
+PAGE_ASPECT = 1.414
+
+
+# ------------------------------------------------------------------
+# Sinh dữ liệu giả lập
+# ------------------------------------------------------------------
+def make_clean_page(megapixels: float, rng: np.random.RandomState) -> np.ndarray:
+    """Tạo trang "sạch": nền giấy ngà + các dòng chữ giả (ảnh BGR 8-bit)."""
+    n_pixels = megapixels * 1e6
+    w = int(round(np.sqrt(n_pixels / PAGE_ASPECT)))
+    h = int(round(w * PAGE_ASPECT))
+
+    page = np.empty((h, w, 3), dtype=np.uint8)
+    page[...] = (205, 225, 235)  # màu giấy cũ
+
+    # Kích thước chữ tỉ lệ theo chiều rộng trang (~60 ký tự / dòng)
+    font_scale = w / 1400.0
+    thickness = max(1, int(round(font_scale * 2)))
+    line_step = max(8, int(45 * font_scale))
+    margin = int(0.08 * w)
+    alphabet = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+
+    y = margin
+    while y < h - margin:
+        x = margin
+        while x < w - margin:
+            word = "".join(rng.choice(alphabet, size=rng.randint(2, 9)))
+            (tw, _), _ = cv.getTextSize(word, cv.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+            if x + tw > w - margin:
+                break
+            cv.putText(page, word, (x, y), cv.FONT_HERSHEY_SIMPLEX, font_scale,
+                       (40, 35, 30), thickness, cv.LINE_AA)
+            x += tw + line_step // 2
+        y += line_step
+    return page
+
+
+def make_degraded_page(megapixels: float, seed: int = 0) -> np.ndarray:
+    """Sinh trang giả lập đã bị làm hỏng, hoàn toàn xác định theo seed."""
+    rng = np.random.RandomState(seed)
+    page = make_clean_page(megapixels, rng)
+
+    # DataAugmentor dùng np.random toàn cục -> seed lại để lặp lại được
+    np.random.seed(seed)
+    aug = DataAugmentor(noise_std=12, sp_prob=0.01, shadow_amount=0.6,
+                        max_rotation_angle=4,
+                        cylinder_mag=0.01 * page.shape[0])
+    page = aug.warp_cylinder(page)
+    page = aug.add_rotation(page)
+    page = aug.add_shadow(page)
+    page = aug.add_noise_gaussian(page)
+    page = aug.add_noise_sp(page)
+    return page
+
+
+# ------------------------------------------------------------------
+# Đo đạc
+# ------------------------------------------------------------------
+def _peak_rss_bytes():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux trả về KB, macOS trả về bytes
+    return int(rss) if sys.platform == "darwin" else int(rss) * 1024
+
+
+def bench_stage(pipeline, stage, img, params, warmup, repeats):
+    """Đo thời gian + bộ nhớ đỉnh của 1 giai đoạn. Trả về (stats, ảnh đầu ra)."""
+    try:
+        for _ in range(warmup):
+            pipeline.run_stage(stage, img, params, {"meta": {}, "images": {}})
+
+        times = []
+        out = img
+        for _ in range(repeats):
+            results = {"meta": {}, "images": {}}
+            t0 = time.perf_counter()
+            out = pipeline.run_stage(stage, img, params, results)
+            times.append(time.perf_counter() - t0)
+            del results
+
+        # Chạy thêm 1 lần riêng dưới tracemalloc để không làm sai thời gian đo
+        tracemalloc.start()
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        pipeline.run_stage(stage, img, params, {"meta": {}, "images": {}})
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    except Exception as e:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        # Giai đoạn lỗi: ghi lại lỗi, ảnh đi tiếp không đổi
+        return {"error": f"{type(e).__name__}: {e}"}, img
+
+    stats = {
+        "min_s": min(times),
+        "median_s": statistics.median(times),
+        "mean_s": statistics.mean(times),
+        "repeats": repeats,
+        "peak_bytes": int(peak - base),
+        "output_shape": list(np.shape(out)),
+    }
+    return stats, out
+
+
+def run_benchmark(sizes, repeats=5, warmup=1, seed=0, params=None, stages=None):
+    pipeline = DocumentRestorationPipeline()
+    params = params if params is not None else {}
+    stages = stages or DocumentRestorationPipeline.STAGES
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv.__version__,
+            "machine": platform.machine(),
+            "seed": seed,
+            "repeats": repeats,
+            "warmup": warmup,
+            "params": params,
+        },
+        "results": {},
+    }
+
+    for mp in sizes:
+        key = f"{mp:g}MP"
+        page = make_degraded_page(mp, seed=seed)
+        entry = {"shape": list(page.shape), "stages": {}}
+        print(f"[Bench] {key} {page.shape[1]}x{page.shape[0]}")
+
+        img = page
+        for stage in stages:
+            stats, img = bench_stage(pipeline, stage, img, params, warmup, repeats)
+            entry["stages"][stage] = stats
+            if "error" in stats:
+                print(f"    {stage:<11s} ERROR {stats['error']}")
+            else:
+                print(f"    {stage:<11s} {stats['median_s'] * 1000:10.1f} ms  "
+                      f"peak {stats['peak_bytes'] / 2**20:8.1f} MiB")
+
+        entry["peak_rss_bytes"] = _peak_rss_bytes()
+        report["results"][key] = entry
+        del page, img
+
+    return report
+
+
+# ------------------------------------------------------------------
+# So sánh với baseline
+# ------------------------------------------------------------------
+def compare_reports(current, baseline, threshold=0.10, mem_threshold=0.10):
+    """
+    So sánh median time và peak_bytes từng giai đoạn với baseline.
+    Trả về list các regression (dict), rỗng nếu không có.
+    """
+    regressions = []
+    for size, entry in current["results"].items():
+        base_entry = baseline.get("results", {}).get(size)
+        if base_entry is None:
+            continue
+        for stage, stats in entry["stages"].items():
+            base = base_entry["stages"].get(stage)
+            if base is None:
+                continue
+            if "error" in stats and "error" not in base:
+                regressions.append({"size": size, "stage": stage, "metric": "status",
+                                    "baseline": "ok", "current": stats["error"]})
+                continue
+            if "error" in stats or "error" in base:
+                continue
+
+            checks = (("median_s", threshold), ("peak_bytes", mem_threshold))
+            for metric, limit in checks:
+                old, new = base[metric], stats[metric]
+                if old > 0 and new > old * (1.0 + limit):
+                    regressions.append({"size": size, "stage": stage, "metric": metric,
+                                        "baseline": old, "current": new,
+                                        "ratio": new / old})
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark từng giai đoạn của pipeline.")
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 4, 16],
+                        help="Kích thước trang (megapixel)")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stages", nargs="+", default=None,
+                        choices=DocumentRestorationPipeline.STAGES)
+    parser.add_argument("--params", default=None,
+                        help="File JSON chứa params cho pipeline")
+    parser.add_argument("-o", "--output", default=None, help="Ghi kết quả ra file JSON")
+    parser.add_argument("--compare", default=None, help="File JSON baseline để so sánh")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Ngưỡng regression thời gian (0.10 = chậm hơn 10%%)")
+    parser.add_argument("--mem-threshold", type=float, default=0.10,
+                        help="Ngưỡng regression bộ nhớ đỉnh")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Ảnh sinh ra là BGR
+    params = {"assume_rgb": False}
+    if args.params:
+        with open(args.params, "r", encoding="utf-8") as f:
+            params.update(json.load(f))
+
+    report = run_benchmark(args.sizes, repeats=args.repeats, warmup=args.warmup,
+                           seed=args.seed, params=params, stages=args.stages)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[Bench] Đã ghi kết quả: {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_reports(report, baseline, args.threshold, args.mem_threshold)
+        if regressions:
+            print(f"[Bench] Phát hiện {len(regressions)} regression:")
+            for r in regressions:
+                if r["metric"] == "status":
+                    print(f"    {r['size']} {r['stage']}: stage now fails ({r['current']})")
+                else:
+                    print(f"    {r['size']} {r['stage']} {r['metric']}: "
+                          f"{r['baseline']:.4g} -> {r['current']:.4g} (x{r['ratio']:.2f})")
+            return 1
+        print("[Bench] Không có regression so với baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+import numpy as np
+import cv2 as cv
+
+
+class PageContext:
+    """
+    Dữ liệu phân tích dùng chung của 1 trang giữa các giai đoạn / thành phần
+    (ảnh xám, mask mực Otsu, connected components, mean / mean bình phương cục bộ...).
+
+    - Tính lười (lazy): chỉ tính khi có thành phần cần, và chỉ tính 1 lần.
+    - Gắn với 1 phiên bản ảnh: update(ảnh mới) -> mọi dữ liệu đã tính bị xóa.
+    - Chỉ nhớ kết quả tính trên ảnh hiện tại hoặc trên mảng do chính context sinh ra từ nó
+      (ảnh xám, mask mực...), khóa theo id mảng + tham số; các mảng đó được giữ tham chiếu nên
+      id không bị tái sử dụng. Mảng khác (ví dụ bản chuyển đổi nơi gọi vừa tạo) được tính trực
+      tiếp, không lưu - lần sau không trúng được nên lưu chỉ làm phình bộ nhớ.
+
+    Lưu ý: mảng trả về được dùng chung, không sửa trực tiếp (in-place) ảnh hay kết quả.
+    """
+
+    def __init__(self, image: np.ndarray = None):
+        self.image = None
+        self.version = 0
+        self._memo = {}
+        self._derived = set()  # id các mảng context đã sinh ra cho ảnh hiện tại
+        if image is not None:
+            self.update(image)
+
+    def update(self, image: np.ndarray):
+        """Gắn ảnh hiện tại của trang. Ảnh khác (đối tượng khác) -> xóa dữ liệu đã tính."""
+        if image is not self.image:
+            self.image = image
+            self.version += 1
+            self._memo.clear()
+            self._derived.clear()
+        return self
+
+    def _get(self, name, source, params, compute):
+        source = self.image if source is None else source
+        if source is None:
+            raise ValueError("PageContext has no image!")
+        if source is not self.image and id(source) not in self._derived:
+            return compute(source)
+        key = (name, id(source), params)
+        value = self._memo.get(key)
+        if value is None:
+            value = compute(source)
+            self._memo[key] = value
+            parts = value.values() if isinstance(value, dict) else (
+                value if isinstance(value, tuple) else (value,))
+            self._derived.update(id(a) for a in parts if isinstance(a, np.ndarray))
+        return value
+
+    def gray(self, image: np.ndarray = None) -> np.ndarray:
+        """Ảnh xám 8-bit (ảnh xám 2D được trả lại nguyên)."""
+        def compute(img):
+            if img.ndim > 2:
+                img = cv.cvtColor(img, cv.COLOR_BGR2GRAY)
+            if img.dtype != np.uint8:
+                img = np.clip(img, 0, 255).astype(np.uint8)
+            return img
+        return self._get("gray", image, (), compute)
+
+    def otsu_ink(self, image: np.ndarray = None) -> np.ndarray:
+        """Mask mực (255) / nền (0) bằng Otsu đảo (chữ tối trên nền sáng)."""
+        def compute(gray):
+            _, ink = cv.threshold(gray, 0, 255, cv.THRESH_BINARY_INV + cv.THRESH_OTSU)
+            return ink
+        # Khóa theo ảnh xám: otsu_ink(ảnh màu) và otsu_ink(gray(ảnh màu)) dùng chung 1 mask
+        return self._get("otsu_ink", self.gray(image), (), compute)
+
+    def components(self, mask: np.ndarray = None, connectivity: int = 8) -> dict:
+        """
+        Connected components của mask nhị phân (mặc định: otsu_ink() của ảnh hiện tại).
+        Trả về dict {"num_labels", "labels", "stats", "centroids"} như Preprocessor.filter_small_blobs.
+        """
+        if mask is None:
+            mask = self.otsu_ink()
+
+        def compute(m):
+            num_labels, labels, stats, centroids = cv.connectedComponentsWithStats(
+                m, connectivity=connectivity)
+            return {"num_labels": num_labels, "labels": labels,
+                    "stats": stats, "centroids": centroids}
+        return self._get("components", mask, (connectivity,), compute)
+
+    def local_stats(self, window_size: int, image: np.ndarray = None):
+        """
+        (mean, mean_sq) cục bộ float32 trong cửa sổ window_size x window_size (boxFilter) của ảnh xám.
+        Dùng chung cho các biến thể ngưỡng cục bộ (Sauvola, Niblack, ...).
+        """
+        def compute(gray):
+            gray = gray.astype(np.float32)
+            ksize = (window_size, window_size)
+            mean = cv.boxFilter(gray, ddepth=-1, ksize=ksize, normalize=True)
+            mean_sq = cv.boxFilter(gray * gray, ddepth=-1, ksize=ksize, normalize=True)
+            return mean, mean_sq
+        return self._get("local_stats", self.gray(image), (int(window_size),), compute)
+
+    def ink_integral(self, mask: np.ndarray = None) -> np.ndarray:
+        """
+        Ảnh tích phân (h+1, w+1) int32 đếm pixel mực của mask (mặc định: otsu_ink() của ảnh hiện tại):
+        số pixel mực trong [y0:y1, x0:x1] = I[y1, x1] - I[y0, x1] - I[y1, x0] + I[y0, x0].
+        """
+        if mask is None:
+            mask = self.otsu_ink()
+
+        def compute(m):
+            return cv.integral((m > 0).view(np.uint8), sdepth=cv.CV_32S)
+        return self._get("ink_integral", mask, (), compute)
@@ -1,24 +1,256 @@
+from functools import lru_cache
+
 import numpy as np
 
+from src.utils.tiling import process_tiled
+
+# Kernel lớn hơn ngưỡng này dùng np.partition thay vì mạng so sánh
+_MEDIAN_NETWORK_MAX_KSIZE = 25
+# Số phần tử tối đa của các "mặt phẳng" (ksize^2 ảnh dịch) giữ cùng lúc cho 1 dải hàng
+_MEDIAN_BAND_ELEMENTS = 1 << 25
+
+
+def _batcher_network(n):
+    """Mạng so sánh Batcher odd-even merge sort cho n phần tử (n là lũy thừa của 2)."""
+    comparators = []
+    p = 1
+    while p < n:
+        k = p
+        while k >= 1:
+            for j in range(k % p, n - k, 2 * k):
+                for i in range(min(k, n - j - k)):
+                    if (i + j) // (p * 2) == (i + j + k) // (p * 2):
+                        comparators.append((i + j, i + j + k))
+            k //= 2
+        p *= 2
+    return comparators
+
+
+@lru_cache(maxsize=None)
+def _median_network(n):
+    """
+    Rút gọn mạng sắp xếp thành mạng chỉ chọn phần tử trung vị của n giá trị.
+    - Các dây đệm (để đủ lũy thừa 2) mang giá trị +vô cùng nên phép so sánh với chúng bị bỏ.
+    - Duyệt ngược để bỏ các phép so sánh không ảnh hưởng tới trung vị và chỉ giữ
+      nửa min hoặc max khi nửa còn lại không được dùng.
+    Trả về (ops, out_slot), ops là list (a, b, cần_min, cần_max).
+    """
+    n2 = 1
+    while n2 < n:
+        n2 *= 2
+
+    slot = list(range(n2))
+    is_inf = [i >= n for i in range(n2)]
+    ops = []
+    for i, j in _batcher_network(n2):
+        if is_inf[j]:
+            continue
+        if is_inf[i]:
+            # min = giá trị ở j, max = vô cùng -> chỉ cần đổi nhãn dây
+            slot[i], slot[j] = slot[j], slot[i]
+            is_inf[i], is_inf[j] = False, True
+            continue
+        ops.append((slot[i], slot[j]))
+
+    out_slot = slot[n // 2]
+    live = {out_slot}
+    pruned = []
+    for a, b in reversed(ops):
+        need_min, need_max = a in live, b in live
+        if not (need_min or need_max):
+            continue
+        live.update((a, b))
+        pruned.append((a, b, need_min, need_max))
+    pruned.reverse()
+    return tuple(pruned), out_slot
+
+
+# Chi phí ước lượng của FFT quy ra "số phép nhân-cộng trên mỗi pixel" (đo trên ảnh 12MP);
+# direct tốn kh * kw, separable tốn kh + kw (+ 2 cho ảnh trung gian)
+_FFT_COST_TAPS = 40
+# Sai số tương đối cho phép khi kiểm tra kernel có hạng 1 (tách được) qua SVD
+_SEPARABLE_RTOL = 1e-6
+
+
+@lru_cache(maxsize=64)
+def _gaussian_kernel_1d(ksize, sigma):
+    """Kernel Gaussian 1-D đã chuẩn hóa (tổng = 1). G(x,y) = g(x) * g(y)."""
+    x = np.arange(ksize, dtype=np.float64) - ksize // 2
+    g = np.exp(-(x ** 2) / (2 * sigma ** 2))
+    g = (g / g.sum()).astype(np.float32)
+    g.setflags(write=False)
+    return g
+
+
+@lru_cache(maxsize=64)
+def _gaussian_kernel_2d(ksize, sigma):
+    g = _gaussian_kernel_1d(ksize, sigma)
+    kernel = np.outer(g, g).astype(np.float32)
+    kernel.setflags(write=False)
+    return kernel
+
+
+def _separable_factors(kernel):
+    """Nếu kernel có hạng 1 thì trả về (cột, hàng) sao cho kernel = outer(cột, hàng), ngược lại None."""
+    kh, kw = kernel.shape
+    if kh == 1:
+        return np.ones(1, dtype=np.float32), kernel[0].copy()
+    if kw == 1:
+        return kernel[:, 0].copy(), np.ones(1, dtype=np.float32)
+    u, s, vt = np.linalg.svd(kernel.astype(np.float64))
+    if s[0] == 0 or s[1] > _SEPARABLE_RTOL * s[0]:
+        return None
+    root = np.sqrt(s[0])
+    return (u[:, 0] * root).astype(np.float32), (vt[0] * root).astype(np.float32)
+
+
+def _choose_convolution_method(kh, kw, separable):
+    """Chọn engine rẻ nhất theo mô hình chi phí đơn giản (số phép tính / pixel)."""
+    costs = {"direct": kh * kw, "fft": _FFT_COST_TAPS}
+    if separable:
+        costs["separable"] = kh + kw + 2
+    return min(costs, key=costs.get)
+
+
+def _correlate_direct(img_padded, kernel):
+    """Tương quan 'valid' bằng cách cộng dồn các ảnh dịch (mỗi phần tử kernel 1 lượt)."""
+    kh, kw = kernel.shape
+    h, w = img_padded.shape[0] - kh + 1, img_padded.shape[1] - kw + 1
+    output = np.zeros((h, w), dtype=np.float32)
+    src = img_padded.astype(np.float32, copy=False)
+    for dy in range(kh):
+        for dx in range(kw):
+            weight = kernel[dy, dx]
+            if weight != 0:
+                output += weight * src[dy:dy + h, dx:dx + w]
+    return output
+
+
+def _correlate_separable(img_padded, col, row):
+    """Tương quan 'valid' với kernel = outer(col, row): lọc ngang rồi lọc dọc."""
+    kh, kw = len(col), len(row)
+    h, w = img_padded.shape[0] - kh + 1, img_padded.shape[1] - kw + 1
+    src = img_padded.astype(np.float32, copy=False)
+
+    horizontal = np.zeros((src.shape[0], w), dtype=np.float32)
+    for dx in range(kw):
+        if row[dx] != 0:
+            horizontal += row[dx] * src[:, dx:dx + w]
+
+    output = np.zeros((h, w), dtype=np.float32)
+    for dy in range(kh):
+        if col[dy] != 0:
+            output += col[dy] * horizontal[dy:dy + h]
+    return output
+
+
+def _next_fast_len(n):
+    """Số nhỏ nhất >= n chỉ có thừa số 2, 3, 5 (FFT nhanh nhất với các độ dài này)."""
+    best = 1 << int(np.ceil(np.log2(max(n, 1))))
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            p = p35
+            while p < n:
+                p *= 2
+            best = min(best, p)
+            p35 *= 3
+        p5 *= 5
+    return best
+
+
+def _correlate_fft(img_padded, kernel):
+    """Tương quan 'valid' qua FFT: tích chập với kernel lật rồi lấy phần hợp lệ."""
+    kh, kw = kernel.shape
+    hp, wp = img_padded.shape
+    h, w = hp - kh + 1, wp - kw + 1
+    shape = (_next_fast_len(hp + kh - 1), _next_fast_len(wp + kw - 1))
+
+    spectrum = np.fft.rfft2(img_padded.astype(np.float32, copy=False), s=shape)
+    spectrum *= np.fft.rfft2(kernel[::-1, ::-1], s=shape)
+    full = np.fft.irfft2(spectrum, s=shape)
+    return full[kh - 1:kh - 1 + h, kw - 1:kw - 1 + w].astype(np.float32)
+
+
 class ImageDenoiser:
-    def manual_median_filter(self, image: np.ndarray, ksize: int = 3) -> np.ndarray:
-        """Tự cài đặt bộ lọc Median (Sắp xếp mảng)."""
+    def denoise(self, image: np.ndarray, method: str = "median", ksize: int = 3,
+                strength: float = 1.0, tile_size: int = None, workers: int = 1) -> np.ndarray:
+        """
+        Hàm khử nhiễu chung cho pipeline.
+        - "median": lọc trung vị kích thước ksize (nhiễu muối tiêu).
+        - "gaussian": lọc Gaussian kích thước ksize, sigma = strength (nhiễu hạt).
+        Ảnh màu được xử lý từng kênh.
+        tile_size, workers: xử lý theo tile (halo = ksize // 2) trên thread pool.
+        """
+        if image is None:
+            raise ValueError("Input image is None!")
+
+        if method == "median":
+            func = lambda channel: self.manual_median_filter(channel, ksize, tile_size=tile_size,
+                                                             workers=workers)
+        elif method == "gaussian":
+            def func(channel):
+                if tile_size:
+                    return process_tiled(channel,
+                                         lambda tile: self.apply_gaussian(tile, ksize, sigma=strength),
+                                         halo=ksize // 2, tile_size=tile_size, workers=workers)
+                return self.apply_gaussian(channel, ksize, sigma=strength)
+        else:
+            raise ValueError(f"Unknown denoise method: {method}")
+
+        if image.ndim == 3:
+            return np.dstack([func(np.ascontiguousarray(image[..., c]))
+                              for c in range(image.shape[2])])
+        return func(image)
+
+    def manual_median_filter(self, image: np.ndarray, ksize: int = 3,
+                             tile_size: int = None, workers: int = 1) -> np.ndarray:
+        """Tự cài đặt bộ lọc Median (vector hóa, không lặp từng pixel).
+        - ksize <= 25: mạng so sánh (sorting network) rút gọn chỉ lấy trung vị, mỗi phép so sánh
+          là np.minimum/np.maximum trên cả dải ảnh (ksize^2 ảnh dịch của dải hàng).
+        - ksize lớn hơn: np.partition trên sliding window của từng dải hàng.
+        Biên xử lý như np.pad(mode='edge'). Hỗ trợ uint8, uint16 (và các kiểu số khác).
+        tile_size: nếu có, xử lý theo tile với halo = ksize // 2."""
+        if tile_size:
+            return process_tiled(image, lambda tile: self.manual_median_filter(tile, ksize),
+                                 halo=ksize // 2, tile_size=tile_size, workers=workers)
+
         if len(image.shape) != 2:
             raise TypeError("Image must be grayscale")
+        if not isinstance(ksize, (int, np.integer)) or ksize < 1 or ksize % 2 == 0:
+            raise ValueError("ksize must be a positive odd integer")
 
         h, w = image.shape
-        output = np.zeros_like(image)
+        output = np.empty_like(image)
         pad = ksize // 2
         img_padded = np.pad(image, ((pad, pad), (pad, pad)), mode='edge')
+        n = ksize * ksize
 
+        # Chia theo dải hàng để bộ nhớ tạm bị chặn trên
+        band = max(1, _MEDIAN_BAND_ELEMENTS // (w * n))
 
-        for i in range(h):
-            for j in range(w):
-                window = img_padded[i:i + ksize, j:j + ksize]
-
-                sorted_pixels = np.sort(window)
-
-                output[i, j] = np.median(sorted_pixels)
+        if ksize <= _MEDIAN_NETWORK_MAX_KSIZE:
+            ops, out_slot = _median_network(n)
+            for y0 in range(0, h, band):
+                y1 = min(h, y0 + band)
+                # ksize^2 view (không copy) của dải hàng, dịch theo từng vị trí trong cửa sổ
+                planes = [img_padded[y0 + dy:y1 + dy, dx:dx + w]
+                          for dy in range(ksize) for dx in range(ksize)]
+                for a, b, need_min, need_max in ops:
+                    lo, hi = planes[a], planes[b]
+                    if need_min:
+                        planes[a] = np.minimum(lo, hi)
+                    if need_max:
+                        planes[b] = np.maximum(lo, hi)
+                output[y0:y1] = planes[out_slot]
+        else:
+            windows = np.lib.stride_tricks.sliding_window_view(img_padded, (ksize, ksize))
+            rank = n // 2
+            for y0 in range(0, h, band):
+                y1 = min(h, y0 + band)
+                block = windows[y0:y1].reshape(-1, n)
+                output[y0:y1] = np.partition(block, rank, axis=1)[:, rank].reshape(y1 - y0, w)
 
         return output
 
@@ -30,50 +262,73 @@ class ImageDenoiser:
         Nhưng vì theo lập trình thì tâm ở (ksize//2,    ksize//2).
         Do đó phải chuẩn hóa lại tọa độ để tính.
         """
-        kernel = np.zeros((ksize,ksize), dtype= np.float32)
-        center = ksize // 2
-        sum_val = 0.0
-        for x in range(ksize):
-            for y in range(ksize):
-                # Chuẩn hóa tọa độ.
-                rel_x = x- center
-                rel_y = y- center
+        return _gaussian_kernel_2d(int(ksize), float(sigma)).copy()
+
+    def manual_convolution(self, image: np.ndarray, kernel: np.ndarray,
+                           method: str = "auto", border: str = "constant") -> np.ndarray:
+        """Tự thực hiện tích chập 2D (dạng tương quan: kernel không lật, như trước đây).
+        Chọn engine theo kích thước và hạng (rank) của kernel:
+        - "separable": kernel hạng 1 (ví dụ Gaussian) = cột x hàng -> 2 lượt lọc 1-D,
+          chi phí kh + kw phép nhân/pixel thay vì kh * kw.
+        - "fft": kernel lớn -> nhân phổ (np.fft.rfft2), chi phí gần như không phụ thuộc kernel.
+        - "direct": cộng dồn kh * kw ảnh dịch (vector hóa trên cả ảnh).
+        border: cách pad biên theo np.pad ("constant" = 0, "edge", "reflect").
+        Kết quả được cắt về [0, 255] và trả về uint8."""
+        if len(image.shape) != 2:
+            raise TypeError("Image must be grayscale")
 
-                exponent = -(rel_x**2 + rel_y**2) / (2 * sigma**2)
+        kernel = np.asarray(kernel, dtype=np.float32)
+        if kernel.ndim == 1:
+            kernel = kernel[np.newaxis, :]
+        if kernel.ndim != 2:
+            raise ValueError("Kernel must be 1-D or 2-D")
 
-                val = (1 / (2 * np.pi * sigma**2)) * np.exp(exponent)
+        kh, kw = kernel.shape
+        factors = _separable_factors(kernel) if method in ("auto", "separable") else None
+        if method == "auto":
+            method = _choose_convolution_method(kh, kw, factors is not None)
+        if method not in ("separable", "fft", "direct"):
+            raise ValueError(f"Unknown convolution method: {method}")
 
-                kernel[x, y] = val
+        img_padded = np.pad(image, ((kh // 2, kh - 1 - kh // 2), (kw // 2, kw - 1 - kw // 2)),
+                            mode=border)
 
-                sum_val += val
+        if method == "separable":
+            if factors is None:
+                raise ValueError("Kernel is not separable")
+            output = _correlate_separable(img_padded, *factors)
+        elif method == "fft":
+            output = _correlate_fft(img_padded, kernel)
+        else:
+            output = _correlate_direct(img_padded, kernel)
 
-        return kernel / sum_val
+        np.clip(output, 0, 255, out=output)
+        return output.astype(np.uint8)
 
-    def manual_convolution(self, image: np.ndarray, kernel: np.ndarray) -> np.ndarray:
-        """Tự thực hiện tích chập 2D."""
+    def apply_gaussian(self, image: np.ndarray, ksize: int = 3, sigma: float = 1.0) -> np.ndarray:
+        """Lọc Gaussian bằng engine tích chập (Gaussian luôn tách được -> 2 lượt 1-D, hoặc FFT
+        nếu kernel rất lớn). Kernel được cache theo (ksize, sigma).
+        Biên pad kiểu "reflect" giống BORDER_REFLECT_101 của cv2.GaussianBlur."""
         if len(image.shape) != 2:
             raise TypeError("Image must be grayscale")
+        if ksize < 1 or ksize % 2 == 0:
+            raise ValueError("ksize must be a positive odd integer")
 
-        ksize = kernel.shape[0]
+        ksize, sigma = int(ksize), float(sigma)
         pad = ksize // 2
-        h, w = image.shape
+        img_padded = np.pad(image, ((pad, pad), (pad, pad)), mode="reflect")
 
-        img_padded = np.pad(image, ((pad, pad), (pad, pad)), mode='constant')
+        method = _choose_convolution_method(ksize, ksize, separable=True)
+        if method == "separable":
+            g = _gaussian_kernel_1d(ksize, sigma)
+            output = _correlate_separable(img_padded, g, g)
+        elif method == "fft":
+            output = _correlate_fft(img_padded, _gaussian_kernel_2d(ksize, sigma))
+        else:
+            output = _correlate_direct(img_padded, _gaussian_kernel_2d(ksize, sigma))
 
-        output = np.zeros_like(image, dtype=np.float32)
-        for i in range(h):
-            for j in range(w):
-                region = img_padded[i:i + ksize, j:j + ksize]
-
-                value = np.sum(region * kernel)
-
-                output[i, j] = value
-
-        return np.clip(output, 0, 255).astype(np.uint8)
-
-    def apply_gaussian(self, image: np.ndarray, ksize: int = 3, sigma: float = 1.0) -> np.ndarray:
-        """Wrapper gọi hàm convolution hoặc GaussianBlur."""
-        pass
+        np.clip(output, 0, 255, out=output)
+        return output.astype(np.uint8)
 
     def remove_bleed_through(self, image, mask=None):
         """
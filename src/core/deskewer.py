@@ -1,31 +1,148 @@
+import cv2
+import numpy as np
 
-from src.utils.math_ops import calculate_gradient_sobel
+# Cạnh dài tối đa của ảnh proxy dùng để dò góc
+_PROXY_MAX_SIDE = 1024
+# Số điểm mực tối đa dùng cho projection profile (lấy mẫu đều nếu nhiều hơn)
+_MAX_POINTS = 200_000
+# Số phần tử (góc x điểm) tối đa mỗi lượt bincount
+_CHUNK_ELEMENTS = 1 << 22
 
 
 class Deskewer:
-    def __init__(self):
-        pass
+    def __init__(self, proxy_max_side=_PROXY_MAX_SIDE, max_angle=15.0, coarse_step=1.0,
+                 fine_step=0.05, min_angle=0.05, min_confidence=0.1):
+        """
+        max_angle: dò góc trong khoảng [-max_angle, max_angle] (độ).
+        coarse_step / fine_step: bước quét thô / tinh (độ).
+        min_angle, min_confidence: góc nhỏ hơn min_angle hoặc độ tin cậy thấp hơn
+        min_confidence thì deskew() bỏ qua, không xoay ảnh.
+        """
+        self.proxy_max_side = proxy_max_side
+        self.max_angle = max_angle
+        self.coarse_step = coarse_step
+        self.fine_step = fine_step
+        self.min_angle = min_angle
+        self.min_confidence = min_confidence
+
+    def _ink_points(self, image):
+        """Tọa độ (y, x) các pixel mực trên ảnh proxy nhị phân (thu nhỏ + chuẩn hóa nền + Otsu)."""
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim > 2 else image
+        if gray.dtype != np.uint8:
+            gray = np.clip(gray, 0, 255).astype(np.uint8)
+
+        h, w = gray.shape
+        scale = min(1.0, self.proxy_max_side / float(max(h, w)))
+        if scale < 1.0:
+            gray = cv2.resize(gray, (max(1, int(round(w * scale))), max(1, int(round(h * scale)))),
+                              interpolation=cv2.INTER_AREA)
+
+        # Chuẩn hóa nền (chia cho Closing) trước Otsu: bóng đổ / nền không đều không bị coi là mực
+        # (biên vùng bóng là 1 đường thẳng dài, kéo projection profile về góc của nó)
+        k = max(3, (max(gray.shape) // 40) | 1)
+        background = cv2.morphologyEx(gray, cv2.MORPH_CLOSE,
+                                      cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (k, k)))
+        gray = cv2.divide(gray, np.maximum(background, 1), scale=255)
+        _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        # Mực là lớp thiểu số
+        if cv2.countNonZero(ink) > ink.size // 2:
+            ink = cv2.bitwise_not(ink)
+
+        ys, xs = np.nonzero(ink)
+        if len(ys) > _MAX_POINTS:
+            step = -(-len(ys) // _MAX_POINTS)
+            ys, xs = ys[::step], xs[::step]
+        return ys.astype(np.float32), xs.astype(np.float32), ink.shape
+
+    def projection_scores(self, ys, xs, shape, angles):
+        """
+        Độ "sắc" của projection profile (phương sai tổng theo hàng) cho mọi góc cùng lúc.
+        Thay vì xoay ảnh cho từng góc, xoay tọa độ các điểm mực:
+            r = -sin(a) * x + cos(a) * y   (hàng của điểm sau khi xoay ảnh 1 góc a)
+        rồi đếm số điểm trên mỗi hàng của mọi góc bằng 1 lần bincount.
+        """
+        angles = np.asarray(angles, dtype=np.float64)
+        h, w = shape
+        rad = np.deg2rad(angles).astype(np.float32)
+        # Hàng sau xoay nằm trong [-w, h + w] -> dịch offset để chỉ số không âm
+        offset = w
+        n_rows = h + 2 * w + 1
+        scores = np.empty(len(angles), dtype=np.float64)
+
+        per_chunk = max(1, _CHUNK_ELEMENTS // max(1, len(ys)))
+        for a0 in range(0, len(angles), per_chunk):
+            sin = np.sin(rad[a0:a0 + per_chunk])[:, np.newaxis]
+            cos = np.cos(rad[a0:a0 + per_chunk])[:, np.newaxis]
+            rows = np.rint(cos * ys - sin * xs).astype(np.int64) + offset
+            n = len(sin)
+            rows += (np.arange(n) * n_rows)[:, np.newaxis]
+            profile = np.bincount(rows.ravel(), minlength=n * n_rows).reshape(n, n_rows)
+            scores[a0:a0 + n] = profile.astype(np.float64).var(axis=1)
+        return scores
 
     def detect_skew_angle(self, image):
         """
         Tự động phát hiện góc nghiêng của văn bản.
-        Phương pháp: Hough Line Transform hoặc Projection Profile.
+        Phương pháp: Projection Profile trên ảnh proxy thu nhỏ, quét thô rồi tinh chỉnh quanh góc tốt nhất.
+
+        Trả về (angle, confidence):
+            angle: góc (độ) cần xoay (như GeometryCorrector.rotate_image) để dòng chữ nằm ngang.
+            confidence: 0..1, mức nổi trội của đỉnh so với trung vị các góc quét thô
+            (trang trắng / không có dòng chữ -> ~0).
         """
-        # 1. Canny Edge Detection để tìm biên chữ
-        # 2. Hough Line Transform (Probabilistic)
-        # Tìm các đoạn thẳng trong ảnh (thường là dòng kẻ hoặc chân dòng chữ)
-        # 3. Tính góc trung bình
-                # Chỉ lấy các góc gần 0 (ngang) hoặc 90 (dọc) để tránh nhiễu
-        # Trả về trung vị của các góc (median để loại bỏ nhiễu ngoại lai)
+        if image is None:
+            raise ValueError("Input image is None!")
+
+        ys, xs, shape = self._ink_points(image)
+        if len(ys) == 0:
+            return 0.0, 0.0
+
+        # 1. Quét thô
+        coarse = np.arange(-self.max_angle, self.max_angle + self.coarse_step / 2, self.coarse_step)
+        coarse_scores = self.projection_scores(ys, xs, shape, coarse)
+        best = coarse[np.argmax(coarse_scores)]
 
+        # 2. Quét tinh quanh góc tốt nhất (± 1 bước thô), không vượt ra ngoài [-max_angle, max_angle]
+        lo = max(best - self.coarse_step, -self.max_angle)
+        hi = min(best + self.coarse_step, self.max_angle)
+        fine = np.arange(lo, hi + self.fine_step / 2, self.fine_step)
+        fine = fine[fine <= self.max_angle + 1e-9]
+        fine_scores = self.projection_scores(ys, xs, shape, fine)
+        i = int(np.argmax(fine_scores))
+        angle = fine[i]
 
-    def deskew(self, image):
+        # 3. Nội suy parabol quanh đỉnh để lấy góc lẻ hơn bước tinh
+        if 0 < i < len(fine) - 1:
+            s0, s1, s2 = fine_scores[i - 1:i + 2]
+            denom = s0 - 2 * s1 + s2
+            if denom < 0:
+                angle += 0.5 * (s0 - s2) / denom * self.fine_step
+
+        peak = fine_scores[i]
+        confidence = float((peak - np.median(coarse_scores)) / peak) if peak > 0 else 0.0
+        return float(angle), max(0.0, min(1.0, confidence))
+
+    def deskew(self, image, angle=None):
         """
         Thực hiện xoay ảnh thẳng lại.
+        Góc quá nhỏ hoặc độ tin cậy thấp -> trả lại ảnh gốc, không xoay (không nội suy lại).
         """
         # 1. Tìm góc
+        if angle is None:
+            angle, confidence = self.detect_skew_angle(image)
+            if confidence < self.min_confidence:
+                return image
+        if abs(angle) < self.min_angle:
+            return image
+
         # 2. Tính tâm ảnh
+        (h, w) = image.shape[:2]
+        center = (w // 2, h // 2)
+
         # 3. Tạo ma trận xoay (Rotation Matrix)
+        M = cv2.getRotationMatrix2D(center, angle, 1.0)
 
         # 4. Xoay ảnh (Warp Affine)
         # borderMode=cv2.BORDER_REPLICATE để lấp đầy viền đen bằng pixel rìa
+        return cv2.warpAffine(image, M, (w, h), flags=cv2.INTER_CUBIC,
+                              borderMode=cv2.BORDER_REPLICATE)
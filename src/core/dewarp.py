@@ -1,12 +1,98 @@
+from collections import OrderedDict
+
 import numpy as np
 import cv2 as cv
+
+# Bước lưới điều khiển (pixel) khi tính tọa độ nguồn cho remap
+_GRID_STEP = 32
+# Số hàng xử lý mỗi lượt khi nội suy lưới lên độ phân giải đầy đủ
+_BAND_ROWS = 256
+# Cạnh dài tối đa của mask dùng để phát hiện dòng chữ
+_DETECT_MAX_SIDE = 1024
+# Số bộ mẫu RANSAC khi khớp đường cong dòng chữ
+_RANSAC_ITERS = 32
+
+
 class PageDewarper:
-    def get_text_lines(self, binary_image):
+    def __init__(self, max_cached_maps: int = 4):
+        # Cache map remap theo cache_key (mỗi cuốn sách / giá chụp 1 key):
+        # các trang liên tiếp trên cùng giá scan có độ cong gần như nhau.
+        self.max_cached_maps = max_cached_maps
+        self._map_cache = OrderedDict()  # key -> (shape, map1, map2)
+        self._mesh_cache = OrderedDict()  # key -> ((shape, grid_step), (mesh_x, mesh_y))
+
+    def get_text_lines(self, binary_image, min_width_ratio=0.15, max_side=_DETECT_MAX_SIDE):
         """
         Phát hiện các dòng văn bản cong.
         Dùng Morphology Dilate (kernel ngang dài) để nối chữ thành dòng.
+        Trả về list các mảng điểm (N, 2) [x, y] (tâm dòng theo từng cột, tọa độ ảnh gốc),
+        sắp xếp từ trên xuống.
+        """
+        x, centers, valid = self._line_centers(binary_image, min_width_ratio, max_side)
+        return [np.column_stack([x[m], c[m]]).astype(np.float32)
+                for c, m in zip(centers, valid)]
+
+    def _line_centers(self, binary_image, min_width_ratio=0.15, max_side=_DETECT_MAX_SIDE):
+        """
+        Phát hiện dòng trên mask mực thu nhỏ (cạnh dài <= max_side).
+        Trả về (x, centers, valid):
+            x (N,): tọa độ x (ảnh gốc) của các cột ảnh thu nhỏ - dùng chung cho mọi dòng,
+            centers (L, N): tâm y (ảnh gốc) của dòng l tại cột n,
+            valid (L, N): cột n có thuộc dòng l không.
         """
-        pass
+        if binary_image is None:
+            raise ValueError("Input image is None!")
+        if binary_image.ndim > 2:
+            binary_image = cv.cvtColor(binary_image, cv.COLOR_BGR2GRAY)
+
+        # Mực là lớp thiểu số -> đưa về mực trắng (255) trên nền đen
+        ink = (binary_image > 127).astype(np.uint8) * 255
+        if cv.countNonZero(ink) > ink.size // 2:
+            ink = cv.bitwise_not(ink)
+
+        H, W = ink.shape
+        scale = min(1.0, max_side / float(max(H, W)))
+        if scale < 1.0:
+            size = (max(1, int(round(W * scale))), max(1, int(round(H * scale))))
+            # INTER_AREA rồi > 0: ô thu nhỏ có mực nếu bất kỳ pixel gốc nào có mực
+            ink = (cv.resize(ink, size, interpolation=cv.INTER_AREA) > 0).astype(np.uint8) * 255
+        h, w = ink.shape
+        sx, sy = W / float(w), H / float(h)
+
+        # Nối các chữ trong 1 dòng: dilate ngang dài, rồi mở dọc để tách các dòng sát nhau
+        kx = max(3, w // 50) | 1
+        lines_mask = cv.dilate(ink, cv.getStructuringElement(cv.MORPH_RECT, (kx, 1)))
+        lines_mask = cv.morphologyEx(lines_mask, cv.MORPH_OPEN,
+                                     cv.getStructuringElement(cv.MORPH_RECT, (1, 3)))
+
+        num_labels, labels, stats, _ = cv.connectedComponentsWithStats(lines_mask, connectivity=8)
+        bw = stats[:, cv.CC_STAT_WIDTH]
+        bh = stats[:, cv.CC_STAT_HEIGHT]
+        keep = (bw >= min_width_ratio * w) & (bw >= 4 * bh)
+        keep[0] = False
+        n_lines = int(keep.sum())
+
+        # Tọa độ tâm pixel thu nhỏ trên ảnh gốc
+        x = (np.arange(w) + 0.5) * sx - 0.5
+        if n_lines == 0:
+            return x, np.zeros((0, w)), np.zeros((0, w), dtype=bool)
+
+        # Nhãn -> chỉ số dòng liên tục (0 = bỏ), rồi tính tâm y của từng (dòng, cột)
+        # bằng bincount trên toàn bộ pixel cùng lúc
+        lut = np.zeros(num_labels, dtype=np.int64)
+        lut[keep] = np.arange(1, n_lines + 1)
+        ys, xs = np.nonzero(lut[labels])
+        idx = (lut[labels[ys, xs]] - 1) * w + xs
+        counts = np.bincount(idx, minlength=n_lines * w).reshape(n_lines, w)
+        sum_y = np.bincount(idx, weights=ys, minlength=n_lines * w).reshape(n_lines, w)
+
+        valid = counts > 0
+        centers = (sum_y / np.maximum(counts, 1) + 0.5) * sy - 0.5
+
+        # Sắp xếp từ trên xuống theo tâm trung bình
+        mean_y = (centers * valid).sum(axis=1) / valid.sum(axis=1)
+        order = np.argsort(mean_y)
+        return x, centers[order], valid[order]
 
     def fit_polynomial(self, points, degree=3):
         """
@@ -14,51 +100,325 @@ class PageDewarper:
         Input: Các điểm trên dòng chữ.
         Output: Hệ số đa thức.
         """
-        pass
+        points = np.asarray(points, dtype=np.float64)
+        degree = min(degree, len(points) - 1)
+        if degree < 0:
+            raise ValueError("At least one point is required to fit a curve")
+        coefs, _ = self.fit_polynomials(points[:, 0], points[:, 1][np.newaxis], degree=degree)
+        return coefs[0]
+
+    def fit_polynomials(self, x, y, valid=None, degree=3, ransac_iters=_RANSAC_ITERS,
+                        inlier_tol=None, seed=0):
+        """
+        Khớp đa thức cho nhiều dòng cùng lúc (1 lần giải bình phương tối thiểu theo lô).
+
+        x: (N,) hoành độ dùng chung cho mọi dòng (cơ sở Vandermonde dùng chung) hoặc (L, N).
+        y: (L, N) tung độ; valid: (L, N) điểm nào thuộc dòng (None = tất cả).
+        RANSAC vector hóa: ransac_iters bộ mẫu tối thiểu (degree + 1 điểm) cho mọi dòng cùng lúc,
+        giữ bộ có nhiều inlier nhất rồi khớp lại trên các inlier.
+        inlier_tol: ngưỡng sai số (pixel); None = 3 * MAD của lần khớp đầu, theo từng dòng.
+
+        Trả về (coefs (L, degree + 1) theo thứ tự np.polyval, inliers (L, N)).
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        valid = np.ones(y.shape, dtype=bool) if valid is None else np.asarray(valid, dtype=bool)
+        n_coef = degree + 1
+
+        # Chuẩn hóa x về [-1, 1] cho ma trận chuẩn tắc ổn định số
+        x_scale = max(float(np.abs(x).max()), 1.0)
+        V = (x / x_scale)[..., np.newaxis] ** np.arange(n_coef)  # (N, d+1) hoặc (L, N, d+1)
+        shared = V.ndim == 2
+
+        def predict(c):
+            # c: (..., L, d+1) -> (..., L, N)
+            return c @ V.T if shared else np.einsum("lni,...li->...ln", V, c)
+
+        def weighted_lstsq(w):
+            # Ma trận chuẩn tắc của mọi dòng: A_l = V^T diag(w_l) V, b_l = V^T (w_l y_l)
+            if shared:
+                A = np.tensordot(w, V[:, :, np.newaxis] * V[:, np.newaxis, :], axes=(1, 0))
+                b = (w * y) @ V
+            else:
+                A = np.einsum("ln,lni,lnj->lij", w, V, V)
+                b = np.einsum("ln,lni->li", w * y, V)
+            A += np.eye(n_coef) * 1e-12 * np.trace(A, axis1=1, axis2=2)[:, None, None]
+            return np.linalg.solve(A, b[..., np.newaxis])[..., 0]
+
+        w = valid.astype(np.float64)
+        coefs = weighted_lstsq(w)
+        inliers = valid.copy()
+        counts = valid.sum(axis=1)
+
+        if ransac_iters > 0 and np.any(counts > n_coef):
+            res = np.abs(predict(coefs) - y)
+            if inlier_tol is None:
+                # Trung vị theo dòng chỉ trên các điểm hợp lệ (điểm không hợp lệ bị đẩy về cuối)
+                res_sorted = np.sort(np.where(valid, res, np.inf), axis=1)
+                mad = res_sorted[np.arange(len(res)), np.maximum(counts - 1, 0) // 2]
+                tol = np.maximum(3.0 * 1.4826 * np.where(counts > 0, mad, 0.0), 1.0)[:, np.newaxis]
+            else:
+                tol = inlier_tol
+
+            # Chọn ngẫu nhiên (degree + 1) điểm hợp lệ cho mỗi (lượt, dòng)
+            rng = np.random.default_rng(seed)
+            L, N = y.shape
+            keys = rng.random((ransac_iters, L, N))
+            keys[:, ~valid] = 2.0
+            sample = np.argpartition(keys, n_coef - 1, axis=2)[:, :, :n_coef]  # (K, L, d+1)
+            lines = np.arange(L)[np.newaxis, :, np.newaxis]
+            Vs = V[sample] if shared else V[lines, sample]
+            ys = y[lines, sample]
+            try:
+                cand = np.linalg.solve(Vs, ys[..., np.newaxis])[..., 0]
+            except np.linalg.LinAlgError:
+                cand = (np.linalg.pinv(Vs) @ ys[..., np.newaxis])[..., 0]
+
+            # Đếm inlier của mọi ứng viên cùng lúc, giữ ứng viên tốt nhất của từng dòng
+            hits = (np.abs(predict(cand) - y) < tol) & valid
+            best = hits.sum(axis=2).argmax(axis=0)
+            ransac_inliers = hits[best, np.arange(L)]
+
+            # Dòng quá ít điểm hoặc RANSAC không tìm được đủ inlier -> giữ lần khớp đầu
+            ok = (counts > n_coef) & (ransac_inliers.sum(axis=1) >= n_coef)
+            inliers[ok] = ransac_inliers[ok]
+            coefs = weighted_lstsq(inliers.astype(np.float64))
+            refined = (np.abs(predict(coefs) - y) < tol) & valid
+            ok &= refined.sum(axis=1) >= n_coef
+            inliers[ok] = refined[ok]
+            coefs = weighted_lstsq(inliers.astype(np.float64))
+
+        # Đổi về hệ số theo x gốc, thứ tự giảm dần bậc (np.polyval)
+        coefs = coefs / x_scale ** np.arange(n_coef)
+        return coefs[:, ::-1], inliers
 
-    def generate_mesh(self, image_shape, top_curve, bottom_curve):
+    def generate_mesh(self, image_shape, top_curve, bottom_curve,
+                      grid_step=_GRID_STEP, x_limits=None, top_ref=None, bottom_ref=None):
         """
         Tạo lưới tọa độ nguồn (Source Mesh) dựa trên đa thức đường cong trên và dưới.
         Dùng cho cv2.remap để làm phẳng trang cong.
+
+        Lưới là độ dịch so với 2 đường thẳng tham chiếu (top_ref, bottom_ref - mặc định là
+        tung độ trung bình của từng đường cong): đường cong trên được kéo về hàng top_ref,
+        đường dưới về bottom_ref, ở giữa nội suy tuyến tính độ dịch, phía ngoài giữ nguyên
+        độ dịch của đường gần nhất:
+            source_y = y + (1 - t) * (top(x) - top_ref) + t * (bottom(x) - bottom_ref)
+            t = clip((y - top_ref) / (bottom_ref - top_ref), 0, 1)
+        Trang phẳng (đường cong nằm ngang) -> lưới đồng nhất, lề và dòng chữ giữ nguyên vị trí.
+
+        Chỉ tính trên lưới điều khiển thô (mỗi grid_step pixel, nút cuối phủ tới W-1 / H-1),
+        mesh_to_maps() sẽ nội suy lên độ phân giải đầy đủ.
+        x_limits: (x_min, x_max) - ngoài khoảng này giữ nguyên độ cong ở mép
+        (tránh ngoại suy đa thức bậc cao).
         """
         height, width = image_shape[:2]
 
-        # Tạo trục tọa độ
-        x_range = np.arange(width, dtype=np.float32)
-        y_range = np.arange(height, dtype=np.float32)
+        # Đường thẳng tham chiếu: tung độ trung bình của đường cong trong khoảng có chữ
+        x_ref = np.linspace(*(x_limits if x_limits is not None else (0, width - 1)), 64)
+        if top_ref is None:
+            top_ref = float(np.polyval(top_curve, x_ref).mean())
+        if bottom_ref is None:
+            bottom_ref = float(np.polyval(bottom_curve, x_ref).mean())
+
+        return self.generate_line_mesh(image_shape, [top_curve, bottom_curve],
+                                       grid_step=grid_step, x_limits=x_limits,
+                                       refs=[top_ref, bottom_ref])
+
+    def generate_line_mesh(self, image_shape, curves, grid_step=_GRID_STEP, x_limits=None,
+                           refs=None):
+        """
+        Tổng quát của generate_mesh() cho nhiều đường cong dòng chữ (sắp từ trên xuống).
 
-        # Tính y của đường cong trên & dưới
-        top_y = np.polyval(top_curve, x_range)
-        bottom_y = np.polyval(bottom_curve, x_range)
+        Mỗi đường cong l được kéo về hàng ngang refs[l] (mặc định: tung độ trung bình của nó
+        trong khoảng x_limits); giữa 2 đường liên tiếp nội suy tuyến tính độ dịch theo y, phía
+        trên đường đầu / dưới đường cuối giữ nguyên độ dịch của đường gần nhất. Nhờ vậy độ cong
+        thay đổi không tuyến tính theo chiều dọc trang (ví dụ võng mạnh ở giữa, phẳng ở 2 mép)
+        vẫn được nắn theo từng dòng. Với 2 đường cong chính là generate_mesh().
 
-        # Giới hạn biên an toàn
-        top_y = np.clip(top_y, 0, height - 1)
-        bottom_y = np.clip(bottom_y, 0, height - 1)
+        x_limits: None, 1 cặp (x_min, x_max) chung, hoặc list cặp cho từng đường cong -
+        ngoài khoảng đó giữ nguyên độ cong ở mép (tránh ngoại suy đa thức bậc cao).
+        """
+        height, width = image_shape[:2]
+        n = len(curves)
+        if n == 0:
+            return self.identity_mesh(image_shape, grid_step)
 
-        # Đảm bảo bottom luôn dưới top
-        bottom_y = np.maximum(bottom_y, top_y + 1)
+        # Tọa độ các nút lưới
+        gw = -(-(width - 1) // grid_step) + 1
+        gh = -(-(height - 1) // grid_step) + 1
+        x_range = np.arange(gw, dtype=np.float64) * grid_step
+        y_range = np.arange(gh, dtype=np.float64) * grid_step
 
-        # Lưới tọa độ
-        target_x, target_y = np.meshgrid(x_range, y_range)
+        if x_limits is None or np.ndim(x_limits) == 1:
+            x_limits = [x_limits] * n
 
-        # Chuẩn hóa chiều cao
-        relative_height = target_y / max(height - 1, 1)
+        # Độ dịch (n, gw) của từng đường cong so với đường tham chiếu của nó
+        ref_y = np.empty(n)
+        disp = np.empty((n, gw))
+        for i, (curve, limits) in enumerate(zip(curves, x_limits)):
+            x_eval = x_range if limits is None else np.clip(x_range, *limits)
+            if refs is not None:
+                ref_y[i] = refs[i]
+            else:
+                x_ref = np.linspace(*(limits if limits is not None else (0, width - 1)), 64)
+                ref_y[i] = np.polyval(curve, x_ref).mean()
+            disp[i] = np.polyval(curve, x_eval)
 
-        # Nội suy tuyến tính theo chiều dọc
-        top_y_row = top_y.reshape(1, -1)
-        bottom_y_row = bottom_y.reshape(1, -1)
+        # Đảm bảo mỗi đường tham chiếu nằm dưới đường trước ít nhất 1 pixel
+        for i in range(1, n):
+            ref_y[i] = max(ref_y[i], ref_y[i - 1] + 1.0)
+        disp -= ref_y[:, np.newaxis]
 
-        # Công thức: source_y = top + tỷ lệ * khoảng cách
-        source_y = top_y_row + relative_height*(bottom_y_row - top_y_row)
+        # Nội suy độ dịch theo y giữa 2 đường tham chiếu kẹp mỗi hàng lưới
+        if n == 1:
+            source_y = y_range.reshape(-1, 1) + disp[0].reshape(1, -1)
+        else:
+            k = np.clip(np.searchsorted(ref_y, y_range, side="right") - 1, 0, n - 2)
+            t = np.clip((y_range - ref_y[k]) / (ref_y[k + 1] - ref_y[k]), 0.0, 1.0).reshape(-1, 1)
+            source_y = y_range.reshape(-1, 1) + (1 - t) * disp[k] + t * disp[k + 1]
 
         # Xử lý source_x
-        source_x = target_x
+        source_x = np.broadcast_to(x_range.reshape(1, -1), source_y.shape)
 
         return source_x.astype(np.float32), source_y.astype(np.float32)
 
-    def dewarp(self, image):
+    def mesh_to_maps(self, mesh_x, mesh_y, image_shape, grid_step=_GRID_STEP,
+                     band_rows=_BAND_ROWS):
+        """
+        Nội suy song tuyến lưới thô lên kích thước ảnh và đổi sang dạng fixed-point của OpenCV
+        (map1: int16 (H, W, 2), map2: uint16 (H, W)) - 6 byte/pixel thay vì 8 byte của 2 map float32.
+        Xử lý theo dải hàng nên không tạo map float32 cả trang.
+        """
+        height, width = image_shape[:2]
+        gh, gw = mesh_x.shape
+        if gw < 2:
+            mesh_x, mesh_y = np.repeat(mesh_x, 2, axis=1), np.repeat(mesh_y, 2, axis=1)
+            gw = 2
+        if gh < 2:
+            mesh_x, mesh_y = np.repeat(mesh_x, 2, axis=0), np.repeat(mesh_y, 2, axis=0)
+            gh = 2
+
+        # Nội suy theo x 1 lần cho mọi hàng lưới -> (gh, W)
+        x = np.arange(width)
+        ix = np.minimum(x // grid_step, gw - 2)
+        fx = ((x - ix * grid_step) / grid_step).astype(np.float32)
+        cols_x = mesh_x[:, ix] * (1 - fx) + mesh_x[:, ix + 1] * fx
+        cols_y = mesh_y[:, ix] * (1 - fx) + mesh_y[:, ix + 1] * fx
+
+        map1 = np.empty((height, width, 2), dtype=np.int16)
+        map2 = np.empty((height, width), dtype=np.uint16)
+        for y0 in range(0, height, band_rows):
+            y = np.arange(y0, min(y0 + band_rows, height))
+            iy = np.minimum(y // grid_step, gh - 2)
+            fy = ((y - iy * grid_step) / grid_step).astype(np.float32).reshape(-1, 1)
+            band_x = cols_x[iy] * (1 - fy) + cols_x[iy + 1] * fy
+            band_y = cols_y[iy] * (1 - fy) + cols_y[iy + 1] * fy
+            m1, m2 = cv.convertMaps(band_x, band_y, cv.CV_16SC2)
+            map1[y0:y0 + len(y)] = m1
+            map2[y0:y0 + len(y)] = m2
+        return map1, map2
+
+    def identity_mesh(self, image_shape, grid_step=_GRID_STEP):
+        """Lưới điều khiển không biến dạng (source = target), cùng bố cục nút với generate_mesh()."""
+        height, width = image_shape[:2]
+        gw = -(-(width - 1) // grid_step) + 1
+        gh = -(-(height - 1) // grid_step) + 1
+        x_range = np.arange(gw, dtype=np.float32) * grid_step
+        y_range = np.arange(gh, dtype=np.float32) * grid_step
+        mesh_x, mesh_y = np.meshgrid(x_range, y_range)
+        return mesh_x, mesh_y
+
+    def estimate_mesh(self, image, grid_step=_GRID_STEP, degree=3, output_shape=None,
+                      cache_key=None):
+        """
+        Ước lượng lưới điều khiển (mesh_x, mesh_y) từ các dòng chữ của trang.
+        image có thể là ảnh thu nhỏ (proxy) của khung output_shape: tọa độ dòng chữ được đổi về
+        khung output_shape trước khi dựng lưới. cache_key: dùng lại lưới đã ước lượng cho
+        cùng cuốn sách / giá chụp (cùng output_shape).
+        Trả về None nếu không đủ dòng để ước lượng độ cong.
+        """
+        output_shape = tuple(output_shape[:2]) if output_shape is not None else image.shape[:2]
+        if cache_key is not None:
+            cached = self._mesh_cache.get(cache_key)
+            if cached is not None and cached[0] == (output_shape, grid_step):
+                self._mesh_cache.move_to_end(cache_key)
+                return cached[1]
+
+        gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY) if image.ndim > 2 else image
+        _, binary = cv.threshold(gray, 0, 255, cv.THRESH_BINARY + cv.THRESH_OTSU)
+        x, centers, valid = self._line_centers(binary)
+        if len(centers) < 2:
+            return None
+
+        # Tọa độ trên proxy -> tọa độ khung đầu ra (theo tâm pixel)
+        sx = output_shape[1] / float(image.shape[1])
+        sy = output_shape[0] / float(image.shape[0])
+        x = (x + 0.5) * sx - 0.5
+        centers = (centers + 0.5) * sy - 0.5
+
+        # Khớp mọi dòng trong 1 lần giải theo lô
+        coefs, _ = self.fit_polynomials(x, centers, valid, degree=degree)
+
+        # Dựng lưới qua mọi dòng đủ dài (>= 1/2 dòng dài nhất), mỗi dòng chỉ tin cậy
+        # trong khoảng x nó thực sự phủ
+        cols = np.arange(valid.shape[1])
+        first = np.where(valid, cols, cols[-1]).min(axis=1)
+        last = np.where(valid, cols, 0).max(axis=1)
+        spans = x[last] - x[first]
+        long_lines = np.nonzero(spans >= 0.5 * spans.max())[0]
+        if len(long_lines) < 2:
+            return None
+
+        x_limits = [(x[first[i]], x[last[i]]) for i in long_lines]
+        mesh = self.generate_line_mesh(output_shape, coefs[long_lines],
+                                       grid_step=grid_step, x_limits=x_limits)
+        if cache_key is not None:
+            self._mesh_cache[cache_key] = ((output_shape, grid_step), mesh)
+            while len(self._mesh_cache) > self.max_cached_maps:
+                self._mesh_cache.popitem(last=False)
+        return mesh
+
+    def estimate_maps(self, image, grid_step=_GRID_STEP, degree=3):
+        """
+        Ước lượng map remap (fixed-point) từ các dòng chữ của trang.
+        Trả về (map1, map2) hoặc None nếu không đủ dòng để ước lượng độ cong.
+        """
+        mesh = self.estimate_mesh(image, grid_step=grid_step, degree=degree)
+        if mesh is None:
+            return None
+        return self.mesh_to_maps(mesh[0], mesh[1], image.shape, grid_step=grid_step)
+
+    def dewarp(self, image, cache_key=None, grid_step=_GRID_STEP, degree=3):
         """
         Hàm chính thực hiện làm phẳng.
         Gọi các hàm con trên -> Tạo map_x, map_y -> Remap.
+        cache_key: định danh cuốn sách / giá chụp. Nếu đã có map cho key này (cùng kích thước ảnh)
+        thì dùng lại, bỏ qua bước phát hiện dòng và dựng lưới.
         """
-        pass
+        if image is None:
+            raise ValueError("Input image is None!")
+
+        maps = None
+        if cache_key is not None:
+            cached = self._map_cache.get(cache_key)
+            if cached is not None and cached[0] == image.shape[:2]:
+                self._map_cache.move_to_end(cache_key)
+                maps = cached[1:]
+
+        if maps is None:
+            maps = self.estimate_maps(image, grid_step=grid_step, degree=degree)
+            if maps is None:
+                # Không đủ dòng chữ -> giữ nguyên trang
+                return image
+            if cache_key is not None:
+                self._map_cache[cache_key] = (image.shape[:2],) + tuple(maps)
+                while len(self._map_cache) > self.max_cached_maps:
+                    self._map_cache.popitem(last=False)
+
+        map1, map2 = maps
+        return cv.remap(image, map1, map2, cv.INTER_LINEAR,
+                        borderMode=cv.BORDER_CONSTANT, borderValue=(255, 255, 255))
+
+    def clear_cache(self):
+        self._map_cache.clear()
+        self._mesh_cache.clear()
@@ -1,7 +1,53 @@
 import numpy as np
 import cv2
+
+from src.utils.tiling import gaussian_radius, process_tiled
+
+
 class ImageEnhancer:
-    def remove_shadow(self, image: np.ndarray) -> np.ndarray:
+    def estimate_background(self, image: np.ndarray, kernel_size: int = 51) -> np.ndarray:
+        """
+        Ước lượng nền L (ánh sáng) bằng Morphological Closing (kernel lớn), ảnh xám 8-bit.
+        Có thể chạy trên ảnh proxy thu nhỏ (kernel thu nhỏ theo cùng tỉ lệ) rồi phóng to lại,
+        vì nền chiếu sáng biến thiên rất chậm.
+        """
+        if len(image.shape) == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        # Kernel size lớn để ước lượng background (L) mượt mà, bỏ qua chi tiết chữ viết.
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
+
+        # Áp dụng Closing: dilation theo sau erosion. Nó giúp lấp đầy các vùng tối nhỏ (chữ)
+        # và ước lượng nền sáng (L)
+        return cv2.morphologyEx(image, cv2.MORPH_CLOSE, kernel)
+
+    def estimate_background_downsampled(self, image: np.ndarray, kernel_size: int = 51,
+                                        downsample: float = 4) -> np.ndarray:
+        """
+        Xấp xỉ estimate_background() (Closing kernel_size) bằng Closing trên ảnh thu nhỏ
+        `downsample` lần, trả về nền cùng kích thước ảnh.
+        Thu nhỏ bằng max từng khối (dilate hình chữ nhật cỡ khối rồi lấy mẫu), không lấy trung bình:
+        Closing bắt đầu bằng dilate nên pixel sáng lẻ (nhiễu muối, vệt giấy) vẫn được giữ như ở
+        cách đầy đủ. Kernel chia theo tỉ lệ thu nhỏ thực tế (sau khi làm tròn kích thước).
+        """
+        if len(image.shape) == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        h, w = image.shape[:2]
+        sw, sh = max(1, int(round(w / downsample))), max(1, int(round(h / downsample)))
+        fx, fy = w / float(sw), h / float(sh)
+
+        block = int(np.ceil(max(fx, fy)))
+        if block > 1:
+            image = cv2.dilate(image, cv2.getStructuringElement(cv2.MORPH_RECT, (block, block)))
+        small = cv2.resize(image, (sw, sh), interpolation=cv2.INTER_NEAREST)
+        k = max(3, int(round(kernel_size / ((fx + fy) / 2))) | 1)
+        return cv2.resize(self.estimate_background(small, k), (w, h),
+                          interpolation=cv2.INTER_LINEAR)
+
+    def remove_shadow(self, image: np.ndarray, kernel_size: int = 51,
+                      tile_size: int = None, workers: int = 1,
+                      background: np.ndarray = None, method: str = "exact",
+                      downsample: float = 4) -> np.ndarray:
         """
         Khử bóng đổ bằng phương pháp chia nền (Background Division).
 
@@ -11,10 +57,31 @@ class ImageEnhancer:
 
         Args:
             image (np.ndarray): Ảnh đầu vào (thường là ảnh xám 8-bit).
+            kernel_size (int): Kích thước kernel Closing ước lượng nền.
+            tile_size (int): Nếu có, xử lý theo tile (halo = 2 lần bán kính kernel
+                vì Closing = Dilate rồi Erode) để giới hạn bộ nhớ float32 tạm.
+            workers (int): Số thread xử lý tile song song.
+            background (np.ndarray): Nền L đã ước lượng sẵn (cùng kích thước ảnh, ví dụ ước lượng
+                trên ảnh proxy rồi phóng to) -> bỏ qua bước 1.
+            method (str):
+                - "exact": Closing trên ảnh đầy đủ, chia bằng float32 (cách gốc).
+                - "downsampled": nền biến thiên chậm nên Closing chạy trên ảnh thu nhỏ `downsample`
+                  lần (estimate_background_downsampled: giữ max từng khối như phép dilate của Closing,
+                  kernel chia theo đúng tỉ lệ thu nhỏ), phóng to lại bằng nội suy song tuyến,
+                  rồi chia trực tiếp trên uint8 bằng cv2.divide (không tạo bản sao float32 cả trang).
+            downsample (float): Hệ số thu nhỏ cho method="downsampled".
 
         Returns:
             np.ndarray: Ảnh đã khử bóng (dạng 8-bit).
         """
+        if method not in ("exact", "downsampled"):
+            raise ValueError(f"Unknown shadow removal method: {method}")
+
+        if tile_size and background is None and method == "exact":
+            return process_tiled(image, lambda tile: self.remove_shadow(tile, kernel_size),
+                                 halo=2 * (kernel_size // 2), tile_size=tile_size,
+                                 workers=workers)
+
         if len(image.shape) == 3:
             # Chuyển về ảnh xám nếu là ảnh màu để xử lý nền
             gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
@@ -22,13 +89,22 @@ class ImageEnhancer:
             gray_image = image
 
         # 1. Ước lượng nền L bằng Morphological Closing
-        # Kernel size lớn để ước lượng background (L) mượt mà, bỏ qua chi tiết chữ viết.
-        kernel_size = 51  # Kích thước có thể tùy chỉnh
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
-
-        # Áp dụng Closing: dilation theo sau erosion. Nó giúp lấp đầy các vùng tối nhỏ (chữ)
-        # và ước lượng nền sáng (L)
-        background_L = cv2.morphologyEx(gray_image, cv2.MORPH_CLOSE, kernel)
+        if background is None and method == "downsampled" and downsample > 1:
+            background_L = self.estimate_background_downsampled(gray_image, kernel_size, downsample)
+        elif background is None:
+            background_L = self.estimate_background(gray_image, kernel_size)
+        else:
+            if background.shape[:2] != gray_image.shape[:2]:
+                raise ValueError("Background must have same HxW as image!")
+            background_L = background
+
+        if method == "downsampled":
+            # 2. R = I * 255 / L tính thẳng trên uint8 (làm tròn + bão hòa trong 1 lượt).
+            # Nền 0 -> 1 để khớp với cách gốc (I / 1e-6 bị cắt về 255, I = 0 giữ 0).
+            if background_L is background:
+                background_L = background_L.copy()
+            np.maximum(background_L, 1, out=background_L)
+            return cv2.divide(gray_image, background_L, scale=255)
 
         # 2. Chia ảnh gốc cho nền: R = I / L. Cần chuyển sang float.
         # Thêm một epsilon nhỏ (1e-6) vào background để tránh chia cho 0.
@@ -52,7 +128,8 @@ class ImageEnhancer:
 
         return result_image
 
-    def apply_clahe(self, image: np.ndarray, clip_limit: float = 2.0, tile_grid_size: tuple = (8, 8)) -> np.ndarray:
+    def apply_clahe(self, image: np.ndarray, clip_limit: float = 2.0, tile_grid_size: tuple = (8, 8),
+                    tile_size: int = None, workers: int = 1) -> np.ndarray:
         """
         Cân bằng histogram thích nghi cục bộ (CLAHE)
 
@@ -60,10 +137,17 @@ class ImageEnhancer:
             image (np.ndarray): Ảnh đầu vào (xám hoặc màu BGR).
             clip_limit (float): Ngưỡng cắt histogram để tránh khuếch đại nhiễu.
             tile_grid_size (tuple): Kích thước lưới (m, n) chia ảnh.
+            tile_size (int): Nếu có, xử lý theo tile căn đúng lưới ô CLAHE của cả ảnh
+                (halo = 1 ô): LUT của từng ô giống hệt, nhưng kết quả chỉ xấp xỉ khi chạy trên cả
+                ảnh - OpenCV nội suy LUT bằng float32 theo tọa độ trong tile, làm tròn khác đi ở
+                vài pixel rải rác (lệch <= 1 mức xám trên kênh L, <= 2 mức sau khi đổi LAB -> BGR).
+            workers (int): Số thread xử lý tile song song.
 
         Returns:
             np.ndarray: Ảnh đã được cân bằng histogram.
         """
+        if tile_size:
+            return self._clahe_tiled(image, clip_limit, tile_grid_size, tile_size, workers)
 
         # CLAHE hoạt động hiệu quả nhất trên không gian màu L (Luminosity)
         if len(image.shape) == 3:
@@ -90,8 +174,33 @@ class ImageEnhancer:
 
         return result_image
 
+    def _clahe_tiled(self, image, clip_limit, tile_grid_size, tile_size, workers):
+        """
+        CLAHE theo tile. OpenCV chia ảnh thành lưới ô (pad REFLECT_101 ở biên phải/dưới nếu
+        không chia hết) và nội suy LUT giữa các ô kề nhau. Do đó tile phải căn theo ô của
+        cả ảnh, halo 1 ô là đủ, và tile ở biên được pad giống hệt cách OpenCV pad cả ảnh.
+        Xấp xỉ (không bit-exact): trọng số nội suy float32 tính theo tọa độ trong tile nên
+        làm tròn có thể lệch 1 mức ở vài pixel (xem apply_clahe).
+        """
+        h, w = image.shape[:2]
+        grid_x, grid_y = tile_grid_size
+        cell_w = -(-w // grid_x)
+        cell_h = -(-h // grid_y)
+
+        def clahe_tile(tile):
+            th, tw = tile.shape[:2]
+            ny, nx = -(-th // cell_h), -(-tw // cell_w)
+            pad_y, pad_x = ny * cell_h - th, nx * cell_w - tw
+            if pad_y or pad_x:
+                tile = cv2.copyMakeBorder(tile, 0, pad_y, 0, pad_x, cv2.BORDER_REFLECT_101)
+            out = self.apply_clahe(tile, clip_limit, (nx, ny))
+            return out[:th, :tw]
+
+        return process_tiled(image, clahe_tile, halo=(cell_h, cell_w), tile_size=tile_size,
+                             workers=workers, align=(cell_h, cell_w))
+
     def unsharp_mask(self, image: np.ndarray, kernel_size: tuple = (5, 5), sigma: float = 1.0, amount: float = 1.5,
-                     threshold: int = 0) -> np.ndarray:
+                     threshold: int = 0, tile_size: int = None, workers: int = 1) -> np.ndarray:
         """
         Làm nét ảnh (Sharpening) bằng Unsharp Masking
         Công thức: Output = Input + (Input - Blurred) * amount
@@ -102,10 +211,18 @@ class ImageEnhancer:
             sigma (float): Độ lệch chuẩn cho Gaussian Blur.
             amount (float): Độ lớn (cường độ) của hiệu ứng làm nét.
             threshold (int): Ngưỡng, chỉ áp dụng làm nét cho các biên có giá trị trên ngưỡng.
+            tile_size (int): Nếu có, xử lý theo tile với halo = bán kính kernel Gaussian.
+            workers (int): Số thread xử lý tile song song.
 
         Returns:
             np.ndarray: Ảnh đã được làm nét.
         """
+        if tile_size:
+            return process_tiled(image,
+                                 lambda tile: self.unsharp_mask(tile, kernel_size, sigma,
+                                                                amount, threshold),
+                                 halo=gaussian_radius(kernel_size, sigma),
+                                 tile_size=tile_size, workers=workers)
 
         # Chuyển ảnh sang float để tính toán
         float_image = image.astype(np.float32)
@@ -130,7 +247,3 @@ class ImageEnhancer:
         result_image = sharpened.astype(np.uint8)
 
         return result_image
-
-
-
-        
\ No newline at end of file
@@ -1,11 +1,64 @@
 import numpy as np
+
+# Số hàng xử lý mỗi lượt khi chạy theo khối (chunk)
+_CHUNK_ROWS = 256
+
+
 class ForensicInk:
-    def decorrelation_stretch(self, image):
+    def compute_transform(self, image, sample_size=None, chunk_rows=_CHUNK_ROWS, seed=0):
+        """
+        Ước lượng phép biến đổi Decorrelation Stretch (PCA whitening) từ ảnh màu.
+        - sample_size=None: cộng dồn tổng và tích ngoài (3x3) theo từng khối hàng,
+          chính xác như tính trên cả ảnh nhưng không tạo mảng (N, 3) float64.
+        - sample_size=n: chỉ dùng n pixel lấy mẫu ngẫu nhiên (có seed, lặp lại được).
+        Trả về dict {"mean": (3,), "matrix": (3, 3)} có thể dùng lại cho mọi trang
+        của cùng một bản thảo (thống kê mực/giấy gần như không đổi giữa các trang).
+        """
+        if image is None or len(image.shape) != 3:
+            raise ValueError("Decorrelation Stretch requires a 3-channel image")
+        h, w, c = image.shape
+
+        if sample_size is not None and sample_size < h * w:
+            rng = np.random.default_rng(seed)
+            idx = rng.choice(h * w, size=int(sample_size), replace=False)
+            X = image.reshape(-1, c)[idx].astype(np.float64)
+            N = X.shape[0]
+            mu = X.sum(axis=0) / N
+            X -= mu
+            cov_matrix = np.dot(X.T, X) / (N - 1)
+        else:
+            # Cộng dồn theo khối: sum(x) và sum(x x^T)
+            s1 = np.zeros(c, dtype=np.float64)
+            s2 = np.zeros((c, c), dtype=np.float64)
+            for y0 in range(0, h, chunk_rows):
+                X = image[y0:y0 + chunk_rows].reshape(-1, c).astype(np.float64)
+                s1 += X.sum(axis=0)
+                s2 += np.dot(X.T, X)
+            N = h * w
+            mu = s1 / N
+            cov_matrix = (s2 - N * np.outer(mu, mu)) / (N - 1)
+
+        # Eigenvalues & Eigenvectors -> ma trận làm trắng (whitening)
+        eigenvalues, eigenvectors = np.linalg.eigh(cov_matrix)
+        sigma = np.sqrt(np.maximum(eigenvalues, 0))
+        sigma = np.where(sigma < 1e-6, 1e-6, sigma)  # Tránh chia 0
+        scaling_matrix = np.diag(1.0 / sigma)
+        transform_matrix = np.dot(np.dot(eigenvectors, scaling_matrix), eigenvectors.T)
+        return {"mean": mu, "matrix": transform_matrix}
+
+    def decorrelation_stretch(self, image, transform=None, sample_size=None,
+                              chunk_rows=_CHUNK_ROWS, seed=0, return_transform=False):
 
         """
         Tách lớp mực phai bằng PCA (Principal Component Analysis).
         Input: Ảnh màu RGB.
         Output: Ảnh xám làm nổi bật mực.
+
+        Chạy theo khối hàng (float32) để không tạo nhiều bản sao (N, 3) float64:
+        - Lượt 1: tính min/max của ảnh sau biến đổi (streaming).
+        - Lượt 2: biến đổi lại từng khối và ghi thẳng vào ảnh uint8 đầu ra.
+        transform: dict từ compute_transform() để dùng lại cho nhiều trang (None = tự ước lượng).
+        return_transform: trả thêm transform đã dùng -> (ảnh, transform).
         """
         if image is None:
             return None
@@ -14,59 +67,144 @@ class ForensicInk:
             print("Warning: Decorrelation Stretch requires RGB image to separate ink layers.")
             return image
         h, w, c = image.shape
-        # 1. Reshape ảnh thành mảng (N, 3)
-        X = image.reshape(-1, 3).astype(np.float64)
-        N = X.shape[0]
-        # 2. Tính Covariance Matrix
-        mu = np.sum(X, axis=0).astype(np.float64) / N
-        X_centered = X - mu
-        cov_matrix = np.dot(X_centered.T, X_centered) / (N - 1)
-        # 3. Tính Eigenvalues & Eigenvectors
-        eigenvalues, eigenvectors = np.linalg.eigh(cov_matrix)
 
-        # 4. Chiếu dữ liệu và chuẩn hóa
-        sigma = np.sqrt(eigenvalues)
-        sigma = np.where(sigma < 1e-6, 1e-6, sigma)  # Tránh chia 0
-        scaling_matrix = np.diag(1.0 / sigma)
-        transform_matrix = np.dot(np.dot(eigenvectors, scaling_matrix), eigenvectors.T)
-        X_transformed = np.dot(X_centered, transform_matrix)
+        if transform is None:
+            transform = self.compute_transform(image, sample_size=sample_size,
+                                               chunk_rows=chunk_rows, seed=seed)
+
+        # Y = (X - mu) T + mu = X T + (mu - mu T)
+        mu = np.asarray(transform["mean"], dtype=np.float64)
+        T = np.asarray(transform["matrix"], dtype=np.float64)
+        T32 = T.astype(np.float32)
+        offset = (mu - np.dot(mu, T)).astype(np.float32)
 
-        X_final = X_transformed + mu
-        _min = np.min(X_final)
-        _max = np.max(X_final)
-        if _max - _min > 0:
-            X_final = 255 * (X_final - _min) / (_max - _min)
+        def chunk_transform(y0):
+            X = image[y0:y0 + chunk_rows].reshape(-1, c).astype(np.float32)
+            Y = np.dot(X, T32)
+            Y += offset
+            return Y
 
-        return X_final.reshape(h, w, c).astype(np.uint8)
+        # Lượt 1: min/max toàn cục
+        _min, _max = np.inf, -np.inf
+        for y0 in range(0, h, chunk_rows):
+            Y = chunk_transform(y0)
+            _min = min(_min, float(Y.min()))
+            _max = max(_max, float(Y.max()))
 
-    def inpaint_holes(image: np.ndarray, mask: np.ndarray, iterations: int = 5) -> np.ndarray:
+        # Lượt 2: chuẩn hóa về [0, 255] và ghi thẳng vào đầu ra uint8
+        output = np.empty((h, w, c), dtype=np.uint8)
+        scale = 255.0 / (_max - _min) if _max - _min > 0 else 1.0
+        shift = _min if _max - _min > 0 else 0.0
+        for y0 in range(0, h, chunk_rows):
+            Y = chunk_transform(y0)
+            Y -= shift
+            Y *= scale
+            np.clip(Y, 0, 255, out=Y)
+            rows = min(chunk_rows, h - y0)
+            output[y0:y0 + rows] = Y.reshape(rows, w, c)
+
+        if return_transform:
+            return output, transform
+        return output
+
+    def inpaint_holes(self, image: np.ndarray, mask: np.ndarray, iterations: int = 200,
+                      tol: float = 0.05, levels: int = None, omega: float = 1.8) -> np.ndarray:
         """
-        Vá lỗ thủng thủ công (Diffusion based).
-        Có thể chạy trên cả ảnh xám hoặc     ảnh màu.
+        Vá lỗ thủng thủ công (Diffusion based): giải phương trình Laplace trong vùng mask,
+        mỗi pixel lỗ = trung bình 4 lân cận, biên là các pixel tốt xung quanh.
+        Có thể chạy trên cả ảnh xám hoặc ảnh màu.
+
+        - Cập nhật đồng loạt mọi pixel lỗ (Gauss-Seidel đỏ-đen theo chỉ số phẳng),
+          chỉ tính trên các pixel lỗ chứ không trên cả ảnh.
+        - Coarse-to-fine (multigrid): giải trên ảnh thu nhỏ 2^k lần trước, phóng to làm
+          giá trị khởi tạo cho tầng mịn hơn -> lỗ lớn hội tụ sau vài lượt.
+        - Dừng sớm ở mỗi tầng khi thay đổi lớn nhất < tol (mức xám).
+
+        iterations: số lượt tối đa mỗi tầng. levels: số tầng thu nhỏ (None = tự chọn).
         """
-        if mask is None: return image
+        if image is None:
+            raise ValueError("Input image is None!")
+        if mask is None:
+            return image
+        if mask.shape[:2] != image.shape[:2]:
+            raise ValueError("Mask must have same HxW as image!")
+
+        holes = mask > 0
+        if not holes.any() or holes.all():
+            return image.copy()
+
+        # Chỉ xử lý vùng bao quanh các lỗ (+ viền đủ cho các tầng thô)
+        ys, xs = np.nonzero(holes)
+        h, w = holes.shape
+        if levels is None:
+            levels = max(0, int(np.log2(max(1, min(ys.max() - ys.min(), xs.max() - xs.min())))) - 1)
+        margin = 2 ** (levels + 1)
+        y0, y1 = max(0, ys.min() - margin), min(h, ys.max() + 1 + margin)
+        x0, x1 = max(0, xs.min() - margin), min(w, xs.max() + 1 + margin)
+
+        crop = image[y0:y1, x0:x1].astype(np.float32)
+        if crop.ndim == 2:
+            crop = crop[:, :, np.newaxis]
+        solved = self._diffuse(crop, holes[y0:y1, x0:x1], iterations, tol, levels, omega)
+
+        output = image.copy()
+        region = output[y0:y1, x0:x1]
+        hole_crop = holes[y0:y1, x0:x1]
+        vals = solved[hole_crop]
+        if np.issubdtype(image.dtype, np.integer):
+            info = np.iinfo(image.dtype)
+            vals = np.clip(np.rint(vals), info.min, info.max)
+        region[hole_crop] = vals.reshape(region[hole_crop].shape).astype(image.dtype)
+        return output
+
+    def _diffuse(self, values, holes, iterations, tol, levels, omega):
+        """Giải Laplace trên (H, W, C) float32, giá trị khởi tạo lấy từ tầng thô hơn."""
+        h, w, c = values.shape
+        values = values.copy()
 
-        # Xử lý cho cả ảnh xám (2D) và màu (3D)
-        is_color = len(image.shape) == 3
-        h, w = image.shape[:2]
+        if levels > 0 and min(h, w) >= 8:
+            # Thu nhỏ 2x: pixel thô = trung bình các pixel tốt trong khối 2x2,
+            # là lỗ nếu cả khối đều là lỗ
+            hp, wp = h + h % 2, w + w % 2
+            known = np.zeros((hp, wp), dtype=np.float32)
+            known[:h, :w] = ~holes
+            weighted = np.zeros((hp, wp, c), dtype=np.float32)
+            weighted[:h, :w] = values * known[:h, :w, np.newaxis]
+            cnt = known.reshape(hp // 2, 2, wp // 2, 2).sum(axis=(1, 3))
+            acc = weighted.reshape(hp // 2, 2, wp // 2, 2, c).sum(axis=(1, 3))
+            coarse_holes = cnt == 0
+            coarse = acc / np.maximum(cnt, 1)[:, :, np.newaxis]
+            coarse = self._diffuse(coarse, coarse_holes, iterations, tol, levels - 1, omega)
+            # Phóng to (lặp pixel) làm giá trị khởi tạo cho các pixel lỗ
+            up = np.repeat(np.repeat(coarse, 2, axis=0), 2, axis=1)[:h, :w]
+            values[holes] = up[holes]
+        else:
+            # Tầng thô nhất: khởi tạo bằng trung bình các pixel tốt
+            values[holes] = values[~holes].mean(axis=0)
 
-        restored = image.copy().astype(np.float32)
-        hole_pixels = np.argwhere(mask > 0)
+        # Chỉ số phẳng của pixel lỗ và 4 lân cận (kẹp ở biên ảnh)
+        ys, xs = np.nonzero(holes)
+        flat = values.reshape(-1, c)
+        groups = []
+        for parity in (0, 1):
+            sel = ((ys + xs) & 1) == parity
+            y, x = ys[sel], xs[sel]
+            if y.size == 0:
+                continue
+            idx = y * w + x
+            nbrs = np.stack([np.maximum(y - 1, 0) * w + x,
+                             np.minimum(y + 1, h - 1) * w + x,
+                             y * w + np.maximum(x - 1, 0),
+                             y * w + np.minimum(x + 1, w - 1)])
+            groups.append((idx, nbrs))
 
+        # Gauss-Seidel đỏ-đen: pixel cùng màu không kề nhau -> cập nhật đồng loạt
         for _ in range(iterations):
-            for y, x in hole_pixels:
-                if y <= 0 or y >= h - 1 or x <= 0 or x >= w - 1: continue
-
-                neighbors = []
-                # Kiểm tra 4 hướng
-                coords = [(y - 1, x), (y + 1, x), (y, x - 1), (y, x + 1)]
-                for ny, nx in coords:
-                    if mask[ny, nx] == 0:  # Chỉ lấy pixel tốt
-                        neighbors.append(restored[ny, nx])
-
-                if len(neighbors) > 0:
-                    # Tính trung bình cộng vector (nếu màu) hoặc scalar (nếu xám)
-                    val = np.mean(neighbors, axis=0)
-                    restored[y, x] = val
-
-        return restored.astype(np.uint8)
\ No newline at end of file
+            delta = 0.0
+            for idx, nbrs in groups:
+                step = flat[nbrs].sum(axis=0) * 0.25 - flat[idx]
+                delta = max(delta, float(np.abs(step).max()))
+                flat[idx] += omega * step
+            if delta < tol:
+                break
+        return values
@@ -1,6 +1,8 @@
 import cv2
 import numpy as np
 
+from src.core.dewarp import PageDewarper
+
 class GeometryCorrector:
     def rotate_image(self, image, angle, keep_size=False):
         """
@@ -8,35 +10,12 @@ class GeometryCorrector:
         - keep_size=True: Giữ nguyên kích thước khung ảnh cũ (bị cắt góc).
         - keep_size=False: Tự động mở rộng khung ảnh để chứa đủ hình (không mất dữ liệu).
         """
-        (h, w) = image.shape[:2]
-        center = (w // 2, h // 2)
-
-        # 1. Lấy ma trận xoay (Rotation Matrix) chuẩn
-        M = cv2.getRotationMatrix2D(center, angle, 1.0)
-
-        if not keep_size:
-            # --- LOGIC TÍNH KHUNG HÌNH MỚI ---
-
-            # Lấy cos và sin từ ma trận M (đã được OpenCV tính sẵn)
-            cos = np.abs(M[0, 0])
-            sin = np.abs(M[0, 1])
-
-            # Tính kích thước Bounding Box mới
-            nW = int((h * sin) + (w * cos))
-            nH = int((h * cos) + (w * sin))
-
-            # Điều chỉnh lại tâm xoay (Translation adjustment)
-            # Vì ảnh to ra, tâm ảnh mới thay đổi so với tâm cũ.
-            # Ta cần dời ảnh đi một đoạn offset để nó nằm giữa khung mới.
-            M[0, 2] += (nW / 2) - center[0]
-            M[1, 2] += (nH / 2) - center[1]
-
-            # Cập nhật kích thước khung hình đích
-            w, h = nW, nH
+        # 1. Ma trận xoay + kích thước khung đích (xem rotation_matrix)
+        M, (w, h) = self.rotation_matrix(image.shape, angle, keep_size)
 
         # 2. Thực hiện biến đổi Affine
         # Lưu ý: Luôn để borderValue màu trắng (255, 255, 255) cho tài liệu
-        rotated = cv2.warpAffine(image, M, (w, h),
+        rotated = cv2.warpAffine(image, M[:2], (w, h),
                                  flags=cv2.INTER_CUBIC,
                                  borderMode=cv2.BORDER_CONSTANT,
                                  borderValue=(255, 255, 255))
@@ -74,8 +53,102 @@ class GeometryCorrector:
         - Sử dụng np.linalg.norm để tính khoảng cách Euclid.
         - Sử dụng INTER_CUBIC để ảnh sắc nét hơn.
         """
+        # 1-5. Sắp xếp 4 góc, tính kích thước ảnh đích và ma trận phối cảnh
+        # (xem perspective_matrix)
+        M, (maxWidth, maxHeight) = self.perspective_matrix(pts)
+
+        # 6. Thực hiện biến đổi (Warp)
+        # Thêm flags=cv2.INTER_CUBIC để nội suy ảnh sắc nét hơn (tốt cho OCR sau này)
+        warped = cv2.warpPerspective(image, M, (maxWidth, maxHeight), flags=cv2.INTER_CUBIC)
+
+        return warped
+
+
+    def detect_page_corners(self, image, min_area_ratio=0.2):
+        """
+        Tìm 4 góc trang giấy: contour ngoài lớn nhất xấp xỉ được bằng tứ giác.
+        Nên chạy trên ảnh proxy thu nhỏ rồi phóng tọa độ về ảnh gốc.
+        Trả về mảng (4, 2) float32 hoặc None nếu không tìm thấy tứ giác đủ lớn.
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim > 2 else image
+        h, w = gray.shape[:2]
+
+        # 1. Biên (Canny) trên ảnh đã làm mờ, nối các đoạn biên đứt
+        edges = cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 50, 150)
+        edges = cv2.dilate(edges, np.ones((3, 3), np.uint8))
+
+        # 2. Xét các contour lớn nhất, lấy contour đầu tiên xấp xỉ được bằng 4 điểm
+        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        for c in sorted(contours, key=cv2.contourArea, reverse=True)[:5]:
+            if cv2.contourArea(c) < min_area_ratio * h * w:
+                break
+            approx = cv2.approxPolyDP(c, 0.02 * cv2.arcLength(c, True), True)
+            if len(approx) == 4:
+                return approx.reshape(4, 2).astype(np.float32)
+        return None
+
+    def refine_corners(self, image, pts, win=5):
+        """
+        Tinh chỉnh góc trang (ví dụ dò trên proxy rồi phóng to) tới mức sub-pixel trên ảnh đầy đủ.
+        Chỉ cắt 1 vùng nhỏ quanh mỗi góc (bán kính ~ 2 * win) nên không chạm tới cả trang.
+        """
+        h, w = image.shape[:2]
+        refined = np.asarray(pts, dtype=np.float32).copy()
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01)
+        r = 2 * win + 2
+        for i, (x, y) in enumerate(refined):
+            x0, y0 = max(0, int(x) - r), max(0, int(y) - r)
+            x1, y1 = min(w, int(x) + r + 1), min(h, int(y) + r + 1)
+            if x1 - x0 < 2 * win + 3 or y1 - y0 < 2 * win + 3:
+                continue
+            crop = image[y0:y1, x0:x1]
+            if crop.ndim > 2:
+                crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+            pt = np.array([[[x - x0, y - y0]]], dtype=np.float32)
+            pt = cv2.cornerSubPix(crop, pt, (win, win), (-1, -1), criteria)
+            refined[i] = pt[0, 0] + (x0, y0)
+        return refined
+
+    def rotation_matrix(self, image_shape, angle, keep_size=False):
+        """
+        Ma trận xoay 3x3 (tọa độ ảnh gốc -> ảnh đã xoay) và kích thước khung (w, h) sau xoay.
+        Dùng chung cho rotate_image() và fused_warp().
+        """
+        (h, w) = image_shape[:2]
+        center = (w // 2, h // 2)
+
+        # Lấy ma trận xoay (Rotation Matrix) chuẩn
+        M = cv2.getRotationMatrix2D(center, angle, 1.0)
+
+        if not keep_size:
+            # --- LOGIC TÍNH KHUNG HÌNH MỚI ---
+
+            # Lấy cos và sin từ ma trận M (đã được OpenCV tính sẵn)
+            cos = np.abs(M[0, 0])
+            sin = np.abs(M[0, 1])
+
+            # Tính kích thước Bounding Box mới
+            nW = int((h * sin) + (w * cos))
+            nH = int((h * cos) + (w * sin))
+
+            # Điều chỉnh lại tâm xoay (Translation adjustment)
+            # Vì ảnh to ra, tâm ảnh mới thay đổi so với tâm cũ.
+            # Ta cần dời ảnh đi một đoạn offset để nó nằm giữa khung mới.
+            M[0, 2] += (nW / 2) - center[0]
+            M[1, 2] += (nH / 2) - center[1]
+
+            # Cập nhật kích thước khung hình đích
+            w, h = nW, nH
+
+        return np.vstack([M, [0.0, 0.0, 1.0]]), (w, h)
+
+    def perspective_matrix(self, pts):
+        """
+        Ma trận phối cảnh 3x3 (khung chứa 4 góc -> ảnh chữ nhật) và kích thước (w, h) đầu ra.
+        Dùng chung cho four_point_transform() và fused_warp().
+        """
         # 1. Sắp xếp lại các điểm để đảm bảo thứ tự
-        rect = self._order_points(pts)
+        rect = self._order_points(np.asarray(pts, dtype=np.float32))
         (tl, tr, br, bl) = rect
 
         # 2. Tính toán độ rộng (width) mới của ảnh đích
@@ -98,12 +171,79 @@ class GeometryCorrector:
             [0, maxHeight - 1]],            # Bottom-Left
             dtype="float32")
 
-        # 5. Tính ma trận biến đổi phối cảnh M và áp dụng
-        M = cv2.getPerspectiveTransform(rect, dst)
-
-        # 6. Thực hiện biến đổi (Warp)
-        # Thêm flags=cv2.INTER_CUBIC để nội suy ảnh sắc nét hơn (tốt cho OCR sau này)
-        warped = cv2.warpPerspective(image, M, (maxWidth, maxHeight), flags=cv2.INTER_CUBIC)
-
-        return warped
+        # 5. Tính ma trận biến đổi phối cảnh
+        return cv2.getPerspectiveTransform(rect, dst), (maxWidth, maxHeight)
 
+    def fused_warp(self, image, angle=0.0, pts=None, dewarper=None, grid_step=32,
+                   proxy_max_side=1024, cache_key=None, interpolation=cv2.INTER_CUBIC,
+                   proxy=None):
+        """
+        Gộp Deskew (xoay) -> Perspective (4 góc) -> Dewarp (lưới cong) thành 1 map tọa độ
+        và lấy mẫu ảnh gốc đúng 1 lần (thay vì nội suy lại cả trang ở mỗi bước).
+
+        - angle: góc xoay (độ) như rotate_image(..., keep_size=False).
+        - pts: 4 góc trang (tọa độ trên ảnh đã xoay) như four_point_transform(); None = bỏ qua.
+        - dewarper: PageDewarper; None = không khử cong. Lưới cong được ước lượng trên ảnh
+          proxy nhỏ (cạnh dài <= proxy_max_side) đã qua xoay + phối cảnh.
+        - cache_key: dùng lại lưới cong cho cùng cuốn sách / giá chụp.
+        - proxy: ảnh gốc đã thu nhỏ sẵn (vd. Preprocessor.make_proxy() của pipeline) -
+          dùng lại làm nguồn cho ảnh proxy thay vì tự resize ảnh gốc; None = tự thu nhỏ.
+
+        Map được tính trên lưới điều khiển thô (grid_step pixel) rồi nội suy lên ảnh đầy đủ
+        ở dạng fixed-point (PageDewarper.mesh_to_maps).
+        """
+        if image is None:
+            raise ValueError("Input image is None!")
+
+        # 1. Ma trận tổng T: ảnh gốc -> ảnh đã xoay + nắn phối cảnh
+        T, size = self.rotation_matrix(image.shape, angle)
+        if pts is not None:
+            P, size = self.perspective_matrix(pts)
+            T = P @ T
+        w, h = size
+        T_inv = np.linalg.inv(T)
+
+        # 2. Lưới cong (tọa độ trong khung đã nắn), ước lượng trên proxy nhỏ
+        mesh = None
+        if dewarper is not None:
+            scale = min(1.0, proxy_max_side / float(max(w, h)))
+            if proxy is None:
+                proxy = image
+                if scale < 1.0:
+                    # Thu nhỏ ảnh gốc trước (INTER_AREA) rồi mới warp ở độ phân giải nhỏ
+                    proxy = cv2.resize(image, (max(1, int(round(image.shape[1] * scale))),
+                                               max(1, int(round(image.shape[0] * scale)))),
+                                       interpolation=cv2.INTER_AREA)
+
+            def pixel_scale(sx, sy):
+                # Ma trận đổi tọa độ khi co giãn ảnh (theo tâm pixel)
+                return np.array([[sx, 0, 0.5 * sx - 0.5],
+                                 [0, sy, 0.5 * sy - 0.5],
+                                 [0, 0, 1]], dtype=np.float64)
+
+            # Proxy nguồn -> khung đã nắn thu nhỏ: S_out T S_src^-1
+            S_src = pixel_scale(proxy.shape[1] / float(image.shape[1]),
+                                proxy.shape[0] / float(image.shape[0]))
+            S_out = pixel_scale(scale, scale)
+            proxy_size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+            warped = cv2.warpPerspective(proxy, S_out @ T @ np.linalg.inv(S_src), proxy_size,
+                                         flags=cv2.INTER_LINEAR,
+                                         borderMode=cv2.BORDER_CONSTANT,
+                                         borderValue=(255, 255, 255))
+            mesh = dewarper.estimate_mesh(warped, grid_step=grid_step, output_shape=(h, w),
+                                          cache_key=cache_key)
+        # Các hàm dựng lưới / map không phụ thuộc trạng thái của dewarper
+        helper = dewarper if dewarper is not None else PageDewarper()
+        if mesh is None:
+            mesh = helper.identity_mesh((h, w), grid_step)
+
+        # 3. Đưa các nút lưới về tọa độ ảnh gốc qua T^-1 (chia phối cảnh)
+        mesh_x, mesh_y = mesh
+        src = T_inv @ np.stack([mesh_x.ravel(), mesh_y.ravel(), np.ones(mesh_x.size)])
+        src_x = (src[0] / src[2]).reshape(mesh_x.shape).astype(np.float32)
+        src_y = (src[1] / src[2]).reshape(mesh_x.shape).astype(np.float32)
+
+        # 4. Nội suy lưới -> map fixed-point, lấy mẫu ảnh gốc 1 lần duy nhất
+        map1, map2 = helper.mesh_to_maps(src_x, src_y, (h, w), grid_step=grid_step)
+        return cv2.remap(image, map1, map2, interpolation,
+                         borderMode=cv2.BORDER_CONSTANT, borderValue=(255, 255, 255))
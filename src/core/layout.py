@@ -1,6 +1,332 @@
 import numpy as np
+import cv2 as cv
+
+# Kích thước ô mặc định của chỉ mục lưới, tính theo chiều cao dòng trung vị
+_GRID_CELL_LINES = 8
+
+
+class RegionIndex:
+    """
+    Chỉ mục không gian dạng lưới đều cho các bbox (x, y, w, h).
+    Mỗi ô giữ danh sách id các bbox chạm vào nó (dạng CSR: cell_start + ids),
+    truy vấn "các vùng trong hình chữ nhật" chỉ xét các ô bị phủ thay vì mọi vùng.
+    """
+
+    def __init__(self, bboxes: np.ndarray, cell_size: int = 256):
+        self.bboxes = np.asarray(bboxes, dtype=np.int32).reshape(-1, 4)
+        self.cell_size = max(1, int(cell_size))
+        n = len(self.bboxes)
+        if n == 0:
+            self.grid_shape = (0, 0)
+            self.cell_start = np.zeros(1, dtype=np.int64)
+            self.ids = np.zeros(0, dtype=np.int32)
+            return
+
+        c0, r0, c1, r1 = self._cells(self.bboxes)
+        self.grid_shape = (int(r1.max()) + 1, int(c1.max()) + 1)
+        # Liệt kê (ô, id) cho mọi bbox cùng lúc: bbox i phủ ncols[i] x nrows[i] ô
+        ncols = c1 - c0 + 1
+        nrows = r1 - r0 + 1
+        counts = ncols * nrows
+        ids = np.repeat(np.arange(n, dtype=np.int32), counts)
+        k = np.arange(len(ids)) - np.repeat(np.cumsum(counts) - counts, counts)
+        cols = np.repeat(c0, counts) + k % np.repeat(ncols, counts)
+        rows = np.repeat(r0, counts) + k // np.repeat(ncols, counts)
+        cells = rows * self.grid_shape[1] + cols
+
+        order = np.argsort(cells, kind="stable")
+        self.ids = ids[order]
+        n_cells = self.grid_shape[0] * self.grid_shape[1]
+        self.cell_start = np.zeros(n_cells + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=n_cells), out=self.cell_start[1:])
+
+    def _cells(self, bboxes):
+        x, y, w, h = (bboxes[:, i].astype(np.int64) for i in range(4))
+        s = self.cell_size
+        return x // s, y // s, (x + np.maximum(w, 1) - 1) // s, (y + np.maximum(h, 1) - 1) // s
+
+    def __len__(self):
+        return len(self.bboxes)
+
+    def query(self, rect, mode="intersect") -> np.ndarray:
+        """
+        Id (tăng dần) các bbox trong hình chữ nhật rect = (x, y, w, h).
+        mode: "intersect" (chạm vào rect), "center" (tâm nằm trong rect), "inside" (nằm trọn trong rect).
+        """
+        if mode not in ("intersect", "center", "inside"):
+            raise ValueError(f"Unknown query mode: {mode}")
+        rows, cols = self.grid_shape
+        if rows == 0:
+            return np.zeros(0, dtype=np.int32)
+        x, y, w, h = (int(v) for v in rect)
+        c0, r0, c1, r1 = (v[0] for v in self._cells(np.array([[x, y, w, h]])))
+        c0, r0 = max(0, c0), max(0, r0)
+        c1, r1 = min(cols - 1, c1), min(rows - 1, r1)
+        if c0 > c1 or r0 > r1:
+            return np.zeros(0, dtype=np.int32)
+
+        starts = self.cell_start[np.arange(r0, r1 + 1)[:, np.newaxis] * cols + np.arange(c0, c1 + 1)]
+        ends = self.cell_start[np.arange(r0, r1 + 1)[:, np.newaxis] * cols + np.arange(c0, c1 + 1) + 1]
+        cand = np.unique(np.concatenate([self.ids[a:b] for a, b in zip(starts.ravel(), ends.ravel())]))
+        if len(cand) == 0:
+            return cand.astype(np.int32)
+
+        b = self.bboxes[cand].astype(np.int64)
+        if mode == "intersect":
+            hit = (b[:, 0] < x + w) & (b[:, 0] + b[:, 2] > x) & (b[:, 1] < y + h) & (b[:, 1] + b[:, 3] > y)
+        elif mode == "center":
+            cx2, cy2 = 2 * b[:, 0] + b[:, 2], 2 * b[:, 1] + b[:, 3]
+            hit = (cx2 >= 2 * x) & (cx2 < 2 * (x + w)) & (cy2 >= 2 * y) & (cy2 < 2 * (y + h))
+        else:
+            hit = (b[:, 0] >= x) & (b[:, 0] + b[:, 2] <= x + w) & (b[:, 1] >= y) & (b[:, 1] + b[:, 3] <= y + h)
+        return cand[hit].astype(np.int32)
+
 
 class LayoutAnalyzer:
-    def auto_crop(self, image: np.ndarray) -> np.ndarray:
-        """Cắt bỏ lề thừa dựa trên Projection Profile."""
-        pass
\ No newline at end of file
+    # ------ Projection profile trên ảnh tích phân ------
+    @staticmethod
+    def ink_integral(image: np.ndarray = None, context=None) -> np.ndarray:
+        """
+        Ảnh tích phân (h+1, w+1) của mask mực: profile hàng / cột của mọi hình chữ nhật con
+        chỉ còn là hiệu 4 giá trị cho mỗi phần tử (mỗi phần tử O(1), không phụ thuộc diện tích).
+        image: ảnh nhị phân (chữ 0 trên nền 255) hoặc ảnh xám (Otsu đảo).
+        context: PageContext, nếu có thì dùng lại mask mực / ảnh tích phân của trang.
+        """
+        if context is not None:
+            return context.ink_integral(context.otsu_ink(image))
+        if image is None:
+            raise ValueError("Input image is None!")
+        gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY) if image.ndim > 2 else image
+        if gray.dtype != np.uint8:
+            gray = np.clip(gray, 0, 255).astype(np.uint8)
+        _, ink = cv.threshold(gray, 0, 1, cv.THRESH_BINARY_INV + cv.THRESH_OTSU)
+        return cv.integral(ink, sdepth=cv.CV_32S)
+
+    @staticmethod
+    def box_integral(bboxes: np.ndarray, shape: tuple) -> np.ndarray:
+        """Ảnh tích phân của mask phủ bởi các bbox (x, y, w, h) - dùng khi không có ảnh."""
+        h, w = shape[:2]
+        b = np.asarray(bboxes, dtype=np.int64).reshape(-1, 4)
+        # Mảng hiệu 2D: +1 / -1 ở 4 góc, cộng dồn 2 chiều -> số bbox phủ mỗi pixel
+        diff = np.zeros((h + 1, w + 1), dtype=np.int32)
+        x0, y0 = np.clip(b[:, 0], 0, w), np.clip(b[:, 1], 0, h)
+        x1, y1 = np.clip(b[:, 0] + b[:, 2], 0, w), np.clip(b[:, 1] + b[:, 3], 0, h)
+        np.add.at(diff, (y0, x0), 1)
+        np.add.at(diff, (y0, x1), -1)
+        np.add.at(diff, (y1, x0), -1)
+        np.add.at(diff, (y1, x1), 1)
+        covered = (diff[:h, :w].cumsum(axis=0).cumsum(axis=1) > 0).view(np.uint8)
+        return cv.integral(covered, sdepth=cv.CV_32S)
+
+    @staticmethod
+    def row_profile(integral: np.ndarray, rect=None) -> np.ndarray:
+        """Số pixel mực trên từng hàng của rect = (x, y, w, h) (mặc định cả trang)."""
+        if rect is None:
+            rect = (0, 0, integral.shape[1] - 1, integral.shape[0] - 1)
+        x, y, w, h = rect
+        right = integral[y:y + h + 1, x + w]
+        left = integral[y:y + h + 1, x]
+        return np.diff(right - left)
+
+    @staticmethod
+    def col_profile(integral: np.ndarray, rect=None) -> np.ndarray:
+        """Số pixel mực trên từng cột của rect = (x, y, w, h) (mặc định cả trang)."""
+        if rect is None:
+            rect = (0, 0, integral.shape[1] - 1, integral.shape[0] - 1)
+        x, y, w, h = rect
+        bottom = integral[y + h, x:x + w + 1]
+        top = integral[y, x:x + w + 1]
+        return np.diff(bottom - top)
+
+    @staticmethod
+    def ink_count(integral: np.ndarray, rect) -> int:
+        """Tổng số pixel mực trong rect = (x, y, w, h), O(1)."""
+        x, y, w, h = rect
+        return int(integral[y + h, x + w]) - int(integral[y, x + w]) \
+            - int(integral[y + h, x]) + int(integral[y, x])
+
+    @staticmethod
+    def _span(profile, min_ink):
+        """[đầu, cuối) của đoạn có mực (> min_ink) trong profile, None nếu trống."""
+        idx = np.flatnonzero(profile > min_ink)
+        if len(idx) == 0:
+            return None
+        return int(idx[0]), int(idx[-1]) + 1
+
+    def content_bbox(self, integral: np.ndarray, rect=None, min_ink: int = 0):
+        """Bbox (x, y, w, h) nhỏ nhất chứa mực trong rect (hàng / cột có > min_ink pixel), None nếu trống."""
+        if rect is None:
+            rect = (0, 0, integral.shape[1] - 1, integral.shape[0] - 1)
+        ys = self._span(self.row_profile(integral, rect), min_ink)
+        if ys is None:
+            return None
+        xs = self._span(self.col_profile(integral, rect), min_ink)
+        return (rect[0] + xs[0], rect[1] + ys[0], xs[1] - xs[0], ys[1] - ys[0])
+
+    def auto_crop(self, image: np.ndarray, margin: int = 0, min_ink: int = 0,
+                  context=None) -> np.ndarray:
+        """
+        Cắt bỏ lề thừa dựa trên Projection Profile.
+        Hàng / cột có <= min_ink pixel mực được coi là lề; giữ thêm margin pixel quanh nội dung.
+        Trả về view của ảnh (không copy); trang trắng -> trả lại nguyên ảnh.
+        """
+        if image is None:
+            raise ValueError("Input image is None!")
+        box = self.content_bbox(self.ink_integral(image, context), min_ink=min_ink)
+        if box is None:
+            return image
+        x, y, w, h = box
+        H, W = image.shape[:2]
+        return image[max(0, y - margin):min(H, y + h + margin),
+                     max(0, x - margin):min(W, x + w + margin)]
+
+    # ------ Recursive X-Y cut ------
+    @staticmethod
+    def _gaps(profile, min_gap, min_ink):
+        """Các khoảng trống (bắt đầu, kết thúc) dài >= min_gap nằm giữa profile (bỏ lề 2 đầu)."""
+        empty = np.concatenate(([False], profile <= min_ink, [False])).view(np.int8)
+        edges = np.flatnonzero(np.diff(empty))
+        starts, ends = edges[0::2], edges[1::2]
+        inner = (starts > 0) & (ends < len(profile)) & (ends - starts >= min_gap)
+        return starts[inner], ends[inner]
+
+    def xy_cut(self, integral: np.ndarray, rect=None, min_gap_y: int = 20, min_gap_x: int = 20,
+               min_ink: int = 0, max_depth: int = 32) -> np.ndarray:
+        """
+        Recursive X-Y cut: tách vùng theo khoảng trống ngang / dọc rộng nhất (tính theo bội số
+        min_gap_y / min_gap_x) rồi đệ quy.
+        Mỗi bước chỉ cần profile hàng + cột của vùng (truy vấn trên ảnh tích phân).
+        Trả về (N, 4) int32 các vùng lá (x, y, w, h), theo thứ tự đọc
+        (trên -> dưới khi cắt ngang, trái -> phải khi cắt dọc).
+        """
+        leaves = []
+        stack = [(rect, 0)]
+        while stack:
+            r, depth = stack.pop()
+            box = self.content_bbox(integral, r, min_ink)
+            if box is None:
+                continue
+            if depth >= max_depth:
+                leaves.append(box)
+                continue
+            x, y, w, h = box
+            ys, ye = self._gaps(self.row_profile(integral, box), min_gap_y, min_ink)
+            xs, xe = self._gaps(self.col_profile(integral, box), min_gap_x, min_ink)
+            # Độ rộng khoảng trống so với ngưỡng của từng hướng (khe cột hẹp hơn khoảng cách đoạn
+            # nhưng vẫn phải cắt trước để đọc hết cột này mới sang cột kia)
+            gap_y = (ye - ys).max() / float(min_gap_y) if len(ys) else 0
+            gap_x = (xe - xs).max() / float(min_gap_x) if len(xs) else 0
+            if gap_y == 0 and gap_x == 0:
+                leaves.append(box)
+                continue
+            # Cắt theo hướng có khoảng trống (tương đối) rộng hơn, tại mọi khoảng trống của hướng đó
+            if gap_y > gap_x:
+                bounds = np.concatenate(([0], (ys + ye) // 2, [h]))
+                parts = [(x, y + a, w, b - a) for a, b in zip(bounds[:-1], bounds[1:])]
+            else:
+                bounds = np.concatenate(([0], (xs + xe) // 2, [w]))
+                parts = [(x + a, y, b - a, h) for a, b in zip(bounds[:-1], bounds[1:])]
+            # Stack LIFO -> đẩy ngược để vùng đầu tiên được xử lý trước
+            stack.extend((p, depth + 1) for p in reversed(parts))
+        return np.array(leaves, dtype=np.int32).reshape(-1, 4)
+
+    # ------ Cột & thứ tự đọc ------
+    @staticmethod
+    def detect_columns(bboxes: np.ndarray, width: int, min_gap: int = 20,
+                       max_coverage: float = 0.1) -> np.ndarray:
+        """
+        Phát hiện cột từ độ phủ theo trục x của các bbox (thường là dòng):
+        độ phủ = số bbox trùm mỗi cột pixel (mảng hiệu + cumsum); khe giữa 2 cột là đoạn có
+        độ phủ <= max_coverage * độ phủ lớn nhất (tiêu đề trải nhiều cột không lấp mất khe)
+        và rộng >= min_gap. Trả về (C, 2) int32 các khoảng [x0, x1) của từng cột.
+        """
+        b = np.asarray(bboxes, dtype=np.int64).reshape(-1, 4)
+        if len(b) == 0:
+            return np.zeros((0, 2), dtype=np.int32)
+        diff = np.zeros(width + 1, dtype=np.int64)
+        np.add.at(diff, np.clip(b[:, 0], 0, width), 1)
+        np.add.at(diff, np.clip(b[:, 0] + b[:, 2], 0, width), -1)
+        coverage = np.cumsum(diff[:width])
+
+        filled = coverage > max_coverage * coverage.max()
+        edges = np.flatnonzero(np.diff(np.concatenate(([False], filled, [False])).view(np.int8)))
+        runs = edges.reshape(-1, 2)
+        # Gộp các đoạn cách nhau bởi khe hẹp hơn min_gap
+        keep = np.concatenate(([True], runs[1:, 0] - runs[:-1, 1] >= min_gap))
+        group = np.cumsum(keep) - 1
+        starts = runs[keep, 0]
+        ends = np.zeros(len(starts), dtype=np.int64)
+        np.maximum.at(ends, group, runs[:, 1])
+        return np.stack([starts, ends], axis=1).astype(np.int32)
+
+    @staticmethod
+    def reading_order(bboxes: np.ndarray, zones: np.ndarray, index: RegionIndex = None):
+        """
+        Thứ tự đọc của các bbox: theo vùng X-Y cut chứa tâm bbox, rồi trên -> dưới, trái -> phải.
+        Trả về (order, zone): order là hoán vị id theo thứ tự đọc, zone là id vùng của từng bbox
+        (len(zones) nếu tâm không nằm trong vùng nào).
+        """
+        bboxes = np.asarray(bboxes, dtype=np.int32).reshape(-1, 4)
+        if index is None:
+            index = RegionIndex(bboxes)
+        zone = np.full(len(bboxes), len(zones), dtype=np.int32)
+        for z in range(len(zones) - 1, -1, -1):
+            zone[index.query(zones[z], mode="center")] = z
+        order = np.lexsort((bboxes[:, 0], bboxes[:, 1], zone)).astype(np.int32)
+        return order, zone
+
+    def analyze(self, segments: dict, image_shape: tuple, image: np.ndarray = None,
+                context=None, min_ink: int = 0) -> dict:
+        """
+        Phân tích bố cục trang từ kết quả DocumentSegmentor.segment().
+        Ảnh tích phân mực lấy từ context / image, nếu không có thì dựng từ bbox các glyph.
+        Khoảng trống tối thiểu của X-Y cut và khe cột tính theo chiều cao dòng trung vị.
+
+        Trả về dict:
+            "content_bbox" : (x, y, w, h) vùng có mực (None nếu trang trắng)
+            "zones"        : (Z, 4) vùng lá X-Y cut theo thứ tự đọc
+            "columns"      : (C, 2) khoảng x [x0, x1) của các cột
+            "block_order"  : hoán vị id khối theo thứ tự đọc; "block_zone", "block_column"
+            "line_order"   : hoán vị id dòng theo thứ tự đọc
+            "index"        : RegionIndex trên bbox các dòng (truy vấn "các dòng trong hình chữ nhật")
+        """
+        h, w = image_shape[:2]
+        if context is not None or image is not None:
+            integral = self.ink_integral(image, context)
+        else:
+            integral = self.box_integral(segments["glyphs"]["bbox"], image_shape)
+
+        lines = segments["lines"]
+        blocks = segments["blocks"]
+        line_h = float(np.median(lines["bbox"][:, 3])) if len(lines["bbox"]) else 20.0
+        line_h = max(1.0, line_h)
+
+        zones = self.xy_cut(integral, min_gap_y=max(2, int(round(1.5 * line_h))),
+                            min_gap_x=max(2, int(round(1.0 * line_h))), min_ink=min_ink)
+        columns = self.detect_columns(lines["bbox"], w, min_gap=max(2, int(round(1.0 * line_h))))
+
+        block_order, block_zone = self.reading_order(blocks["bbox"], zones)
+        # Cột của khối = cột chứa tâm x (-1 nếu nằm ở khe)
+        cx = blocks["bbox"][:, 0] + blocks["bbox"][:, 2] // 2
+        block_column = np.full(len(cx), -1, dtype=np.int32)
+        if len(columns):
+            col = np.searchsorted(columns[:, 0], cx, side="right") - 1
+            inside = (col >= 0) & (cx < columns[np.maximum(col, 0), 1])
+            block_column[inside] = col[inside]
+
+        # Dòng: theo thứ tự khối, trong khối giữ thứ tự id (trên -> dưới)
+        block_rank = np.empty(len(block_order), dtype=np.int32)
+        block_rank[block_order] = np.arange(len(block_order), dtype=np.int32)
+        line_order = np.argsort(block_rank[lines["block"]], kind="stable")
+
+        cell = max(16, int(round(_GRID_CELL_LINES * line_h)))
+        return {
+            "content_bbox": self.content_bbox(integral, min_ink=min_ink),
+            "zones": zones,
+            "columns": columns,
+            "block_order": block_order,
+            "block_zone": block_zone,
+            "block_column": block_column,
+            "line_order": line_order.astype(np.int32),
+            "index": RegionIndex(lines["bbox"], cell_size=cell),
+        }
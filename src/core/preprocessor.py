@@ -89,6 +89,59 @@ class Preprocessor:
         return cv.resize(image, (int(new_w), int(new_h)), interpolation=inter)
 
 
+    def make_proxy(self, image:np.ndarray, max_side:int=1024) -> np.ndarray:
+        """
+        Tạo ảnh proxy thu nhỏ (cạnh dài <= max_side, INTER_AREA) để ước lượng tham số
+        (góc nghiêng, góc trang, nền bóng đổ...) thay vì chạy trên ảnh đầy đủ.
+        Ảnh đã đủ nhỏ thì trả lại chính nó.
+        """
+        if image is None:
+            raise ValueError("Input image is None!")
+        h, w = image.shape[:2]
+        if max(h, w) <= max_side:
+            return image
+        if w >= h:
+            return self.resize_image(image, target_width=int(max_side))
+        return self.resize_image(image, target_height=int(max_side))
+
+
+    def estimate_x_height(self, image:np.ndarray, max_side:int=2048,
+                          min_components:int=20) -> Optional[float]:
+        """
+        Ước lượng chiều cao chữ thường (x-height, pixel ảnh gốc) từ thống kê connected component.
+        Phần lớn component trên trang là chữ thường -> lấy mode của histogram chiều cao
+        (đã làm mượt) trên các component có hình dạng giống ký tự.
+        Chạy trên proxy (cạnh dài <= max_side) rồi phóng về. Trả về None nếu quá ít ký tự.
+        """
+        if image is None:
+            raise ValueError("Input image is None!")
+        if image.ndim > 2:
+            image = self.to_grayscale(image)
+        if image.dtype != np.uint8:
+            image = np.clip(image, 0, 255).astype(np.uint8)
+
+        proxy = self.make_proxy(image, max_side)
+        scale = proxy.shape[0] / float(image.shape[0])
+
+        _, ink = cv.threshold(proxy, 0, 255, cv.THRESH_BINARY_INV + cv.THRESH_OTSU)
+        if cv.countNonZero(ink) > ink.size // 2:
+            ink = cv.bitwise_not(ink)
+        _, _, stats, _ = cv.connectedComponentsWithStats(ink, connectivity=8)
+
+        w = stats[1:, cv.CC_STAT_WIDTH]
+        h = stats[1:, cv.CC_STAT_HEIGHT]
+        area = stats[1:, cv.CC_STAT_AREA]
+        # Component giống ký tự: không quá nhỏ (nhiễu), không quá dài (đường kẻ), không quá lớn
+        keep = (h >= 3) & (w >= 2) & (w <= 3 * h) & (h <= 4 * w)
+        keep &= (h <= 0.1 * proxy.shape[0]) & (area >= 0.1 * w * h)
+        if keep.sum() < min_components:
+            return None
+
+        hist = np.bincount(h[keep]).astype(np.float64)
+        hist = np.convolve(hist, [0.25, 0.5, 0.25], mode="same")
+        return float(np.argmax(hist)) / scale
+
+
     def compute_histogram(self, image:np.ndarray,
                           mask:Optional[np.ndarray]=None) -> np.ndarray:
         """
@@ -136,9 +189,69 @@ class Preprocessor:
         hist = cv.calcHist([image], [0], mask_proc, [256], [0, 256]).flatten()
         return hist
 
+    def equalize_histogram(self, image:np.ndarray) -> np.ndarray:
+        """
+        Cân bằng histogram toàn cục cho ảnh xám 8-bit.
+        Công thức: s_k = round((CDF(k) - CDF_min) / (N - CDF_min) * 255)
+        """
+        if image is None:
+            raise ValueError("Input image is None!")
+        if not isinstance(image, np.ndarray):
+            raise TypeError("Input image must be a numpy ndarray!")
+
+        if image.ndim > 2:
+            image = self.to_grayscale(image)
+        if image.dtype != np.uint8:
+            image = np.clip(image, 0, 255).astype(np.uint8)
+
+        hist = self.compute_histogram(image)
+        cdf = np.cumsum(hist)
+        cdf_min = cdf[np.nonzero(cdf)[0][0]] if cdf[-1] > 0 else 0.0
+        denom = cdf[-1] - cdf_min
+
+        # Ảnh chỉ có 1 mức xám -> giữ nguyên
+        if denom <= 0:
+            return image.copy()
+
+        lut = np.clip(np.round((cdf - cdf_min) / denom * 255.0), 0, 255).astype(np.uint8)
+        return lut[image]
+
+    def adaptive_threshold(self, image:np.ndarray, block_size:int=35, C:float=10,
+                           method:str="mean", context=None) -> np.ndarray:
+        """
+        Nhị phân hóa thích nghi: pixel > T(x, y) - C -> 255 (nền), còn lại 0 (chữ).
+        method:
+            - "mean": T = mean cục bộ (float32, boxFilter block_size x block_size);
+              nếu có context (PageContext) thì dùng lại mean đã tính cho trang.
+            - "gaussian": T = trung bình có trọng số Gaussian (cv.adaptiveThreshold).
+        """
+        if image is None:
+            raise ValueError("Input image is None!")
+        if image.ndim > 2:
+            image = self.to_grayscale(image)
+        if image.dtype != np.uint8:
+            image = np.clip(image, 0, 255).astype(np.uint8)
+        block_size = max(3, int(block_size) | 1)
+
+        if method == "gaussian":
+            return cv.adaptiveThreshold(image, 255, cv.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                        cv.THRESH_BINARY, block_size, C)
+        if method != "mean":
+            raise ValueError(f"Unknown adaptive threshold method: {method}")
+
+        if context is not None:
+            mean, _ = context.local_stats(block_size, image)
+        else:
+            mean = cv.boxFilter(image.astype(np.float32), ddepth=-1,
+                                ksize=(block_size, block_size), normalize=True)
+        binary = np.greater(image, mean - C).view(np.uint8)
+        binary *= 255
+        return binary
+
     def filter_small_blobs(self, image: np.ndarray, min_area: int=30,
                            min_height: int=8, max_aspect_ratio: float=8.0,
-                           min_fill_ratio: float=0.2) -> np.ndarray:
+                           min_fill_ratio: float=0.2, return_stats: bool=False,
+                           context=None):
         """
         Lọc nhiễu vụn vặt bằng Connected Component Analysis
     
@@ -152,11 +265,18 @@ class Preprocessor:
             Tỷ lệ w/h tối đa cho phép (loại nét quá dài).
         min_fill_ratio : float
             Mức độ "đặc" của blob: area / (w*h).
+        return_stats : bool
+            Nếu True, trả thêm dict {"num_labels", "labels", "stats", "centroids", "keep"}
+            để các bước sau dùng lại mà không phải chạy lại connectedComponentsWithStats.
+        context : PageContext
+            Nếu có, lấy mask Otsu và connected components từ context (tính 1 lần cho mỗi
+            phiên bản ảnh, dùng chung với các giai đoạn khác).
 
         Returns
         -------
         np.ndarray
             Ảnh nhị phân đã lọc nhiễu.
+            (hoặc tuple (ảnh, dict components) nếu return_stats=True)
         """
         if image is None: 
             raise ValueError("Input image is None!")
@@ -167,42 +287,49 @@ class Preprocessor:
         if image.dtype != np.uint8:
             image = np.clip(image, 0, 255).astype(np.uint8)
 
-        unique_vals = np.unique(image)
-        is_binary = np.all(np.isin(unique_vals, [0, 255]))
+        # Ảnh nhị phân <=> chỉ có giá trị 0/255 (histogram nhanh hơn np.unique)
+        counts = np.bincount(image.ravel(), minlength=256)
+        is_binary = counts[1:255].sum() == 0
 
         if not is_binary:
-            _, binary_img = cv.threshold(image, 0, 255,
-                                         cv.THRESH_BINARY_INV + cv.THRESH_OTSU)
+            if context is not None:
+                binary_img = context.otsu_ink(image)
+            else:
+                _, binary_img = cv.threshold(image, 0, 255,
+                                             cv.THRESH_BINARY_INV + cv.THRESH_OTSU)
         else:
-            binary_img = image.copy()
-
-        num_labels, labels, stats, _ = cv.connectedComponentsWithStats(
-            binary_img, connectivity=8
-        )
-
-        output_img = np.zeros_like(binary_img)
+            binary_img = image
 
-        for i in range(1, num_labels):
-            x = stats[i, cv.CC_STAT_LEFT]
-            y = stats[i, cv.CC_STAT_TOP]
-            w = stats[i, cv.CC_STAT_WIDTH]
-            h = stats[i, cv.CC_STAT_HEIGHT]
-            area = stats[i, cv.CC_STAT_AREA]
-
-            if area < min_area:
-                continue
-
-            if h < min_height:
-                continue
+        if context is not None:
+            cc = context.components(binary_img)
+            num_labels, labels, stats, centroids = (cc["num_labels"], cc["labels"],
+                                                    cc["stats"], cc["centroids"])
+        else:
+            num_labels, labels, stats, centroids = cv.connectedComponentsWithStats(
+                binary_img, connectivity=8
+            )
 
-            aspect_ratio = w / float(h)
-            if aspect_ratio > max_aspect_ratio:
-                continue
+        # Áp dụng các luật lọc cho toàn bộ mảng stats cùng lúc
+        w = stats[:, cv.CC_STAT_WIDTH].astype(np.float64)
+        h = stats[:, cv.CC_STAT_HEIGHT].astype(np.float64)
+        area = stats[:, cv.CC_STAT_AREA]
 
-            fill_ratio = area / float(w * h)
-            if fill_ratio < min_fill_ratio:
-                continue
+        keep = (area >= min_area) & (h >= min_height)
+        keep &= w <= max_aspect_ratio * h             # w / h <= max_aspect_ratio
+        keep &= area >= min_fill_ratio * (w * h)      # area / (w * h) >= min_fill_ratio
+        keep[0] = False                               # nhãn 0 là nền
 
-            output_img[labels == i] = 255  
+        # Bảng tra (LUT) nhãn -> 0/255, dựng ảnh kết quả bằng 1 phép index
+        lut = np.where(keep, 255, 0).astype(np.uint8)
+        output_img = lut[labels]
 
-        return output_img
\ No newline at end of file
+        if return_stats:
+            components = {
+                "num_labels": num_labels,
+                "labels": labels,
+                "stats": stats,
+                "centroids": centroids,
+                "keep": keep,
+            }
+            return output_img, components
+        return output_img
@@ -1,7 +1,22 @@
 import numpy as np
 import cv2 as cv
+
+from src.utils.tiling import process_tiled
+
+# Tham số mặc định của các biến thể ngưỡng cục bộ
+_THRESHOLD_DEFAULTS = {
+    "sauvola": {"k": 0.2, "R": 128.0},
+    "niblack": {"k": -0.2},
+    "wolf": {"k": 0.5},
+    "phansalkar": {"k": 0.25, "R": 0.5, "p": 2.0, "q": 10.0},
+}
+
+
 class DocumentSegmentor:
-    def binarize_sauvola(self, image, window_size=25, k=0.2, R=128):
+    THRESHOLD_METHODS = tuple(_THRESHOLD_DEFAULTS)
+
+    def binarize_sauvola(self, image, window_size=25, k=0.2, R=128, tile_size=None, workers=1,
+                         context=None):
         """
         Nhị phân hóa thích nghi Sauvola.
         T = mean * (1 + k * (std / R - 1))
@@ -10,45 +25,289 @@ class DocumentSegmentor:
             window_size (int) : kích thước cửa sổ trượt (phải là số lẻ)
             k (float) : Hằng số điều chỉnh
             R (int) : Độ lệch chuẩn tối đa (128 cho anrh 8-bit)
+            tile_size (int) : Nếu có, xử lý theo tile (halo = window_size // 2)
+                để ảnh float32 tạm chỉ lớn bằng 1 tile
+            workers (int) : Số thread xử lý tile song song
+            context (PageContext) : Nếu có, dùng lại mean / mean bình phương cục bộ đã tính
+                cho trang (bỏ qua khi xử lý theo tile)
         Returns: 
             np.ndarray : ảnh nhị phân (0-255)
         """
-        # Tính Mean và Std cục bộ (có thể dùng integral image để tối ưu)
-        # Áp dụng công thức
+        if tile_size:
+            return process_tiled(image,
+                                 lambda tile: self.binarize_sauvola(tile, window_size, k, R),
+                                 halo=(window_size | 1) // 2, tile_size=tile_size,
+                                 workers=workers)
+
+        spec = {"method": "sauvola", "window_size": window_size, "k": k, "R": R, "name": "sauvola"}
+        return self.binarize_multi(image, [spec], context=context)["sauvola"]
+
+    def binarize_multi(self, image, variants, band_rows=None, context=None):
+        """
+        Nhị phân hóa thích nghi nhiều biến thể trong 1 lần gọi.
+        Mean / độ lệch chuẩn cục bộ (boxFilter) được tính 1 lần cho mỗi window_size
+        rồi dùng chung cho mọi biến thể cùng cửa sổ (m: mean, s: std):
+            sauvola    : T = m * (1 + k * (s / R - 1))                       (k=0.2, R=128)
+            niblack    : T = m + k * s                                       (k=-0.2)
+            wolf       : T = m - k * (m - M) * (1 - s / max(s))              (k=0.5, M = min ảnh)
+            phansalkar : T = m * (1 + p * e^(-q * m/255) + k * (s / (255 R) - 1))
+                                                                             (k=0.25, R=0.5, p=2, q=10)
+        Args:
+            image (np.ndarray) : ảnh grayscale (8-bit) hoặc ảnh màu.
+            variants (list) : danh sách tên phương pháp hoặc dict
+                {"method", "window_size", "name", + tham số riêng (k, R, p, q)}
+            band_rows (int) : Nếu có, xử lý theo dải ngang band_rows hàng (halo = window_size // 2)
+                để mảng float32 tạm chỉ lớn bằng 1 dải
+            context (PageContext) : Nếu có (và không chia dải), dùng lại mean / mean bình phương
+                cục bộ đã tính cho trang
+        Returns:
+            dict : tên biến thể -> ảnh nhị phân uint8 (chữ 0, nền 255)
+        """
+        if image is None:
+            raise ValueError("Input image is None!")
+        gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY) if image.ndim > 2 else image
+        if gray.dtype != np.uint8:
+            gray = np.clip(gray, 0, 255).astype(np.uint8)
+
+        # --- 1. Chuẩn hóa danh sách biến thể ---
+        specs = []
+        for v in variants:
+            v = dict(v) if isinstance(v, dict) else {"method": v}
+            method = str(v.pop("method", "sauvola")).lower()
+            if method not in _THRESHOLD_DEFAULTS:
+                raise ValueError(f"Unknown threshold method: {method}")
+            window = int(v.pop("window_size", 25)) | 1
+            name = v.pop("name", None) or f"{method}_{window}"
+            if any(name == spec[0] for spec in specs):
+                raise ValueError(f"Duplicate threshold variant name: {name}")
+            specs.append((name, method, window, {**_THRESHOLD_DEFAULTS[method], **v}))
+        windows = sorted({spec[2] for spec in specs})
 
-        # --- 1. Chuyển ảnh về grayscale nếu cần ---
-        if image.ndim > 2:
-            image_gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+        h = gray.shape[0]
+        if band_rows and band_rows < h:
+            bands = [(y, min(y + band_rows, h)) for y in range(0, h, band_rows)]
         else:
-            image_gray = image.copy()
-        # Ép kiểu float32 sớm để tránh mất mát số lẻ
-        image_gray = image_gray.astype(np.float32)
-
-        # --- 2. Đảm bảo window_size là số lẻ ---
-        if window_size % 2 == 0:
-            window_size += 1
-
-        # --- 3. Tính Local Mean (m) ---
-        mean = cv.boxFilter(image_gray, ddepth=-1,
-                            ksize=(window_size, window_size),
-                            normalize=True)
-        
-        # --- 4. Tính Local Standard Deviation (Std - s) ---
-        image_sq = image_gray ** 2
-        mean_sq = cv.boxFilter(image_sq, ddepth=-1,
-                               ksize=(window_size, window_size),
-                               normalize=True)
-        # Đảm bảo phương sai không âm trước khi lấy căn
-        variance = np.maximum(mean_sq - mean**2, 0)
-        std = np.sqrt(variance)
-
-        # --- 5. Tính ngưỡng Sauvola ---
-        thresholes = mean * (1 + k * ((std/R) - 1.0))
-
-        # --- 6. Giới hạn ngưỡng trong [0, 255] cho an toàn
-        thresholes = np.clip(thresholes, 0, 255)
-
-        # --- 7. Nhị phân hóa ---
-        binary_image = np.where(image_gray < thresholes, 0, 255).astype(np.uint8)
-
-        return binary_image
\ No newline at end of file
+            bands = [(0, h)]
+            band_rows = None
+
+        def local_stats(window, y0, y1):
+            """(mean, std) float32 của các hàng [y0, y1)."""
+            if band_rows is None and context is not None:
+                mean, mean_sq = context.local_stats(window, gray)
+            else:
+                a0, a1 = max(0, y0 - window // 2), min(h, y1 + window // 2)
+                band = gray[a0:a1].astype(np.float32)
+                mean = cv.boxFilter(band, ddepth=-1, ksize=(window, window), normalize=True)
+                np.multiply(band, band, out=band)
+                mean_sq = cv.boxFilter(band, ddepth=-1, ksize=(window, window), normalize=True)
+                mean, mean_sq = mean[y0 - a0:y1 - a0], mean_sq[y0 - a0:y1 - a0]
+            # Phương sai không âm trước khi lấy căn (mảng mới, không sửa mảng dùng chung)
+            std = mean * mean
+            np.subtract(mean_sq, std, out=std)
+            np.maximum(std, 0, out=std)
+            np.sqrt(std, out=std)
+            return mean, std
+
+        # --- 2. Wolf cần min toàn ảnh và std lớn nhất của từng cửa sổ ---
+        wolf_windows = {spec[2] for spec in specs if spec[1] == "wolf"}
+        gray_min = float(gray.min()) if wolf_windows else 0.0
+        max_std = {}
+        if wolf_windows and band_rows is not None:
+            for window in wolf_windows:
+                max_std[window] = max(float(local_stats(window, y0, y1)[1].max())
+                                      for y0, y1 in bands)
+
+        # --- 3. Tính ngưỡng và nhị phân hóa từng dải, ghi thẳng vào ảnh uint8 ---
+        outputs = {spec[0]: np.empty(gray.shape, dtype=np.uint8) for spec in specs}
+        for y0, y1 in bands:
+            src = gray[y0:y1]
+            for window in windows:
+                mean, std = local_stats(window, y0, y1)
+                if window in wolf_windows and window not in max_std:
+                    max_std[window] = float(std.max())
+                for name, method, w, opts in specs:
+                    if w != window:
+                        continue
+                    k = opts["k"]
+                    if method == "sauvola":
+                        T = std / opts["R"]
+                        T -= 1.0
+                        T *= k
+                        T += 1.0
+                        T *= mean
+                    elif method == "niblack":
+                        T = std * k
+                        T += mean
+                    elif method == "wolf":
+                        T = std / max(max_std[window], 1e-6)
+                        np.subtract(1.0, T, out=T)
+                        T *= k
+                        T *= mean - gray_min
+                        np.subtract(mean, T, out=T)
+                    else:  # phansalkar
+                        T = std * (k / (255.0 * opts["R"]))
+                        T += 1.0 - k
+                        T += opts["p"] * np.exp(mean * (-opts["q"] / 255.0))
+                        T *= mean
+                    # Giới hạn ngưỡng trong [0, 255]; chữ (< T) -> 0, nền -> 255
+                    np.clip(T, 0, 255, out=T)
+                    dst = outputs[name][y0:y1]
+                    np.greater_equal(src, T, out=dst.view(bool))
+                    dst *= 255
+                    del T
+        return outputs
+
+    def segment(self, image, min_area=500, min_glyph_area=4, word_gap=0.6, line_gap=2.0,
+                line_height=0.5, block_gap=2.0, context=None):
+        """
+        Phân đoạn trang: connected components (glyph) -> từ -> dòng -> khối.
+        Gom nhóm bằng giãn nở (dilate) mask mực theo bội số chiều cao glyph trung vị:
+            từ  : giãn ngang word_gap * h, dọc line_height * h
+            dòng: giãn ngang line_gap * h, dọc line_height * h (gộp dấu chấm / dấu thanh vào dòng)
+            khối: giãn ngang line_gap * h, dọc block_gap * h
+        (kernel lồng nhau nên mỗi từ thuộc đúng 1 dòng, mỗi dòng thuộc đúng 1 khối).
+
+        Args:
+            image (np.ndarray) : ảnh nhị phân (chữ 0 trên nền 255) hoặc ảnh xám (Otsu).
+            min_area (int) : diện tích bbox tối thiểu của khối (khối nhỏ hơn bị bỏ cùng glyph của nó)
+            min_glyph_area (int) : glyph ít pixel hơn bị coi là nhiễu
+            context (PageContext) : Nếu có, lấy mask mực và connected components từ context
+        Returns:
+            dict dạng struct-of-arrays (mỗi cấp là dict các mảng numpy, không có object cho từng vùng):
+                "shape"  : (h, w) của ảnh
+                "glyphs" : {"bbox" (N, 4) int32 [x, y, w, h], "area", "word", "line", "block"}
+                "words"  : {"bbox", "line", "block"}
+                "lines"  : {"bbox", "block"}
+                "blocks" : {"bbox"}
+            Id được đánh theo thứ tự đọc (khối: trên -> dưới, trái -> phải; dòng: trên -> dưới;
+            từ / glyph: trái -> phải) và glyph được sắp xếp theo (khối, dòng, từ).
+            Ảnh con lấy bằng crop() / iter_crops() (view, không copy).
+        """
+        if image is None:
+            raise ValueError("Input image is None!")
+        gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY) if image.ndim > 2 else image
+        if gray.dtype != np.uint8:
+            gray = np.clip(gray, 0, 255).astype(np.uint8)
+
+        # --- 1. Connected components của mask mực (ảnh nhị phân: Otsu đảo = đảo 0/255) ---
+        if context is not None:
+            ink = context.otsu_ink(gray)
+            cc = context.components(ink)
+            num_labels, labels, stats = cc["num_labels"], cc["labels"], cc["stats"]
+        else:
+            _, ink = cv.threshold(gray, 0, 255, cv.THRESH_BINARY_INV + cv.THRESH_OTSU)
+            num_labels, labels, stats, _ = cv.connectedComponentsWithStats(ink, connectivity=8)
+
+        keep = stats[:, cv.CC_STAT_AREA] >= min_glyph_area
+        keep[0] = False
+        glyph_labels = np.flatnonzero(keep)
+        if len(glyph_labels) == 0:
+            return self._empty_segments(gray.shape)
+
+        # --- 2. Mask các glyph giữ lại + 1 pixel đại diện cho mỗi glyph ---
+        lut = np.where(keep, 255, 0).astype(np.uint8)
+        mask = lut[labels]
+        ink_idx = np.flatnonzero(mask)
+        rep = np.zeros(num_labels, dtype=np.int64)
+        rep[labels.ravel()[ink_idx]] = ink_idx
+        rep = rep[glyph_labels]
+        del ink_idx
+
+        stats = stats[glyph_labels]
+        bbox = stats[:, :4].astype(np.int32)
+        area = stats[:, cv.CC_STAT_AREA].astype(np.int32)
+        h = max(1.0, float(np.median(bbox[:, 3])))
+
+        # --- 3. Gom nhóm: label của vùng giãn nở tại pixel đại diện ---
+        def group(kx, ky):
+            kernel = cv.getStructuringElement(cv.MORPH_RECT,
+                                              (max(1, int(round(kx * h))), max(1, int(round(ky * h)))))
+            _, grouped = cv.connectedComponents(cv.dilate(mask, kernel), connectivity=8)
+            return grouped.ravel()[rep]
+
+        raw_word = group(word_gap, line_height)
+        raw_line = group(line_gap, line_height)
+        raw_block = group(line_gap, block_gap)
+        del mask
+
+        # --- 4. Bỏ khối quá nhỏ ---
+        block, block_bbox = self._group_bboxes(bbox, raw_block)
+        small = block_bbox[:, 2].astype(np.int64) * block_bbox[:, 3] < min_area
+        if small.any():
+            sel = ~small[block]
+            if not sel.any():
+                return self._empty_segments(gray.shape)
+            bbox, area = bbox[sel], area[sel]
+            raw_word, raw_line, raw_block = raw_word[sel], raw_line[sel], raw_block[sel]
+            block, block_bbox = self._group_bboxes(bbox, raw_block)
+
+        # --- 5. Đánh id theo thứ tự đọc ---
+        block, block_bbox = self._reorder(block, block_bbox, (block_bbox[:, 0], block_bbox[:, 1]))
+        line, line_bbox = self._group_bboxes(bbox, raw_line)
+        line_block = np.empty(len(line_bbox), dtype=np.int32)
+        line_block[line] = block
+        line, line_bbox, line_block = self._reorder(line, line_bbox,
+                                                    (line_bbox[:, 1], line_block), line_block)
+        word, word_bbox = self._group_bboxes(bbox, raw_word)
+        word_line = np.empty(len(word_bbox), dtype=np.int32)
+        word_line[word] = line
+        word, word_bbox, word_line = self._reorder(word, word_bbox,
+                                                   (word_bbox[:, 0], word_line), word_line)
+
+        order = np.lexsort((bbox[:, 0], word))
+        return {
+            "shape": gray.shape[:2],
+            "glyphs": {"bbox": bbox[order], "area": area[order], "word": word[order],
+                       "line": line[order], "block": block[order]},
+            "words": {"bbox": word_bbox, "line": word_line, "block": line_block[word_line]},
+            "lines": {"bbox": line_bbox, "block": line_block},
+            "blocks": {"bbox": block_bbox},
+        }
+
+    @staticmethod
+    def _group_bboxes(bbox, raw_ids):
+        """Id liên tục (0..n-1) cho mỗi phần tử + bbox bao của từng nhóm (n, 4)."""
+        _, ids = np.unique(raw_ids, return_inverse=True)
+        ids = ids.astype(np.int32).ravel()
+        n = int(ids.max()) + 1
+        x0 = np.full(n, np.iinfo(np.int32).max, dtype=np.int32)
+        y0 = x0.copy()
+        x1 = np.zeros(n, dtype=np.int32)
+        y1 = x1.copy()
+        np.minimum.at(x0, ids, bbox[:, 0])
+        np.minimum.at(y0, ids, bbox[:, 1])
+        np.maximum.at(x1, ids, bbox[:, 0] + bbox[:, 2])
+        np.maximum.at(y1, ids, bbox[:, 1] + bbox[:, 3])
+        return ids, np.stack([x0, y0, x1 - x0, y1 - y0], axis=1)
+
+    @staticmethod
+    def _reorder(ids, group_bbox, keys, *per_group):
+        """Đánh lại id nhóm theo thứ tự np.lexsort(keys) (khóa cuối là khóa chính)."""
+        order = np.lexsort(keys)
+        rank = np.empty(len(order), dtype=np.int32)
+        rank[order] = np.arange(len(order), dtype=np.int32)
+        return (rank[ids], group_bbox[order]) + tuple(a[order] for a in per_group)
+
+    @staticmethod
+    def _empty_segments(shape):
+        box = np.zeros((0, 4), dtype=np.int32)
+        ids = np.zeros(0, dtype=np.int32)
+        return {
+            "shape": shape[:2],
+            "glyphs": {"bbox": box, "area": ids, "word": ids, "line": ids, "block": ids},
+            "words": {"bbox": box, "line": ids, "block": ids},
+            "lines": {"bbox": box, "block": ids},
+            "blocks": {"bbox": box},
+        }
+
+    @staticmethod
+    def crop(image, segments, index, level="lines", pad=0):
+        """Ảnh con (view, không copy) của vùng index ở cấp level ("glyphs"/"words"/"lines"/"blocks")."""
+        x, y, w, h = (int(v) for v in segments[level]["bbox"][index])
+        H, W = image.shape[:2]
+        return image[max(0, y - pad):min(H, y + h + pad), max(0, x - pad):min(W, x + w + pad)]
+
+    def iter_crops(self, image, segments, level="lines", pad=0):
+        """Duyệt lần lượt các ảnh con (view) của 1 cấp, theo thứ tự id."""
+        for i in range(len(segments[level]["bbox"])):
+            yield self.crop(image, segments, i, level, pad)
@@ -1,8 +1,294 @@
+import numpy as np
+import cv2 as cv
+from concurrent.futures import ProcessPoolExecutor
+
+from src.utils.io import IOManager
+
+# Số lượt tách đoạn có sai số lớn rồi khớp lại
+_MAX_SPLIT_ROUNDS = 4
+# Đoạn có ít điểm hơn -> không tách tiếp, khớp thành đoạn thẳng
+_MIN_SPLIT_POINTS = 8
+# Số đường (compound path) mỗi lô gửi cho 1 tiến trình worker
+_PATHS_PER_CHUNK = 512
+# Tổng số điểm contour tối thiểu để tự mở process pool (khớp ~3 us/điểm, khởi động pool
+# ~0.3-0.5 s: trang ít hơn chạy tuần tự nhanh hơn)
+_MIN_PARALLEL_POINTS = 400_000
+
+
+def _bernstein(t):
+    """4 đa thức Bernstein bậc 3 tại t: (b0, b1, b2, b3)."""
+    s = 1.0 - t
+    return s * s * s, 3.0 * s * s * t, 3.0 * s * t * t, t * t * t
+
+
+def fit_cubic_segments(points, starts, ends):
+    """
+    Khớp Bezier bậc 3 cho nhiều đoạn cùng lúc bằng bình phương tối thiểu.
+    Đoạn j gồm các điểm points[starts[j] .. ends[j]] (kể cả 2 đầu); P0, P3 cố định ở 2 đầu,
+    P1, P2 là nghiệm hệ 2x2 (tham số hóa theo độ dài dây cung) - mọi hệ được cộng dồn bằng
+    bincount và giải cùng lúc, không lặp Python theo từng đoạn.
+
+    Trả về (ctrl, err, split): ctrl (S, 4, 2) float64 [P0, P1, P2, P3]; err (S,) sai số lớn nhất
+    và split (S,) chỉ số điểm (trong points) có sai số lớn nhất của từng đoạn.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    n_seg = len(starts)
+
+    # Trải các đoạn thành 1 mảng chỉ số liên tục (điểm đầu / cuối dùng chung giữa 2 đoạn)
+    counts = ends - starts + 1
+    seg = np.repeat(np.arange(n_seg), counts)
+    idx = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + starts[seg]
+    p = points[idx]
+
+    # Tham số t theo độ dài dây cung
+    step = np.zeros(len(points))
+    step[1:] = np.hypot(*(points[1:] - points[:-1]).T)
+    cum = np.cumsum(step)
+    length = cum[ends] - cum[starts]
+    t = (cum[idx] - cum[starts][seg]) / np.maximum(length, 1e-12)[seg]
+
+    b0, b1, b2, b3 = _bernstein(t)
+    P0, P3 = points[starts], points[ends]
+    r = p - b0[:, np.newaxis] * P0[seg] - b3[:, np.newaxis] * P3[seg]
+
+    def total(w):
+        return np.bincount(seg, weights=w, minlength=n_seg)
+
+    a11, a12, a22 = total(b1 * b1), total(b1 * b2), total(b2 * b2)
+    c1 = np.stack([total(b1 * r[:, 0]), total(b1 * r[:, 1])], axis=1)
+    c2 = np.stack([total(b2 * r[:, 0]), total(b2 * r[:, 1])], axis=1)
+    det = a11 * a22 - a12 * a12
+
+    # Đoạn quá ngắn / suy biến -> đoạn thẳng (P1, P2 ở 1/3 và 2/3)
+    line = (counts < 4) | (np.abs(det) < 1e-9)
+    det = np.where(line, 1.0, det)[:, np.newaxis]
+    P1 = (a22[:, np.newaxis] * c1 - a12[:, np.newaxis] * c2) / det
+    P2 = (a11[:, np.newaxis] * c2 - a12[:, np.newaxis] * c1) / det
+    P1[line] = (2.0 * P0[line] + P3[line]) / 3.0
+    P2[line] = (P0[line] + 2.0 * P3[line]) / 3.0
+    ctrl = np.stack([P0, P1, P2, P3], axis=1)
+
+    # Sai số: khoảng cách từ điểm tới B(t) tương ứng, lấy lớn nhất trên từng đoạn
+    fit = (b0[:, np.newaxis] * P0[seg] + b1[:, np.newaxis] * P1[seg]
+           + b2[:, np.newaxis] * P2[seg] + b3[:, np.newaxis] * P3[seg])
+    dist = np.hypot(*(fit - p).T)
+    first = np.cumsum(counts) - counts
+    err = np.maximum.reduceat(dist, first) if len(first) else np.zeros(0)
+    order = np.lexsort((-dist, seg))
+    split = idx[order[first]]
+    return ctrl, err, split
+
+
+def _fit_paths(contours, path_sizes, tolerance, fit_tolerance):
+    """
+    Khớp 1 lô contour (chạy trong tiến trình worker): đơn giản hóa bằng approxPolyDP, rồi khớp
+    Bezier cho mọi đoạn giữa 2 đỉnh liên tiếp cùng lúc; đoạn sai số > fit_tolerance được tách
+    tại điểm xa nhất và khớp lại (tối đa _MAX_SPLIT_ROUNDS lượt).
+    Trả về dict struct-of-arrays như Vectorizer.vectorize() (không có "width", "height").
+    """
+    n_paths = len(contours)
+    approx = [cv.approxPolyDP(c, tolerance, True).reshape(-1, 2) for c in contours]
+    lens = np.array([len(c) for c in contours], dtype=np.int64)
+    n_vert = np.array([len(a) for a in approx], dtype=np.int64)
+    pts = np.concatenate(contours).reshape(-1, 2).astype(np.int64)
+    verts = np.concatenate(approx).astype(np.int64)
+    pt_owner = np.repeat(np.arange(n_paths), lens)
+    v_owner = np.repeat(np.arange(n_paths), n_vert)
+    first_pt = np.cumsum(lens) - lens
+    first_v = np.cumsum(n_vert) - n_vert
+    local = np.arange(len(pts)) - first_pt[pt_owner]
+
+    # Khóa (contour, y, x) của từng điểm contour dày; sắp theo (khóa, vị trí trên contour)
+    # để mọi lần xuất hiện của 1 pixel trong cùng contour nằm liền nhau, tăng dần theo vị trí
+    span = pts.max(axis=0) + 1
+    pt_keys = (pt_owner * span[1] + pts[:, 1]) * span[0] + pts[:, 0]
+    v_keys = (v_owner * span[1] + verts[:, 1]) * span[0] + verts[:, 0]
+    order = np.lexsort((local, pt_keys))
+    sorted_keys, sorted_pos = pt_keys[order], local[order]
+    lo = np.searchsorted(sorted_keys, v_keys, side="left")
+    hi = np.searchsorted(sorted_keys, v_keys, side="right")
+
+    # Chỉ số các đỉnh approx trên contour dày (approx là dãy con theo đúng thứ tự của contour):
+    # mỗi đỉnh lấy lần xuất hiện sớm nhất không trước đỉnh khớp liền trước; đỉnh không còn lần
+    # xuất hiện nào phù hợp bị bỏ. Mỗi lượt đẩy các đỉnh vi phạm sang lần xuất hiện kế tiếp -
+    # chỉ pixel bị contour đi qua nhiều lần (nét mảnh 1 pixel) mới cần thêm lượt.
+    choice, found = lo.copy(), hi > lo
+    v_base = v_owner * (lens.max() + 1)
+    while True:
+        vidx = sorted_pos[np.minimum(choice, len(sorted_pos) - 1)]
+        # Vị trí của đỉnh khớp gần nhất phía trước trong cùng contour (0 nếu chưa có)
+        reached = np.maximum.accumulate(np.where(found, vidx, 0) + v_base) - v_base
+        prev = np.zeros_like(reached)
+        prev[1:] = reached[:-1]
+        prev[first_v] = 0
+        behind = found & (vidx < prev)
+        if not behind.any():
+            break
+        choice[behind] += 1
+        found &= choice < hi
+
+    # Điểm gãy của từng contour: 0, các đỉnh khớp (trừ đỉnh đầu nếu trùng 0), len(c)
+    n_found = np.cumsum(found)
+    first_found = found & (n_found - (n_found - found)[first_v][v_owner] == 1)
+    keep = found & ~(first_found & (vidx == 0))
+    owner = np.concatenate([np.arange(n_paths), v_owner[keep], np.arange(n_paths)])
+    rank = np.concatenate([np.full(n_paths, -1), np.flatnonzero(keep), np.full(n_paths, len(verts))])
+    pos = np.concatenate([np.zeros(n_paths, np.int64), vidx[keep], lens])
+    by_contour = np.lexsort((rank, owner))
+    owner, pos = owner[by_contour], pos[by_contour]
+
+    # Contour đóng: thêm điểm đầu vào cuối để đoạn cuối kết thúc tại điểm đầu
+    first_closed = first_pt + np.arange(n_paths)
+    points = np.empty((len(pts) + n_paths, 2), dtype=np.float64)
+    points[first_closed[pt_owner] + local] = pts
+    points[first_closed + lens] = pts[first_pt]
+    points += 0.5  # tâm pixel
+
+    # Đoạn j: 2 điểm gãy liên tiếp trong cùng contour
+    breaks = pos + first_closed[owner]
+    same = owner[1:] == owner[:-1]
+    starts, ends, owner = breaks[:-1][same], breaks[1:][same], owner[:-1][same]
+
+    for _ in range(_MAX_SPLIT_ROUNDS + 1):
+        ctrl, err, split = fit_cubic_segments(points, starts, ends)
+        bad = (err > fit_tolerance) & (ends - starts + 1 >= _MIN_SPLIT_POINTS)
+        if not bad.any():
+            break
+        # Tách đoạn xấu thành [start, split] + [split, end], giữ thứ tự theo contour
+        starts = np.concatenate([starts, split[bad]])
+        ends = np.concatenate([ends, ends[bad]])
+        ends[np.flatnonzero(bad)] = split[bad]
+        owner = np.concatenate([owner, owner[bad]])
+        order = np.lexsort((starts, owner))
+        starts, ends, owner = starts[order], ends[order], owner[order]
+    else:
+        ctrl, err, split = fit_cubic_segments(points, starts, ends)
+
+    seg_counts = np.bincount(owner, minlength=len(contours))
+    first = np.cumsum(seg_counts) - seg_counts
+    return {
+        "start": ctrl[first, 0].astype(np.float32),
+        "ctrl": ctrl[:, 1:].astype(np.float32),
+        "is_line": (ends - starts + 1) < 4,
+        "seg_offset": np.concatenate([[0], np.cumsum(seg_counts)]).astype(np.int64),
+        "path_offset": np.concatenate([[0], np.cumsum(path_sizes)]).astype(np.int64),
+    }
+
+
+def _fit_paths_job(args):
+    return _fit_paths(*args)
+
+
 class Vectorizer:
     def fit_bezier(self, points: np.ndarray):
-        """Khớp chuỗi điểm thành đường cong Bezier bậc 3."""
-        pass
+        """Khớp chuỗi điểm thành đường cong Bezier bậc 3 (trả về (4, 2): P0, P1, P2, P3)."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(points) < 2:
+            raise ValueError("Need at least 2 points to fit a Bezier curve!")
+        ctrl, _, _ = fit_cubic_segments(points, [0], [len(points) - 1])
+        return ctrl[0]
+
+    def trace(self, binary_image: np.ndarray, min_area: float = 4.0):
+        """
+        Dò contour 1 lần cho cả trang (RETR_CCOMP: viền ngoài + lỗ của từng glyph),
+        bỏ contour có bbox nhỏ hơn min_area pixel.
+        Trả về (contours, path_sizes): contour được sắp theo compound path (viền ngoài rồi
+        các lỗ của nó), path_sizes là số contour của mỗi compound path.
+        """
+        if binary_image is None:
+            raise ValueError("Input image is None!")
+        gray = cv.cvtColor(binary_image, cv.COLOR_BGR2GRAY) if binary_image.ndim > 2 else binary_image
+        if gray.dtype != np.uint8:
+            gray = np.clip(gray, 0, 255).astype(np.uint8)
+        # Mực = lớp tối (ảnh nhị phân chữ 0 trên nền 255 -> Otsu đảo = đảo 0/255)
+        _, ink = cv.threshold(gray, 0, 255, cv.THRESH_BINARY_INV + cv.THRESH_OTSU)
+
+        contours, hierarchy = cv.findContours(ink, cv.RETR_CCOMP, cv.CHAIN_APPROX_NONE)
+        if not contours:
+            return [], np.zeros(0, dtype=np.int64)
+        hierarchy = hierarchy[0]
+        # Diện tích bbox (không dùng contourArea: nét mảnh 1 pixel có diện tích contour = 0)
+        areas = np.array([w * h for _, _, w, h in map(cv.boundingRect, contours)])
+
+        ordered, sizes = [], []
+        for i in np.flatnonzero(hierarchy[:, 3] < 0):  # viền ngoài
+            if areas[i] < min_area:
+                continue
+            group = [contours[i]]
+            child = hierarchy[i, 2]
+            while child >= 0:
+                if areas[child] >= min_area:
+                    group.append(contours[child])
+                child = hierarchy[child, 0]
+            ordered.extend(group)
+            sizes.append(len(group))
+        return ordered, np.asarray(sizes, dtype=np.int64)
+
+    def vectorize(self, binary_image: np.ndarray, tolerance: float = 1.0,
+                  fit_tolerance: float = 1.0, min_area: float = 4.0, workers: int = 1,
+                  pool=None) -> dict:
+        """
+        Vector hóa ảnh nhị phân: dò contour -> đơn giản hóa (approxPolyDP, tolerance pixel)
+        -> khớp Bezier bậc 3 theo lô (sai số tối đa ~ fit_tolerance pixel).
+        workers > 1: chia các glyph thành lô, khớp song song trên nhiều tiến trình - chỉ khi
+        trang đủ nhiều điểm contour (_MIN_PARALLEL_POINTS), trang nhỏ chạy tuần tự.
+        pool: Executor do nơi gọi quản lý (dùng lại cho nhiều trang, không phải khởi động
+        tiến trình mỗi lần gọi); nếu có thì luôn dùng khi có từ 2 lô trở lên, bỏ qua workers.
+
+        Trả về dict struct-of-arrays (dùng trực tiếp cho IOManager.save_svg):
+            "width", "height" : kích thước ảnh
+            "start"       : (C, 2) float32 điểm đầu của từng contour
+            "ctrl"        : (S, 3, 2) float32 P1, P2, P3 của từng đoạn Bezier (P0 = điểm cuối đoạn trước)
+            "is_line"     : (S,) bool, đoạn thẳng (có thể ghi bằng lệnh L)
+            "seg_offset"  : (C + 1,) đoạn của contour c là ctrl[seg_offset[c]:seg_offset[c + 1]]
+            "path_offset" : (P + 1,) contour của compound path p (viền ngoài + lỗ)
+        """
+        h, w = binary_image.shape[:2]
+        contours, sizes = self.trace(binary_image, min_area=min_area)
+        if not contours:
+            return {"width": w, "height": h,
+                    "start": np.zeros((0, 2), np.float32), "ctrl": np.zeros((0, 3, 2), np.float32),
+                    "is_line": np.zeros(0, bool), "seg_offset": np.zeros(1, np.int64),
+                    "path_offset": np.zeros(1, np.int64)}
+
+        # Chia theo compound path (không tách viền ngoài khỏi lỗ của nó)
+        path_first = np.concatenate([[0], np.cumsum(sizes)])
+        jobs = []
+        for p0 in range(0, len(sizes), _PATHS_PER_CHUNK):
+            p1 = min(p0 + _PATHS_PER_CHUNK, len(sizes))
+            jobs.append((contours[path_first[p0]:path_first[p1]], sizes[p0:p1],
+                         tolerance, fit_tolerance))
+
+        if pool is not None and len(jobs) > 1:
+            parts = list(pool.map(_fit_paths_job, jobs))
+        elif (workers > 1 and len(jobs) > 1
+              and sum(len(c) for c in contours) >= _MIN_PARALLEL_POINTS):
+            with ProcessPoolExecutor(max_workers=workers) as own_pool:
+                parts = list(own_pool.map(_fit_paths_job, jobs))
+        else:
+            parts = [_fit_paths_job(job) for job in jobs]
+        return self._merge(parts, w, h)
+
+    @staticmethod
+    def _merge(parts, width, height):
+        """Nối kết quả các lô, dịch offset cho liên tục."""
+        seg_offset, path_offset = [np.zeros(1, np.int64)], [np.zeros(1, np.int64)]
+        for part in parts:
+            seg_offset.append(part["seg_offset"][1:] + seg_offset[-1][-1])
+            path_offset.append(part["path_offset"][1:] + path_offset[-1][-1])
+        return {
+            "width": width,
+            "height": height,
+            "start": np.concatenate([part["start"] for part in parts]),
+            "ctrl": np.concatenate([part["ctrl"] for part in parts]),
+            "is_line": np.concatenate([part["is_line"] for part in parts]),
+            "seg_offset": np.concatenate(seg_offset),
+            "path_offset": np.concatenate(path_offset),
+        }
 
-    def image_to_svg(self, binary_image: np.ndarray, output_path: str):
-        """Chuyển ảnh bitmap sang file SVG."""
-        pass
\ No newline at end of file
+    def image_to_svg(self, binary_image: np.ndarray, output_path: str, **kwargs):
+        """Chuyển ảnh bitmap sang file SVG (kwargs truyền cho vectorize())."""
+        paths = self.vectorize(binary_image, **kwargs)
+        return IOManager.save_svg(paths, output_path, paths["width"], paths["height"])
@@ -1,105 +1,146 @@
+import time
+import tracemalloc
+
+import cv2 as cv
+import numpy as np
+
 from src.core.preprocessor import Preprocessor
 from src.core.denoiser import ImageDenoiser
 from src.core.enhancer import ImageEnhancer
 from src.core.geometry import GeometryCorrector
+from src.core.deskewer import Deskewer
 from src.core.dewarp import PageDewarper
 from src.core.segmentor import DocumentSegmentor
 from src.core.layout import LayoutAnalyzer
+from src.core.forenstic import ForensicInk
+from src.core.context import PageContext
+from src.utils.cache import StageCache
 
 
 class DocumentRestorationPipeline:
-    def __init__(self):
+    # Thứ tự các giai đoạn trong run(), mỗi giai đoạn là một method _<tên>
+    STAGES = ("preprocess", "geometry", "restore", "enhance", "segment")
+    # Các chế độ giữ ảnh trung gian (params["retain"]), ngoài ra có thể truyền list tên ảnh
+    RETAIN_MODES = ("all", "final", "thumbnails")
+    # Các params ảnh hưởng tới kết quả của từng giai đoạn (dùng làm khóa cache).
+    # Params không khai báo ở đâu cả được tính vào khóa của mọi giai đoạn cho an toàn.
+    STAGE_PARAMS = {
+        "preprocess": ("assume_rgb", "resize_max", "equalize",
+                       "forensic_ink", "ink_transform", "ink_sample_size",
+                       "x_height_normalize", "target_x_height"),
+        "geometry": ("deskew", "skew_angle", "page_corners", "detect_page", "dewarp",
+                     "dewarp_cache_key", "dewarp_grid_step", "analysis_max_side"),
+        "restore": ("denoise", "denoise_method", "denoise_strength", "median_ksize",
+                    "inpaint", "inpaint_mask", "remove_shadows", "shadow_kernel",
+                    "shadow_method", "shadow_downsample", "analysis_max_side"),
+        "enhance": ("enhance_constrast", "clip_limit", "binarize", "block_size", "threshold_C",
+                    "threshold_method", "threshold_variants", "threshold_band_rows"),
+        "segment": ("seg_min_area",),
+    }
+    # Tham số kích thước (pixel) được chuẩn hóa theo x-height khi x_height_normalize="kernels":
+    # tên -> (giá trị mặc định ở x-height chuẩn, số mũ: 1 = độ dài, 2 = diện tích).
+    # "window_size" của từng biến thể trong threshold_variants cũng được nhân như block_size.
+    # Cố ý không chuẩn hóa: Preprocessor.filter_small_blobs (min_area, min_height) không phải
+    # bước của pipeline - nơi gọi tự nhân với results["meta"]["kernel_scale"] nếu cần;
+    # min_glyph_area của segment (4 px) chỉ loại nhiễu 1-2 pixel, không phụ thuộc cỡ chữ.
+    SIZED_PARAMS = {"shadow_kernel": (51, 1), "block_size": (35, 1), "seg_min_area": (500, 2)}
+    # Params chỉ ảnh hưởng tới cách lưu kết quả (áp dụng cho mọi giai đoạn)
+    OUTPUT_PARAMS = ("retain", "thumbnail_max_side")
+    # Params không ảnh hưởng tới kết quả
+    NEUTRAL_PARAMS = ("tile_size", "tile_workers", "measure_memory")
+
+    def __init__(self, cache: StageCache = None):
         # Khởi tạo các worker
         self.prep = Preprocessor()
         self.denoiser = ImageDenoiser()
         self.geo = GeometryCorrector()
+        self.deskewer = Deskewer()
         self.dewarp = PageDewarper()
         self.enhancer = ImageEnhancer()
         self.seg = DocumentSegmentor()
         self.layout = LayoutAnalyzer()
+        self.forensic = ForensicInk()
+        # Cache kết quả từng giai đoạn (tùy chọn), ví dụ StageCache(max_bytes=1 << 30)
+        self.cache = cache
 
+    def run_stage(self, stage, img, params, results, context=None):
+        """Chạy riêng 1 giai đoạn (dùng cho run() và cho benchmark).
+        Nhận ảnh đầu ra của giai đoạn trước, trả về ảnh đầu ra của giai đoạn này,
+        đồng thời ghi các intermediate vào results["images"].
+        context: PageContext dùng chung giữa các giai đoạn của 1 trang (None = tạo mới)."""
+        if stage not in self.STAGES:
+            raise ValueError(f"Unknown stage: {stage}")
+        if context is None:
+            context = PageContext()
+        context.update(img)
+        return getattr(self, f"_{stage}")(img, params, results, context)
 
-    def run(self, image, params={}):
+    def run(self, image, params=None):
         """Chạy luồng xử lý chính cho 1 ảnh tài liệu
         Trả về dict chứa ảnh/intermediate results và các metadata (sizes, times)
-        params: dict (tùy chỉnh ngưỡng/bật tắt các bước)"""
-        import time
+        params: dict (tùy chỉnh ngưỡng/bật tắt các bước)
+            params["retain"]: ảnh trung gian nào được giữ lại trong results["images"]
+                - "all" (mặc định): giữ tất cả ở độ phân giải gốc (dùng cho app)
+                - "final": chỉ giữ ảnh final (dùng cho batch/server)
+                - "thumbnails": ảnh trung gian thu nhỏ (params["thumbnail_max_side"]), final giữ nguyên
+                - list/tuple/set tên ảnh: chỉ giữ các ảnh có tên trong đó (+ final)
+            results["meta"]["peak_retained_bytes"]: tổng nbytes lớn nhất của các ảnh trung gian
+            được giữ + ảnh đầu ra của giai đoạn đang xét - chỉ là ước lượng theo kích thước mảng,
+            không phải bộ nhớ thường trú thực của tiến trình (mảng tạm bên trong từng bước không
+            được tính).
+            params["measure_memory"]: True để đo đỉnh cấp phát thực của trang bằng tracemalloc
+            -> results["meta"]["peak_traced_bytes"] (mọi mảng NumPy/đối tượng Python được cấp phát
+            trong lúc chạy, kể cả mảng tạm; bộ đệm nội bộ của OpenCV không trả về Python thì
+            không thấy). Tắt mặc định vì tracemalloc làm chậm và là trạng thái chung của tiến trình
+            (chạy nhiều trang song song trong cùng tiến trình thì số đo lẫn nhau).
+            params["tile_size"], params["tile_workers"]: xử lý các bước cục bộ theo tile
+            (bộ nhớ tạm tỉ lệ với tile thay vì cả trang) trên thread pool.
+            params["x_height_normalize"]: chuẩn hóa theo cỡ chữ (x-height ước lượng từ connected
+            component, so với params["target_x_height"], mặc định 20 px):
+                - "resize": thu nhỏ trang quá phân giải về x-height chuẩn ngay sau bước xám
+                - "kernels": giữ nguyên ảnh, nhân các tham số kích thước (SIZED_PARAMS) theo tỉ lệ
+            params["analysis_max_side"]: chế độ ước lượng trên proxy - các bước chỉ sinh ra vài
+            tham số (góc nghiêng, góc trang, lưới cong, nền bóng đổ) chạy trên ảnh thu nhỏ
+            (cạnh dài <= giá trị này), kết quả được phóng về và áp dụng 1 lần lên ảnh đầy đủ.
+            params["threshold_method"]: "mean" (mặc định) / "gaussian" (Preprocessor.adaptive_threshold)
+            hoặc "sauvola" / "niblack" / "wolf" / "phansalkar" (DocumentSegmentor.binarize_multi);
+            params["threshold_variants"]: nhiều biến thể cùng lúc (biến thể đầu là đầu ra),
+            params["threshold_band_rows"]: nhị phân hóa theo dải ngang cho trang lớn.
+            Nếu pipeline có cache, giai đoạn nào có đầu vào + params không đổi sẽ lấy lại
+            kết quả cũ (results["meta"]["cache_hits"] liệt kê các giai đoạn trúng cache)."""
         if params is None:
             params = {}
-        results = {"meta": {}, "images": {}}
+        results = {"meta": {"retained_bytes": 0, "peak_retained_bytes": 0}, "images": {}}
         t0 = time.time()
+        measure = bool(params.get("measure_memory", False))
+        started_tracing = False
+        if measure:
+            # Nếu đã có ai đó bật tracemalloc (ví dụ benchmark) thì chỉ đo phần tăng thêm
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            traced_base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
 
         try:
+            retain = params.get("retain", "all")
+            if isinstance(retain, str) and retain not in self.RETAIN_MODES:
+                raise ValueError(f"Unknown retain mode: {retain}")
+            img = image
+            # Dữ liệu phân tích dùng chung (components, thống kê cục bộ...), tính lười
+            # và tự xóa khi ảnh của trang thay đổi
+            context = PageContext()
+            key = self.cache.input_key(image) if self.cache is not None else None
+            for stage in self.STAGES:
+                t_stage = time.time()
+                if self.cache is None:
+                    img = self.run_stage(stage, img, params, results, context)
+                else:
+                    key = self.cache.stage_key(key, stage, self._stage_params(stage, params))
+                    img = self._run_stage_cached(stage, key, img, params, results, context)
+                results["meta"][f"t_{stage}"] = time.time() - t_stage
 
-            # ------ 1. Preprocess ------
-            img = self.prep.to_grayscale(image, 
-                                          assume_rgb=params.get("assume_rgb", True))
-            results["images"]["gray"] = img
-
-            if params.get("resize_max"):
-                img = self.prep.resize(img, max_size=params["resize_max"])
-                results["images"]["gray_resized"] = img
-
-            if params.get("equalize", True):
-                img = self.prep.equalize_histogram(img)
-                results["images"]["hist_equalized"] = img
-            results["meta"]["t_preprocess"] = time.time() - t0
-
-            # 2. ------ Geometry correction (Deskew -> Dewarp) ------
-            t_geo = time.time()
-            if params.get("deskew", True):
-                img = self.geo.deskew(img)
-                results["images"]["deskewed"] = img
-
-            if params.get("dewarp", True):
-                img = self.dewarp.dewarp_page(img,
-                                            method=params.get("dewarp_method", "mesh"))
-                results["images"]["dewarped"] = img
-            results["meta"]["t_geometry"] = time.time() - t_geo
-
-            # 3. ------ Restore (Denoise -> Shadow) ------
-            t_den = time.time()
-
-            if params.get("denoise", True):
-                img = self.denoiser.denoise(img,
-                                            method=params.get("denoise_method", "median"),
-                                            strength=params.get("denoise_strength", 1.0))
-                results["images"]["denoised"] = img
-
-            if params.get("inpaint", False):
-                img = self.denoiser.inpaint_holes(img,
-                                                  mask=params.get("inpaint_mask", None))
-                results["images"]["inpainted"] = img
-
-            # Shadow removal after denoise
-            if params.get("remove_shadows", True):
-                img = self.enhancer.remove_shadows(img)
-                results["images"]["no_shadows"] = img
-            results["meta"]["t_restore"] = time.time() - t_den
-
-            # 4. Enhance & Digitize
-            t_en = time.time()
-
-            if params.get("enhance_constrast", True):
-                img = self.enhancer.enhance_constrast(img,
-                                                    clip_limit=params.get("clip_limit", 2.0))
-                results["images"]["enhanced"] = img
-
-            if params.get("binarize", True):
-                binary = self.prep.adaptive_threshold(img,
-                                                   block_size=params.get("block_size", 35),
-                                                   C=params.get("threshold_C", 10))
-                results["images"]["binary"] = binary
-                final_img = binary
-            else:
-                final_img = img
-
-            segments = self.seg.segment(final_img,
-                                        min_area=params.get("seg_min_area", 500))
-            results["images"]["segments"] = segments
-            results["meta"]["layout"] = self.layout.analyze(segments,
-                                                            image_shape=final_img.shape)
-            results["images"]["final"] = final_img
+            self._keep("final", img, params, results)
             results["meta"]["total_time"] = time.time() - t0
             results["status"] = "ok"
 
@@ -107,4 +148,278 @@ class DocumentRestorationPipeline:
             results["status"] = "error"
             results["error"] = str(e)
 
-        return results  # Trả về dict chứa các ảnh ở từng bước
\ No newline at end of file
+        finally:
+            if measure:
+                results["meta"]["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1] - traced_base
+                if started_tracing:
+                    tracemalloc.stop()
+
+        return results  # Trả về dict chứa các ảnh ở từng bước
+
+    def _stage_params(self, stage, params):
+        """Lấy các params ảnh hưởng tới 1 giai đoạn để tạo khóa cache."""
+        declared = set(self.OUTPUT_PARAMS).union(self.NEUTRAL_PARAMS,
+                                                 *self.STAGE_PARAMS.values())
+        names = set(self.STAGE_PARAMS[stage]) | set(self.OUTPUT_PARAMS)
+        names |= {k for k in params if k not in declared}
+        return {k: params[k] for k in sorted(names, key=str) if k in params}
+
+    def _run_stage_cached(self, stage, key, img, params, results, context=None):
+        """Chạy 1 giai đoạn qua cache: trúng thì khôi phục ảnh đầu ra + intermediate + meta,
+        trượt thì chạy thật rồi lưu lại những gì giai đoạn đó sinh ra."""
+        hit = self.cache.get(key)
+        if hit is not None:
+            out, images, meta = hit
+            results["images"].update(images)
+            results["meta"].update(meta)
+            results["meta"].setdefault("cache_hits", []).append(stage)
+            self._update_memory_stats(out, results)
+            return out
+
+        images_before = set(results["images"])
+        meta_before = dict(results["meta"])
+        out = self.run_stage(stage, img, params, results, context)
+
+        images = {k: v for k, v in results["images"].items() if k not in images_before}
+        meta = {k: v for k, v in results["meta"].items()
+                if k not in ("retained_bytes", "peak_retained_bytes")
+                and (k not in meta_before or meta_before[k] is not v)}
+        self.cache.put(key, (out, images, meta))
+        return out
+
+    def _keep(self, name, img, params, results):
+        """Lưu ảnh trung gian theo chính sách params["retain"] và cập nhật
+        thống kê bộ nhớ (retained_bytes, peak_retained_bytes) trong results["meta"]."""
+        images = results["images"]
+        retain = params.get("retain", "all")
+
+        if not isinstance(img, np.ndarray):
+            # Metadata (ví dụ segments) luôn được giữ, không tính vào bộ nhớ ảnh
+            images[name] = img
+            return
+
+        if name == "final" or retain == "all":
+            images[name] = img
+        elif retain == "thumbnails":
+            images[name] = self._thumbnail(img, params.get("thumbnail_max_side", 256))
+        elif not isinstance(retain, str) and name in retain:
+            images[name] = img
+
+        self._update_memory_stats(img, results)
+
+    @staticmethod
+    def _update_memory_stats(img, results):
+        # Đếm mỗi mảng 1 lần (cùng 1 ảnh có thể được lưu dưới nhiều tên)
+        images = results["images"]
+        held = {id(a): a.nbytes for a in images.values() if isinstance(a, np.ndarray)}
+        retained = sum(held.values())
+        live = retained if id(img) in held else retained + img.nbytes
+        meta = results["meta"]
+        meta["retained_bytes"] = retained
+        meta["peak_retained_bytes"] = max(meta.get("peak_retained_bytes", 0), live)
+
+    def _sized_param(self, name, params, results):
+        """Tham số kích thước (kernel, diện tích) sau khi nhân với tỉ lệ x-height (nếu có)."""
+        default, power = self.SIZED_PARAMS[name]
+        return self._scale_size(params.get(name, default), power, results)
+
+    @staticmethod
+    def _scale_size(value, power, results):
+        """Nhân kích thước value (power: 1 = độ dài, 2 = diện tích) với tỉ lệ x-height (nếu có)."""
+        scale = results["meta"].get("kernel_scale")
+        if not scale:
+            return value
+        value = int(round(value * scale ** power))
+        # Kernel độ dài phải lẻ
+        return max(3, value | 1) if power == 1 else max(1, value)
+
+    @staticmethod
+    def _proxy_to_full(points, proxy, img):
+        """Đổi tọa độ điểm (N, 2) [x, y] trên ảnh proxy về ảnh đầy đủ (theo tâm pixel)."""
+        sx = img.shape[1] / float(proxy.shape[1])
+        sy = img.shape[0] / float(proxy.shape[0])
+        points = np.asarray(points, dtype=np.float32)
+        return np.stack([(points[:, 0] + 0.5) * sx - 0.5,
+                         (points[:, 1] + 0.5) * sy - 0.5], axis=1)
+
+    @staticmethod
+    def _thumbnail(img, max_side):
+        h, w = img.shape[:2]
+        scale = max_side / float(max(h, w))
+        if scale >= 1.0:
+            return img.copy()
+        size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+        return cv.resize(img, size, interpolation=cv.INTER_AREA)
+
+    # ------ 1. Preprocess ------
+    def _preprocess(self, image, params, results, context):
+        # Khôi phục mực phai cần ảnh màu -> chạy trước khi chuyển xám.
+        # params["ink_transform"] (từ ForensicInk.compute_transform) cho phép dùng lại
+        # cùng một phép biến đổi cho mọi trang của một bản thảo.
+        if params.get("forensic_ink", False) and image.ndim == 3 and image.shape[2] == 3:
+            ink = self.forensic.decorrelation_stretch(image,
+                                                      transform=params.get("ink_transform"),
+                                                      sample_size=params.get("ink_sample_size"))
+            self._keep("ink_restored", ink, params, results)
+
+        img = self.prep.to_grayscale(image,
+                                     assume_rgb=params.get("assume_rgb", True))
+        self._keep("gray", img, params, results)
+
+        if params.get("resize_max"):
+            img = self.prep.make_proxy(img, max_side=params["resize_max"])
+            self._keep("gray_resized", img, params, results)
+
+        mode = params.get("x_height_normalize")
+        if mode:
+            if mode not in ("resize", "kernels"):
+                raise ValueError(f"Unknown x_height_normalize mode: {mode}")
+            x_height = self.prep.estimate_x_height(img)
+            results["meta"]["x_height"] = x_height
+            if x_height:
+                scale = x_height / float(params.get("target_x_height", 20))
+                if mode == "kernels":
+                    results["meta"]["kernel_scale"] = float(np.clip(scale, 0.25, 8.0))
+                elif scale > 1.25:
+                    # Trang quá phân giải: thu nhỏ (INTER_AREA) về x-height chuẩn
+                    h, w = img.shape[:2]
+                    img = self.prep.resize_image(img, target_width=max(1, int(round(w / scale))))
+                    results["meta"]["x_height_scale"] = img.shape[1] / float(w)
+                    self._keep("gray_normalized", img, params, results)
+
+        if params.get("equalize", True):
+            img = self.prep.equalize_histogram(img)
+            self._keep("hist_equalized", img, params, results)
+        return img
+
+    # 2. ------ Geometry correction (Deskew -> Perspective -> Dewarp) ------
+    def _geometry(self, img, params, results, context):
+        # Gộp xoay + nắn phối cảnh + khử cong thành 1 lần lấy mẫu ảnh
+        # params["skew_angle"]: góc nghiêng (độ), không truyền thì tự dò trên ảnh proxy;
+        # params["page_corners"]: 4 góc trang (4, 2), params["detect_page"]: tự dò 4 góc trang
+        max_side = params.get("analysis_max_side")
+        proxy = self.prep.make_proxy(img, max_side) if max_side else img
+
+        angle = None
+        if params.get("deskew", True):
+            angle = params.get("skew_angle")
+            if angle is None:
+                # Không đưa cho bộ dò ảnh nhỏ hơn proxy riêng của nó (proxy_max_side): projection
+                # profile trên ảnh quá nhỏ mất nét dòng chữ -> góc sai, độ tin cậy thấp
+                skew_source = proxy
+                if max(proxy.shape[:2]) < min(self.deskewer.proxy_max_side, max(img.shape[:2])):
+                    skew_source = img
+                angle, confidence = self.deskewer.detect_skew_angle(skew_source)
+                results["meta"]["skew_angle"] = angle
+                results["meta"]["skew_confidence"] = confidence
+                # Góc ~0 hoặc không chắc chắn -> không xoay
+                if (confidence < self.deskewer.min_confidence
+                        or abs(angle) < self.deskewer.min_angle):
+                    angle = None
+        corners = params.get("page_corners")
+        if corners is None and params.get("detect_page", False):
+            corners = self.geo.detect_page_corners(proxy)
+            if corners is not None:
+                # Góc dò trên ảnh chưa xoay -> đưa về khung ảnh đã xoay (như fused_warp yêu cầu)
+                if proxy is not img:
+                    corners = self._proxy_to_full(corners, proxy, img)
+                    win = int(np.ceil(2 * img.shape[1] / float(proxy.shape[1])))
+                    corners = self.geo.refine_corners(img, corners, win=win)
+                R, _ = self.geo.rotation_matrix(img.shape, angle or 0.0)
+                corners = cv.perspectiveTransform(corners[np.newaxis], R)[0]
+                results["meta"]["page_corners"] = corners
+        dewarper = self.dewarp if params.get("dewarp", True) else None
+        if not angle and corners is None and dewarper is None:
+            return img
+
+        img = self.geo.fused_warp(img, angle=angle or 0.0, pts=corners, dewarper=dewarper,
+                                  grid_step=params.get("dewarp_grid_step", 32),
+                                  proxy_max_side=max_side or 1024,
+                                  cache_key=params.get("dewarp_cache_key"),
+                                  proxy=proxy if max_side else None)
+        self._keep("dewarped" if dewarper is not None else "deskewed", img, params, results)
+        return img
+
+    # 3. ------ Restore (Denoise -> Shadow) ------
+    def _restore(self, img, params, results, context):
+        if params.get("denoise", True):
+            img = self.denoiser.denoise(img,
+                                        method=params.get("denoise_method", "median"),
+                                        ksize=params.get("median_ksize", 3),
+                                        strength=params.get("denoise_strength", 1.0),
+                                        tile_size=params.get("tile_size"),
+                                        workers=params.get("tile_workers", 1))
+            self._keep("denoised", img, params, results)
+
+        if params.get("inpaint", False):
+            img = self.forensic.inpaint_holes(img,
+                                              mask=params.get("inpaint_mask", None))
+            self._keep("inpainted", img, params, results)
+
+        # Shadow removal after denoise
+        if params.get("remove_shadows", True):
+            method = params.get("shadow_method", "exact")
+            downsample = params.get("shadow_downsample", 4)
+            max_side = params.get("analysis_max_side")
+            if max_side and max(img.shape[:2]) > max_side:
+                # Chế độ proxy: ước lượng nền ở độ phân giải ~ analysis_max_side
+                method = "downsampled"
+                downsample = max(img.shape[:2]) / float(max_side)
+            img = self.enhancer.remove_shadow(img,
+                                              kernel_size=self._sized_param("shadow_kernel", params, results),
+                                              tile_size=params.get("tile_size"),
+                                              workers=params.get("tile_workers", 1),
+                                              method=method, downsample=downsample)
+            self._keep("no_shadows", img, params, results)
+        return img
+
+    # 4. ------ Enhance & Digitize ------
+    def _enhance(self, img, params, results, context):
+        if params.get("enhance_constrast", True):
+            img = self.enhancer.apply_clahe(img,
+                                            clip_limit=params.get("clip_limit", 2.0),
+                                            tile_size=params.get("tile_size"),
+                                            workers=params.get("tile_workers", 1))
+            self._keep("enhanced", img, params, results)
+
+        if params.get("binarize", True):
+            context.update(img)
+            block_size = self._sized_param("block_size", params, results)
+            method = params.get("threshold_method", "mean")
+            variants = params.get("threshold_variants")
+            if variants or method in self.seg.THRESHOLD_METHODS:
+                # Nhiều biến thể (Sauvola, Niblack, Wolf, Phansalkar) dùng chung thống kê cục bộ;
+                # biến thể đầu tiên là đầu ra, các biến thể còn lại giữ làm intermediate
+                if variants:
+                    # Cửa sổ chỉ định riêng cho từng biến thể cũng theo cỡ chữ (chế độ "kernels")
+                    variants = [dict(v, window_size=self._scale_size(v["window_size"], 1, results))
+                                if isinstance(v, dict) and "window_size" in v else v
+                                for v in variants]
+                else:
+                    variants = [{"method": method, "window_size": block_size}]
+                binaries = self.seg.binarize_multi(img, variants,
+                                                   band_rows=params.get("threshold_band_rows"),
+                                                   context=context)
+                names = list(binaries)
+                for name in names[1:]:
+                    self._keep(f"binary_{name}", binaries[name], params, results)
+                binary = binaries[names[0]]
+            else:
+                binary = self.prep.adaptive_threshold(img, block_size=block_size,
+                                                      C=params.get("threshold_C", 10),
+                                                      method=method, context=context)
+            self._keep("binary", binary, params, results)
+            return binary
+        return img
+
+    # 5. ------ Segment & Layout ------
+    def _segment(self, final_img, params, results, context):
+        context.update(final_img)
+        segments = self.seg.segment(final_img,
+                                    min_area=self._sized_param("seg_min_area", params, results),
+                                    context=context)
+        self._keep("segments", segments, params, results)
+        results["meta"]["layout"] = self.layout.analyze(segments,
+                                                        image_shape=final_img.shape,
+                                                        context=context)
+        return final_img
@@ -43,9 +43,7 @@ class DataAugmentor:
         # Tạo ma trận xác suất ngẫu nhiên
         probs = np.random.random(output.shape[:2])  # Chỉ cần shape HxW
 
-        # Nếu ảnh màu (3 kênh), ta cần mở rộng dimension của probs để mask áp dụng lên cả 3 kênh
-        if output.ndim == 3:
-            probs = np.expand_dims(probs, axis=-1)
+        # Mask 2D (HxW) chọn nguyên pixel -> áp dụng lên cả 3 kênh nếu ảnh màu
 
         # Salt (Trắng)
         output[probs < (self.sp_prob * self.salt_ratio)] = 255
@@ -76,9 +74,7 @@ class DataAugmentor:
         is_upper = np.random.choice([True, False])
         shadow_mask = mask > 0 if is_upper else mask < 0
 
-        # Xử lý channel dimension cho ảnh màu
-        if image.ndim == 3:
-            shadow_mask = shadow_mask[:, :, np.newaxis]
+        # Mask 2D (HxW) chọn nguyên pixel, nên dùng được cho cả ảnh màu
 
         # Áp dụng bóng
         img_float = image.astype(np.float32)
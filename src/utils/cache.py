@@ -0,0 +1,231 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def hash_array(image: np.ndarray) -> str:
+    """Băm nội dung ảnh (shape + dtype + bytes) thành chuỗi hex."""
+    h = hashlib.blake2b(digest_size=16)
+    arr = np.ascontiguousarray(image)
+    h.update(str(arr.shape).encode())
+    h.update(arr.dtype.str.encode())
+    h.update(memoryview(arr).cast("B"))
+    return h.hexdigest()
+
+
+def _hash_value(h, value):
+    """Đưa 1 giá trị param vào hàm băm (mảng numpy băm theo nội dung)."""
+    if isinstance(value, np.ndarray):
+        h.update(hash_array(value).encode())
+    elif isinstance(value, dict):
+        for k in sorted(value, key=str):
+            h.update(str(k).encode())
+            _hash_value(h, value[k])
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        items = sorted(value, key=repr) if isinstance(value, (set, frozenset)) else value
+        h.update(type(value).__name__.encode())
+        for v in items:
+            _hash_value(h, v)
+    else:
+        h.update(json.dumps(value, sort_keys=True, default=repr).encode())
+
+
+def _nbytes(value) -> int:
+    """Ước lượng số byte của 1 entry (mảng numpy tính theo nbytes, mỗi mảng 1 lần)."""
+    seen = {}
+
+    def visit(v):
+        if isinstance(v, np.ndarray):
+            seen[id(v)] = v.nbytes
+        elif isinstance(v, dict):
+            for x in v.values():
+                visit(x)
+        elif isinstance(v, (list, tuple)):
+            for x in v:
+                visit(x)
+
+    visit(value)
+    # Cộng thêm phần overhead nhỏ cho metadata Python
+    return sum(seen.values()) + 1024
+
+
+class StageCache:
+    """
+    Cache kết quả từng giai đoạn của pipeline, định danh theo nội dung (content-addressed).
+
+    Khóa của một giai đoạn = hash(khóa của đầu vào, tên giai đoạn, các params ảnh hưởng tới nó).
+    Khóa đầu vào của giai đoạn sau chính là khóa của giai đoạn trước, nên khi chỉ đổi 1 tham số
+    khử nhiễu thì mọi giai đoạn phía trên vẫn trúng cache, chỉ các giai đoạn phía sau chạy lại.
+
+    - Tầng bộ nhớ: LRU, giới hạn theo tổng số byte (max_bytes).
+    - Tầng đĩa (tùy chọn): mỗi entry là 1 file pickle trong disk_dir, LRU theo thời gian truy cập,
+      giới hạn bởi disk_max_bytes. Kích thước các file được giữ trong 1 chỉ mục (quét thư mục
+      1 lần lúc khởi tạo), nên put không phải liệt kê lại cả thư mục; file do tiến trình khác
+      ghi vào cùng thư mục sau thời điểm đó không được tính.
+
+    Lưu ý: mảng trả về từ cache được dùng chung giữa các lần gọi, không sửa trực tiếp (in-place).
+    """
+
+    def __init__(self, max_bytes: int = 512 * 2**20, disk_dir: str = None,
+                 disk_max_bytes: int = 4 * 2**30):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()  # key -> (value, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._disk_index = OrderedDict()  # path -> kích thước file, cũ nhất ở đầu
+        self._disk_bytes = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_scan()
+
+    # ------------------------------------------------------------------
+    # Khóa
+    # ------------------------------------------------------------------
+    @staticmethod
+    def input_key(image: np.ndarray) -> str:
+        return hash_array(image)
+
+    @staticmethod
+    def stage_key(parent_key: str, stage: str, params: dict) -> str:
+        h = hashlib.blake2b(digest_size=16)
+        h.update(parent_key.encode())
+        h.update(stage.encode())
+        _hash_value(h, params)
+        return h.hexdigest()
+
+    # ------------------------------------------------------------------
+    # Truy xuất
+    # ------------------------------------------------------------------
+    def get(self, key: str):
+        """Trả về giá trị đã cache hoặc None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        value = self._disk_get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._put_memory(key, value, _nbytes(value))
+        return value
+
+    def put(self, key: str, value):
+        nbytes = _nbytes(value)
+        with self._lock:
+            self._put_memory(key, value, nbytes)
+        self._disk_put(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries or (
+            self.disk_dir is not None and os.path.exists(self._disk_path(key)))
+
+    # ------------------------------------------------------------------
+    # Tầng bộ nhớ
+    # ------------------------------------------------------------------
+    def _put_memory(self, key, value, nbytes):
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        # Entry lớn hơn cả giới hạn -> chỉ lưu trên đĩa (nếu có)
+        if nbytes > self.max_bytes:
+            return
+        self._entries[key] = (value, nbytes)
+        self._bytes += nbytes
+        while self._bytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+
+    # ------------------------------------------------------------------
+    # Tầng đĩa
+    # ------------------------------------------------------------------
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + ".pkl")
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            os.utime(path)  # đánh dấu vừa dùng (LRU)
+            with self._lock:
+                if path in self._disk_index:
+                    self._disk_index.move_to_end(path)
+            return value
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"[Cache] Không đọc được {path}: {e}")
+            return None
+
+    def _disk_put(self, key, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                size = f.tell()
+            os.replace(tmp, path)
+        except Exception as e:
+            print(f"[Cache] Không ghi được {path}: {e}")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        with self._lock:
+            self._disk_bytes += size - self._disk_index.pop(path, 0)
+            self._disk_index[path] = size
+            self._disk_evict()
+
+    def _disk_scan(self):
+        """Dựng chỉ mục kích thước từ các file đang có (cũ nhất theo mtime ở đầu)."""
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".pkl"):
+                continue
+            path = os.path.join(self.disk_dir, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        for _, size, path in sorted(files):
+            self._disk_index[path] = size
+            self._disk_bytes += size
+
+    def _disk_evict(self):
+        # Gọi khi đang giữ self._lock
+        while self._disk_bytes > self.disk_max_bytes:
+            path, size = self._disk_index.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -1,8 +1,10 @@
 # src/utils/io.py
 
+import gzip
+import os
+
 import cv2
 import numpy as np
-import os
 
 
 class IOManager:
@@ -76,27 +78,147 @@ class IOManager:
             return False
 
     @staticmethod
-    def save_svg(paths_list: list, output_path: str, width: int, height: int):
+    def _format_numbers(q: np.ndarray, precision: int) -> np.ndarray:
+        """
+        Chuỗi ngắn nhất của các tọa độ đã lượng tử hóa q (số nguyên, đơn vị 10^-precision):
+        bỏ số 0 thừa ("1.50" -> "1.5", "0.5" -> ".5"). Chỉ format các giá trị khác nhau
+        (tọa độ tương đối lặp lại rất nhiều) rồi tra ngược.
+        """
+        values, inverse = np.unique(q, return_inverse=True)
+        if precision <= 0:
+            text = [str(int(v)) for v in values]
+        else:
+            text = []
+            for v in values / 10.0 ** precision:
+                t = f"{v:.{precision}f}".rstrip("0").rstrip(".")
+                if t.startswith("0."):
+                    t = t[1:]
+                elif t.startswith("-0."):
+                    t = "-" + t[2:]
+                text.append(t if t not in ("", "-0") else "0")
+        return np.array(text, dtype=object)[inverse.reshape(q.shape)]
+
+    @staticmethod
+    def path_data(paths: dict, precision: int = 1, paths_per_element: int = 1):
+        """
+        Sinh chuỗi lệnh SVG path (lệnh tương đối, riêng M mở đầu mỗi chuỗi là tuyệt đối;
+        tọa độ lượng tử hóa tới precision chữ số thập phân) cho kết quả Vectorizer.vectorize()
+        (dict struct-of-arrays: start, ctrl, is_line, seg_offset, path_offset).
+        Mỗi chuỗi gộp tối đa paths_per_element compound path.
+        Tọa độ tuyệt đối được lượng tử hóa trước rồi mới lấy hiệu, nên sai số không cộng dồn.
+        """
+        start, ctrl, is_line = paths["start"], paths["ctrl"], paths["is_line"]
+        seg_offset, path_offset = paths["seg_offset"], paths["path_offset"]
+        scale = 10.0 ** max(0, precision)
+        n_paths = len(path_offset) - 1
+
+        for p0 in range(0, n_paths, max(1, paths_per_element)):
+            p1 = min(p0 + max(1, paths_per_element), n_paths)
+            c0, c1 = int(path_offset[p0]), int(path_offset[p1])
+            s0, s1 = int(seg_offset[c0]), int(seg_offset[c1])
+            counts = np.diff(seg_offset[c0:c1 + 1])
+            first = np.cumsum(counts) - counts
+
+            q_start = np.round(start[c0:c1].astype(np.float64) * scale).astype(np.int64)
+            q_ctrl = np.round(ctrl[s0:s1].astype(np.float64) * scale).astype(np.int64)
+            lines = is_line[s0:s1]
+            # Điểm hiện tại trước mỗi đoạn: P3 của đoạn trước, hoặc điểm đầu contour
+            current = np.empty((s1 - s0, 2), dtype=np.int64)
+            current[1:] = q_ctrl[:-1, 2]
+            current[first] = q_start
+            rel = IOManager._format_numbers(q_ctrl - current[:, np.newaxis], precision)
+            # m tương đối so với điểm đầu contour trước; contour đầu tiên của chuỗi ghi M tuyệt đối
+            # để chuỗi tự đứng được khi save_svg nối nhiều chuỗi vào cùng 1 <path>
+            move = np.diff(q_start, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+            move = IOManager._format_numbers(move, precision)
+
+            # Chỉ ghi chữ lệnh khi khác lệnh của đoạn trước (lệnh lặp ngầm định)
+            letter = np.ones(len(lines), dtype=bool)
+            letter[1:] = lines[1:] != lines[:-1]
+            letter[first] = True
+            segs = [("l" if ln else "c") if lt else " " for ln, lt in zip(lines, letter)]
+            for k, (ln, r) in enumerate(zip(lines, rel)):
+                segs[k] += (r[2, 0] + " " + r[2, 1]) if ln else " ".join(r.ravel())
+
+            parts = []
+            for c in range(c1 - c0):
+                parts.append(("M" if c == 0 else "m") + move[c, 0] + " " + move[c, 1])
+                parts.extend(segs[first[c]:first[c] + counts[c]])
+                parts.append("z")
+            # Không cần dấu cách trước số âm
+            yield "".join(parts).replace(" -", "-")
+
+    @staticmethod
+    def save_svg(paths_list, output_path: str, width: int, height: int,
+                 precision: int = 1, merge: int = 1000, compress: bool = None):
         """
-        Lưu danh sách các đường cong (Bezier) thành file SVG.
+        Lưu danh sách các đường cong (Bezier) thành file SVG, ghi dạng luồng (streaming).
         Dùng cho module Vectorizer.
 
         Args:
-            paths_list (list): List các chuỗi lệnh SVG path (ví dụ: "M 10 10 L 20 20...").
-            output_path (str): Đường dẫn file .svg.
+            paths_list: dict kết quả Vectorizer.vectorize(), hoặc iterable/generator gồm:
+                - chuỗi lệnh SVG path (ví dụ: "M 10 10 L 20 20..."), ghi nguyên văn
+                - tuple (chuỗi path, màu fill)
+                - dict kết quả Vectorizer.vectorize() (có thể kèm khóa "fill")
+            output_path (str): Đường dẫn file .svg (hoặc .svgz: nén gzip trong lúc ghi).
             width, height: Kích thước canvas.
+            precision (int): Số chữ số thập phân của tọa độ (lượng tử hóa, lệnh tương đối).
+            merge (int): Gộp tối đa bấy nhiêu glyph liên tiếp cùng style của kết quả Vectorizer vào
+                1 <path> (compound path, tô evenodd); 1 = mỗi glyph 1 phần tử. Chuỗi path thô /
+                tuple luôn được ghi mỗi chuỗi 1 <path> (tô nonzero như mặc định của SVG): gộp
+                chúng vào 1 compound path sẽ làm đổi phần được tô ở chỗ các hình chồng nhau.
+            compress (bool): Nén gzip; None = tự chọn theo đuôi .svgz.
         """
-        svg_header = f'<svg width="{width}" height="{height}" xmlns="http://www.w3.org/2000/svg">'
+        svg_header = (f'<svg width="{width}" height="{height}" viewBox="0 0 {width} {height}" '
+                      f'xmlns="http://www.w3.org/2000/svg">')
         svg_footer = '</svg>'
+        if isinstance(paths_list, dict):
+            paths_list = [paths_list]
+        if compress is None:
+            compress = output_path.lower().endswith(".svgz")
+        merge = max(1, int(merge))
+
+        def items():
+            """(chuỗi d, style, số path, được gộp không) theo đúng thứ tự đầu vào."""
+            for item in paths_list:
+                if isinstance(item, dict):
+                    # Glyph có lỗ -> tô theo evenodd
+                    style = f'fill="{item.get("fill", "black")}" fill-rule="evenodd"'
+                    n_paths = len(item["path_offset"]) - 1
+                    for p0, d in zip(range(0, n_paths, merge),
+                                     IOManager.path_data(item, precision, paths_per_element=merge)):
+                        yield d, style, min(merge, n_paths - p0), True
+                elif isinstance(item, tuple):
+                    yield item[0], f'fill="{item[1]}"', 1, False
+                else:
+                    yield item, 'fill="black"', 1, False
+
+        def write_group(f, group, style):
+            # Style cơ bản: Fill đen, không stroke
+            f.write(f'<path d="{" ".join(group)}" {style} stroke="none"/>\n')
 
         try:
-            with open(output_path, "w", encoding="utf-8") as f:
+            if compress:
+                f = gzip.open(output_path, "wt", encoding="utf-8", compresslevel=6)
+            else:
+                f = open(output_path, "w", encoding="utf-8", buffering=1 << 20)
+            with f:
                 f.write(svg_header + "\n")
-                # Ghi từng đường path
-                for p in paths_list:
-                    # Style cơ bản: Fill đen, không stroke
-                    line = f'<path d="{p}" fill="black" stroke="none"/>'
-                    f.write(line + "\n")
+                # Gộp các glyph liên tiếp cùng fill (không đổi thứ tự vẽ)
+                group, group_style, count = [], None, 0
+                for d, style, n_paths, mergeable in items():
+                    if group and (not mergeable or style != group_style
+                                  or count + n_paths > merge):
+                        write_group(f, group, group_style)
+                        group, count = [], 0
+                    if not mergeable:
+                        write_group(f, [d], style)
+                        continue
+                    group.append(d)
+                    group_style = style
+                    count += n_paths
+                if group:
+                    write_group(f, group, group_style)
                 f.write(svg_footer)
             return True
         except Exception as e:
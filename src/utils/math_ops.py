@@ -1,111 +1,227 @@
 import numpy as np
 
+# Số phần tử (pixel x kênh) mỗi dải khi remap theo khối
+_REMAP_BAND_ELEMENTS = 1 << 18
+# Số hàng mỗi dải khi tính gradient
+_GRADIENT_BAND_ROWS = 256
 
-def calc_gradient_sobel(image: np.ndarray):
+
+def _sobel_bands(image: np.ndarray, band_rows: int = _GRADIENT_BAND_ROWS):
     """
-    Tính Magnitude và Angle của Gradient sử dụng toán tử Sobel thủ công.
-    Input: Ảnh xám (Grayscale) 2D numpy array.
-    Output: (magnitude, angle)
+    Sinh (r0, r1, gx, gy) cho từng dải hàng của ảnh: gradient Sobel float32 của các hàng r0:r1,
+    biên ngoài ảnh coi là 0 (như pad hằng số 0). Mỗi dải chỉ cần thêm 1 hàng viền trên/dưới
+    nên bộ nhớ tạm tỉ lệ với dải, không phải cả ảnh.
     """
-    # 1. Định nghĩa Kernel Sobel thủ công
-    # Kx: Phát hiện biên dọc
-    Kx = np.array([[-1, 0, 1],
-                   [-2, 0, 2],
-                   [-1, 0, 1]], dtype=np.float32)
-
-    # Ky: Phát hiện biên ngang
-    Ky = np.array([[-1, -2, -1],
-                   [0, 0, 0],
-                   [1, 2, 1]], dtype=np.float32)
-
-    # 2. Thực hiện Convolution (Tích chập)
-    # Lưu ý: Để tối ưu tốc độ trong Python thuần, ta có thể dùng mẹo slicing
-    # hoặc hàm convolve2d của scipy, nhưng ở đây dùng logic trượt cửa sổ cơ bản
-    # (pad ảnh để giữ kích thước).
-
     rows, cols = image.shape
-    # Pad ảnh thêm 1 viền số 0 xung quanh để xử lý biên
-    padded_img = np.pad(image, ((1, 1), (1, 1)), mode='constant', constant_values=0).astype(np.float32)
+    for r0 in range(0, rows, band_rows):
+        r1 = min(r0 + band_rows, rows)
+        lo, hi = max(r0 - 1, 0), min(r1 + 1, rows)
 
-    gx = np.zeros_like(image, dtype=np.float32)
-    gy = np.zeros_like(image, dtype=np.float32)
+        # Dải có viền 1 pixel quanh (số 0 ở ngoài ảnh)
+        buf = np.zeros((r1 - r0 + 2, cols + 2), dtype=np.float32)
+        buf[lo - (r0 - 1):hi - (r0 - 1), 1:-1] = image[lo:hi]
 
-    # Vectorized Sliding Window (Nhanh hơn vòng lặp for lồng nhau)
-    # Lấy các vùng lân cận
-    top_left = padded_img[:-2, :-2]
-    top_center = padded_img[:-2, 1:-1]
-    top_right = padded_img[:-2, 2:]
+        # Kernel Sobel tách được: Kx = [1 2 1]^T * [-1 0 1], Ky = [-1 0 1]^T * [1 2 1]
+        dx = buf[:, 2:] - buf[:, :-2]
+        gx = dx[:-2] + 2 * dx[1:-1] + dx[2:]
+        sx = buf[:, :-2] + 2 * buf[:, 1:-1] + buf[:, 2:]
+        gy = sx[2:] - sx[:-2]
+        yield r0, r1, gx, gy
 
-    mid_left = padded_img[1:-1, :-2]
-    mid_right = padded_img[1:-1, 2:]
 
-    bot_left = padded_img[2:, :-2]
-    bot_center = padded_img[2:, 1:-1]
-    bot_right = padded_img[2:, 2:]
+def _downsample_mean(image: np.ndarray, factor: int) -> np.ndarray:
+    """Thu nhỏ ảnh xám factor lần bằng trung bình khối factor x factor (bỏ phần lẻ ở mép)."""
+    if factor <= 1:
+        return image
+    h, w = image.shape[0] // factor, image.shape[1] // factor
+    blocks = image[:h * factor, :w * factor].reshape(h, factor, w, factor)
+    return blocks.mean(axis=(1, 3), dtype=np.float32)
 
-    # Áp dụng công thức Convolution với Kernel Kx và Ky
-    gx = (1 * top_right + 2 * mid_right + 1 * bot_right) - (1 * top_left + 2 * mid_left + 1 * bot_left)
-    gy = (1 * bot_left + 2 * bot_center + 1 * bot_right) - (1 * top_left + 2 * top_center + 1 * top_right)
 
-    # 3. Tính Magnitude và Angle
-    magnitude = np.sqrt(gx ** 2 + gy ** 2)
+def calc_gradient_sobel(image: np.ndarray):
+    """
+    Tính Magnitude và Angle của Gradient sử dụng toán tử Sobel thủ công.
+    Input: Ảnh xám (Grayscale) 2D numpy array.
+    Output: (magnitude, angle)
+    """
+    # Tính theo dải hàng (_sobel_bands), ghi thẳng vào 2 mảng kết quả cấp phát sẵn
+    magnitude = np.empty(image.shape, dtype=np.uint8)
+    angle = np.empty(image.shape, dtype=np.float32)
+
+    for r0, r1, gx, gy in _sobel_bands(image):
+        mag = np.hypot(gx, gy)
+        # Chuyển về khoảng [0, 255]
+        np.clip(mag, 0, 255, out=mag)
+        magnitude[r0:r1] = mag
+        # Tính góc (rad)
+        angle[r0:r1] = np.arctan2(gy, gx)
 
-    # Chuyển về khoảng [0, 255]
-    magnitude = np.clip(magnitude, 0, 255).astype(np.uint8)
+    return magnitude, angle
 
-    # Tính góc (rad)
-    angle = np.arctan2(gy, gx)
 
-    return magnitude, angle
+def gradient_orientation_histogram(image: np.ndarray, bins: int = 180, downsample: int = 1,
+                                   min_magnitude: float = 0.0, return_gradients: bool = False):
+    """
+    Histogram hướng gradient có trọng số magnitude (hướng không dấu, [0, 180) độ),
+    cộng dồn theo từng dải hàng - không tạo mảng magnitude/angle cả trang trừ khi được yêu cầu.
+    Dùng cho hướng của các cạnh thẳng dài (đường kẻ, mép trang/bảng): cạnh ngang tạo đỉnh
+    ở 90 độ. Trên trang chữ thuần, nét dọc của chữ kéo đỉnh về 0/90 độ bất kể góc nghiêng,
+    nên Deskewer dò góc bằng projection profile thay vì histogram này.
+
+    Args:
+        image: Ảnh xám 2D.
+        bins: Số bin trên [0, 180) độ; bin i có tâm tại i * 180 / bins độ
+              (bins=180 -> tâm bin là các độ nguyên, bin 0 gồm cả hướng gần 180).
+        downsample: Thu nhỏ ảnh (trung bình khối) trước khi tính gradient.
+        min_magnitude: Bỏ qua gradient yếu hơn ngưỡng này (nền giấy, nhiễu).
+        return_gradients: Trả thêm (magnitude, angle) như calc_gradient_sobel
+                          (ở độ phân giải sau khi thu nhỏ).
+
+    Returns:
+        hist (bins,) hoặc (hist, magnitude, angle).
+    """
+    if image is None:
+        raise ValueError("Input image is None!")
+    if image.ndim != 2:
+        raise ValueError("Expected a 2D grayscale image!")
+
+    image = _downsample_mean(image, int(downsample))
+    hist = np.zeros(bins, dtype=np.float64)
+    if return_gradients:
+        magnitude = np.empty(image.shape, dtype=np.uint8)
+        angle = np.empty(image.shape, dtype=np.float32)
+
+    for r0, r1, gx, gy in _sobel_bands(image):
+        mag = np.hypot(gx, gy)
+        theta = np.arctan2(gy, gx)
+        if return_gradients:
+            magnitude[r0:r1] = np.clip(mag, 0, 255)
+            angle[r0:r1] = theta
+
+        # Hướng không dấu: theta mod pi -> bin gần nhất (tâm bin tại i * 180 / bins),
+        # hướng gần 180 độ quay vòng về bin 0
+        idx = np.rint(np.mod(theta, np.pi) * (bins / np.pi)).astype(np.intp)
+        np.remainder(idx, bins, out=idx)
+        if min_magnitude > 0:
+            keep = mag >= min_magnitude
+            idx, mag = idx[keep], mag[keep]
+        hist += np.bincount(idx.ravel(), weights=mag.ravel(), minlength=bins)
+
+    if return_gradients:
+        return hist, magnitude, angle
+    return hist
+
+
+def dominant_orientation(hist: np.ndarray) -> float:
+    """
+    Hướng trội (độ, [0, 180)) từ histogram của gradient_orientation_histogram,
+    nội suy parabol quanh bin cao nhất (histogram vòng: bin cuối kề bin đầu).
+    """
+    bins = len(hist)
+    i = int(np.argmax(hist))
+    s0, s1, s2 = hist[i - 1], hist[i], hist[(i + 1) % bins]
+    denom = s0 - 2 * s1 + s2
+    offset = 0.5 * (s0 - s2) / denom if denom < 0 else 0.0
+    return float(((i + offset) * 180.0 / bins) % 180.0)
 
 
-def bilinear_interpolation(image: np.ndarray, map_x: np.ndarray, map_y: np.ndarray) -> np.ndarray:
+def bilinear_interpolation(image: np.ndarray, map_x: np.ndarray, map_y: np.ndarray,
+                           border_value=None, interpolation: str = "bilinear",
+                           band_elements: int = _REMAP_BAND_ELEMENTS) -> np.ndarray:
     """
     Nội suy song tuyến tính thủ công (Thay thế cv2.remap).
     Dùng cho giai đoạn Dewarping để tính giá trị pixel từ lưới tọa độ thực.
 
+    Xử lý theo dải hàng của ảnh đầu ra (mỗi dải ~band_elements phần tử) với trọng số float32
+    và ghi thẳng vào mảng kết quả cấp phát sẵn -> bộ nhớ tạm tỉ lệ với 1 dải, không phải cả ảnh.
+
     Args:
         image: Ảnh gốc (Input Source).
         map_x: Ma trận tọa độ X cần lấy mẫu (float).
         map_y: Ma trận tọa độ Y cần lấy mẫu (float).
+        border_value: None = kẹp tọa độ vào trong ảnh (lặp pixel biên);
+                      số/tuple = giá trị cho các điểm lấy mẫu nằm ngoài ảnh (như BORDER_CONSTANT).
+        interpolation: "bilinear" hoặc "nearest" (chỉ lấy pixel gần nhất, không tính trọng số).
     """
-    H, W = image.shape[:2]
+    if image is None:
+        raise ValueError("Input image is None!")
+    if map_x.shape != map_y.shape:
+        raise ValueError("map_x and map_y must have the same shape!")
+    if interpolation not in ("bilinear", "nearest"):
+        raise ValueError(f"Unknown interpolation: {interpolation}")
 
-    # 1. Tìm toạ độ nguyên (Integer coordinates) của 4 điểm lân cận
-    # (x0, y0) là góc trên trái, (x1, y1) là góc dưới phải
-    x0 = np.floor(map_x).astype(np.int32)
-    x1 = x0 + 1
-    y0 = np.floor(map_y).astype(np.int32)
-    y1 = y0 + 1
-
-    # 2. Giới hạn toạ độ trong khung ảnh (Clipping)
-    # Đảm bảo không truy cập ra ngoài mảng
-    x0 = np.clip(x0, 0, W - 1)
-    x1 = np.clip(x1, 0, W - 1)
-    y0 = np.clip(y0, 0, H - 1)
-    y1 = np.clip(y1, 0, H - 1)
-
-    # 3. Lấy giá trị pixel tại 4 điểm lân cận (Ia, Ib, Ic, Id)
-    # Ia: Top-Left, Ib: Top-Right, Ic: Bottom-Left, Id: Bottom-Right
-    Ia = image[y0, x0]
-    Ib = image[y0, x1]
-    Ic = image[y1, x0]
-    Id = image[y1, x1]
-
-    # 4. Tính trọng số (khoảng cách thập phân)
-    wa = (x1 - map_x) * (y1 - map_y)
-    wb = (map_x - x0) * (y1 - map_y)
-    wc = (x1 - map_x) * (map_y - y0)
-    wd = (map_x - x0) * (map_y - y0)
-
-    # Nếu ảnh là ảnh màu (3 kênh), cần mở rộng chiều trọng số để nhân
-    if image.ndim == 3:
-        wa = wa[..., np.newaxis]
-        wb = wb[..., np.newaxis]
-        wc = wc[..., np.newaxis]
-        wd = wd[..., np.newaxis]
-
-    # 5. Tính giá trị nội suy cuối cùng
-    output = wa * Ia + wb * Ib + wc * Ic + wd * Id
-
-    return output.astype(np.uint8)
\ No newline at end of file
+    H, W = image.shape[:2]
+    channels = image.shape[2:]
+    C = int(np.prod(channels)) if channels else 1
+    src = image.reshape(H * W, C)
+    out_h, out_w = map_x.shape[:2]
+    output = np.empty((out_h, out_w) + channels, dtype=image.dtype)
+    out_flat = output.reshape(out_h, out_w, C)
+
+    is_int = np.issubdtype(image.dtype, np.integer)
+    if is_int:
+        info = np.iinfo(image.dtype)
+    fill = None
+    if border_value is not None:
+        fill = np.broadcast_to(np.asarray(border_value, dtype=np.float32).ravel(), (C,))
+        fill = fill[np.newaxis, np.newaxis, :] if len(fill) > 1 else fill[0]
+
+    band_rows = max(1, band_elements // max(1, out_w * C))
+    for r0 in range(0, out_h, band_rows):
+        r1 = min(r0 + band_rows, out_h)
+        mx = np.asarray(map_x[r0:r1], dtype=np.float32)
+        my = np.asarray(map_y[r0:r1], dtype=np.float32)
+
+        if interpolation == "nearest":
+            xi = np.floor(mx + 0.5).astype(np.intp)
+            yi = np.floor(my + 0.5).astype(np.intp)
+            inside = (xi >= 0) & (xi < W) & (yi >= 0) & (yi < H)
+            np.clip(xi, 0, W - 1, out=xi)
+            np.clip(yi, 0, H - 1, out=yi)
+            band = src[yi * W + xi]
+            if fill is not None:
+                band = np.where(inside[..., np.newaxis], band, fill)
+            out_flat[r0:r1] = band
+            continue
+
+        if fill is None:
+            # Kẹp tọa độ vào trong ảnh trước -> 4 điểm lân cận luôn hợp lệ.
+            # Kẹp ra mảng mới: mx/my có thể là view vào map của người gọi (map float32)
+            mx = np.clip(mx, 0, W - 1)
+            my = np.clip(my, 0, H - 1)
+
+        # 1. Toạ độ nguyên của góc trên trái và phần thập phân (trọng số)
+        x0f = np.floor(mx)
+        y0f = np.floor(my)
+        fx = (mx - x0f)[..., np.newaxis]
+        fy = (my - y0f)[..., np.newaxis]
+        x0 = x0f.astype(np.intp)
+        y0 = y0f.astype(np.intp)
+        del mx, my, x0f, y0f
+
+        # 2. Lấy 4 điểm lân cận (Ia: Top-Left, Ib: Top-Right, Ic: Bottom-Left, Id: Bottom-Right)
+        def tap(dy, dx):
+            yy, xx = y0 + dy, x0 + dx
+            if fill is None:
+                # Chỉ có thể vượt biên khi phần thập phân = 0 (trọng số 0) -> kẹp lại
+                vals = src[np.minimum(yy, H - 1) * W + np.minimum(xx, W - 1)]
+                return vals.astype(np.float32)
+            inside = (xx >= 0) & (xx < W) & (yy >= 0) & (yy < H)
+            vals = src[np.clip(yy, 0, H - 1) * W + np.clip(xx, 0, W - 1)].astype(np.float32)
+            return np.where(inside[..., np.newaxis], vals, fill)
+
+        # 3. Nội suy theo x trên 2 hàng rồi theo y
+        top = tap(0, 0)
+        top += (tap(0, 1) - top) * fx
+        bottom = tap(1, 0)
+        bottom += (tap(1, 1) - bottom) * fx
+        top += (bottom - top) * fy
+        del bottom
+
+        # 4. Làm tròn (thay vì cắt phần thập phân) và ghi vào kết quả
+        if is_int:
+            np.rint(top, out=top)
+            np.clip(top, info.min, info.max, out=top)
+        out_flat[r0:r1] = top
+
+    return output
@@ -0,0 +1,110 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _pair(value):
+    """Chuẩn hóa tham số int hoặc (y, x) thành tuple (y, x)."""
+    if np.isscalar(value):
+        return int(value), int(value)
+    return int(value[0]), int(value[1])
+
+
+def gaussian_radius(ksize: tuple = (0, 0), sigma: float = 1.0, is_uint8: bool = False) -> tuple:
+    """
+    Bán kính (y, x) của kernel Gaussian mà cv2.GaussianBlur thực sự dùng.
+    Khi ksize = 0, OpenCV tự tính ksize = round(sigma * (3 nếu 8-bit, 4 nếu float) * 2 + 1) | 1.
+    """
+    kx, ky = _pair(ksize)  # thứ tự OpenCV: (width, height)
+    factor = 3 if is_uint8 else 4
+    if kx <= 0:
+        kx = int(round(sigma * factor * 2 + 1)) | 1
+    if ky <= 0:
+        ky = int(round(sigma * factor * 2 + 1)) | 1
+    return ky // 2, kx // 2
+
+
+def iter_tiles(shape: tuple, tile_size=1024, halo=0, align=1):
+    """
+    Chia khung ảnh (H, W) thành các tile có viền chồng lấn (halo).
+
+    Args:
+        shape (tuple): Kích thước ảnh (H, W, ...).
+        tile_size (int | tuple): Kích thước phần lõi (core) của tile.
+        halo (int | tuple): Số pixel mở rộng mỗi phía để bộ lọc cục bộ thấy đủ lân cận.
+        align (int | tuple): Bội số mà core và halo phải chia hết (ví dụ kích thước ô CLAHE).
+
+    Yields:
+        (core, padded, inner): core/padded là tuple slice (y, x) trên ảnh gốc,
+        inner là slice của phần core bên trong tile đã mở rộng.
+    """
+    h, w = shape[:2]
+    th, tw = _pair(tile_size)
+    hy, hx = _pair(halo)
+    ay, ax = _pair(align)
+
+    # Làm tròn lên bội số của align
+    th = max(ay, -(-th // ay) * ay)
+    tw = max(ax, -(-tw // ax) * ax)
+    hy = -(-hy // ay) * ay
+    hx = -(-hx // ax) * ax
+
+    for y0 in range(0, h, th):
+        y1 = min(y0 + th, h)
+        py0, py1 = max(0, y0 - hy), min(h, y1 + hy)
+        for x0 in range(0, w, tw):
+            x1 = min(x0 + tw, w)
+            px0, px1 = max(0, x0 - hx), min(w, x1 + hx)
+            core = (slice(y0, y1), slice(x0, x1))
+            padded = (slice(py0, py1), slice(px0, px1))
+            inner = (slice(y0 - py0, y1 - py0), slice(x0 - px0, x1 - px0))
+            yield core, padded, inner
+
+
+def process_tiled(image: np.ndarray, func, halo=0, tile_size=1024, workers: int = 1,
+                  align=1, out_dtype=None) -> np.ndarray:
+    """
+    Chạy một phép xử lý cục bộ (median, Sauvola, unsharp, CLAHE, chia nền...) theo từng tile
+    rồi ghép lại. Với halo >= bán kính ảnh hưởng của phép xử lý, kết quả ghép không có đường nối
+    và trùng với khi chạy trên cả ảnh. Bộ nhớ tạm chỉ còn tỉ lệ với kích thước tile.
+
+    Args:
+        image (np.ndarray): Ảnh đầu vào (xám hoặc màu).
+        func (callable): Hàm nhận 1 tile (ndarray) và trả về ảnh cùng kích thước (H, W) với tile.
+        halo (int | tuple): Viền chồng lấn (y, x).
+        tile_size (int | tuple): Kích thước lõi tile.
+        workers (int): Số thread chạy song song (OpenCV nhả GIL nên thread là đủ).
+        align (int | tuple): Căn lưới tile theo bội số này.
+        out_dtype: Kiểu dữ liệu đầu ra (mặc định lấy theo tile kết quả đầu tiên).
+
+    Returns:
+        np.ndarray: Ảnh kết quả đã ghép.
+    """
+    if image is None:
+        raise ValueError("Input image is None!")
+
+    tiles = list(iter_tiles(image.shape, tile_size, halo, align))
+    if len(tiles) == 1:
+        return func(image)
+
+    def run_tile(tile):
+        core, padded, inner = tile
+        return func(image[padded])[inner]
+
+    # Tile đầu tiên quyết định số kênh / dtype của ảnh đầu ra
+    first = run_tile(tiles[0])
+    out = np.empty(image.shape[:2] + first.shape[2:], dtype=out_dtype or first.dtype)
+    out[tiles[0][0]] = first
+    del first
+
+    def store(tile):
+        # Mỗi tile ghi vào vùng core riêng -> không cần khóa
+        out[tile[0]] = run_tile(tile)
+
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for _ in pool.map(store, tiles[1:]):
+                pass
+    else:
+        for tile in tiles[1:]:
+            store(tile)
+    return out
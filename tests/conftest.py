@@ -0,0 +1,36 @@
+import os
+import sys
+
+# Cho phép import src.* / scripts.* khi chạy pytest từ thư mục gốc repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2 as cv
+import numpy as np
+import pytest
+
+
+def make_text_page(h=600, w=800, seed=0, columns=1, noise=0):
+    """Trang tổng hợp: các dòng chữ đen (putText) trên nền 230, có thể chia cột."""
+    rng = np.random.default_rng(seed)
+    page = np.full((h, w), 230, np.uint8)
+    words = "lorem ipsum dolor sit amet consectetur adipiscing elit".split()
+    col_w = (w - 60) // columns
+    for c in range(columns):
+        x0 = 30 + c * col_w
+        for y in range(60, h - 40, 32):
+            x = x0
+            while True:
+                word = words[rng.integers(len(words))]
+                tw = cv.getTextSize(word, cv.FONT_HERSHEY_SIMPLEX, 0.6, 2)[0][0]
+                if x + tw > x0 + col_w - 40:
+                    break
+                cv.putText(page, word, (x, y), cv.FONT_HERSHEY_SIMPLEX, 0.6, 20, 2)
+                x += tw + 14
+    if noise:
+        page = cv.add(page, rng.integers(0, noise, page.shape).astype(np.uint8))
+    return page
+
+
+@pytest.fixture
+def text_page():
+    return make_text_page()
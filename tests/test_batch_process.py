@@ -0,0 +1,57 @@
+import os
+
+from conftest import make_text_page
+from scripts import batch_process
+from scripts.batch_process import BatchProcessor, _process_page, output_paths
+from src.utils.io import IOManager
+
+
+def test_output_paths_mirror_relative_tree(tmp_path):
+    pages = [os.path.join("scans", "vol1", "001.jpg"), os.path.join("scans", "vol2", "001.jpg")]
+    out = output_paths(pages, str(tmp_path), ".png")
+    assert out == [os.path.join(str(tmp_path), "vol1", "001.png"),
+                   os.path.join(str(tmp_path), "vol2", "001.png")]
+
+
+def test_output_paths_single_dir_keeps_basename(tmp_path):
+    out = output_paths([os.path.join("book", "a.jpg"), os.path.join("book", "b.jpg")],
+                       str(tmp_path), ".png")
+    assert out == [os.path.join(str(tmp_path), "a.png"), os.path.join(str(tmp_path), "b.png")]
+
+
+def test_output_paths_disambiguates_same_stem(tmp_path):
+    pages = [os.path.join("book", "001.jpg"), os.path.join("book", "001.tif"),
+             os.path.join("book", "001.JPG")]
+    out = output_paths(pages, str(tmp_path), ".png")
+    assert len(set(out)) == len(out)
+    assert out[1] == os.path.join(str(tmp_path), "001_tif.png")
+
+
+def _die_on_second_page(index, path, in_desc):
+    # Giả lập worker bị kill (OOM killer...) khi đang xử lý trang thứ 2
+    if index == 1:
+        os._exit(1)
+    return _process_page(index, path, in_desc)
+
+
+def _shm_names():
+    return set(os.listdir("/dev/shm")) if os.path.isdir("/dev/shm") else set()
+
+
+def test_killed_worker_fails_its_page_and_frees_memory(tmp_path, monkeypatch):
+    pages = []
+    for i in range(3):
+        path = str(tmp_path / "in" / f"{i:03d}.png")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        IOManager.save_image(make_text_page(h=200, w=300, seed=i), path)
+        pages.append(path)
+
+    monkeypatch.setattr(batch_process, "_process_page", _die_on_second_page)
+    before = _shm_names()
+    processor = BatchProcessor(str(tmp_path / "out"), workers=1, page_timeout=3,
+                               params={"assume_rgb": False, "retain": "final", "dewarp": False})
+    summary = processor.run(pages)
+
+    assert summary["ok"] == 2
+    assert [f["path"] for f in summary["failed"]] == [pages[1]]
+    assert _shm_names() <= before
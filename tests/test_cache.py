@@ -0,0 +1,114 @@
+import hashlib
+import os
+
+import numpy as np
+
+from src.pipeline import DocumentRestorationPipeline
+from src.utils.cache import StageCache, _hash_value
+
+
+def _digest(value):
+    h = hashlib.blake2b(digest_size=16)
+    _hash_value(h, value)
+    return h.hexdigest()
+
+
+def _entry(nbytes, fill=0):
+    return np.full(nbytes, fill, dtype=np.uint8)
+
+
+def test_hash_value_canonicalises_params():
+    # Thứ tự key của dict / phần tử của set không ảnh hưởng tới khóa
+    assert _digest({"a": 1, "b": [1, 2]}) == _digest({"b": [1, 2], "a": 1})
+    assert _digest({3, 1, 2}) == _digest({2, 3, 1})
+    # Mảng numpy băm theo nội dung, không theo id
+    assert _digest(np.arange(5)) == _digest(np.arange(5))
+    assert _digest(np.arange(5)) != _digest(np.arange(5) + 1)
+    # Kiểu và thứ tự vẫn phân biệt
+    assert _digest([1, 2]) != _digest((1, 2))
+    assert _digest([1, 2]) != _digest([2, 1])
+    assert _digest({"a": 1}) != _digest({"a": 2})
+
+
+def test_stage_keys_chain_from_the_input():
+    page = np.zeros((4, 4), dtype=np.uint8)
+    root = StageCache.input_key(page)
+    pre = StageCache.stage_key(root, "preprocess", {"blur": 3})
+    restore = StageCache.stage_key(pre, "restore", {"denoise_strength": 10})
+
+    # Đổi tham số giai đoạn sau: khóa giai đoạn trước giữ nguyên
+    assert StageCache.stage_key(root, "preprocess", {"blur": 3}) == pre
+    assert StageCache.stage_key(pre, "restore", {"denoise_strength": 20}) != restore
+    # Đổi đầu vào hoặc giai đoạn trước: mọi khóa phía sau đều đổi
+    other = StageCache.stage_key(StageCache.input_key(page + 1), "preprocess", {"blur": 3})
+    assert other != pre
+    assert StageCache.stage_key(other, "restore", {"denoise_strength": 10}) != restore
+
+
+def test_pipeline_reruns_only_stages_after_the_changed_param(text_page):
+    pipeline = DocumentRestorationPipeline(cache=StageCache())
+    params = {"dewarp": False, "assume_rgb": False, "retain": "final"}
+    first = pipeline.run(text_page, params)
+    assert first["status"] == "ok", first.get("error")
+
+    changed = dict(params, block_size=25)
+    second = pipeline.run(text_page, changed)
+    assert second["status"] == "ok", second.get("error")
+    hits = second["meta"]["cache_hits"]
+    stages = DocumentRestorationPipeline.STAGES
+    assert hits == list(stages[:stages.index("enhance")])
+
+    third = pipeline.run(text_page, changed)
+    assert third["meta"]["cache_hits"] == list(stages)
+    np.testing.assert_array_equal(third["images"]["final"], second["images"]["final"])
+
+
+def test_memory_tier_evicts_least_recently_used_by_bytes():
+    cache = StageCache(max_bytes=3 * 2048)
+    for key in ("a", "b", "c"):
+        cache.put(key, _entry(1000))
+    assert len(cache) == 3
+    cache.get("a")  # a vừa dùng -> b là cũ nhất
+    cache.put("d", _entry(1000))
+    assert "b" not in cache and {"a", "c", "d"} <= set(cache._entries)
+    assert cache.nbytes <= cache.max_bytes
+
+    # Entry lớn cần đẩy ra nhiều entry nhỏ
+    cache.put("big", _entry(4000))
+    assert set(cache._entries) == {"big"}
+    # Entry lớn hơn cả giới hạn không được giữ trong bộ nhớ
+    cache.put("huge", _entry(10000))
+    assert "huge" not in cache and cache.nbytes == cache._entries["big"][1]
+
+
+def test_disk_tier_survives_a_new_cache_instance(tmp_path):
+    cache = StageCache(max_bytes=2048, disk_dir=str(tmp_path))
+    value = (_entry(5000, 7), {"mask": _entry(10)}, {"angle": 1.5})
+    cache.put("k", value)
+    assert "k" not in cache._entries  # quá lớn cho tầng bộ nhớ, chỉ nằm trên đĩa
+
+    fresh = StageCache(disk_dir=str(tmp_path))
+    out = fresh.get("k")
+    np.testing.assert_array_equal(out[0], value[0])
+    assert out[2] == {"angle": 1.5}
+    assert fresh.hits == 1 and fresh.misses == 0
+    assert fresh.get("missing") is None and fresh.misses == 1
+
+
+def test_disk_tier_evicts_oldest_files_by_size(tmp_path):
+    cache = StageCache(max_bytes=0, disk_dir=str(tmp_path), disk_max_bytes=3500)
+    for key in ("a", "b", "c"):
+        cache.put(key, _entry(1000))
+    cache.get("a")  # a vừa dùng -> b là file cũ nhất
+    cache.put("d", _entry(1000))
+
+    names = sorted(os.listdir(tmp_path))
+    assert names == ["a.pkl", "c.pkl", "d.pkl"]
+    sizes = sum(os.path.getsize(tmp_path / n) for n in names)
+    assert cache._disk_bytes == sizes <= cache.disk_max_bytes
+
+    # Chỉ mục được dựng lại từ thư mục khi mở cache mới
+    reopened = StageCache(max_bytes=0, disk_dir=str(tmp_path), disk_max_bytes=3500)
+    assert reopened._disk_bytes == sizes
+    reopened.put("e", _entry(1000))
+    assert len(os.listdir(tmp_path)) == 3
@@ -0,0 +1,42 @@
+import cv2 as cv
+import numpy as np
+
+from src.core.context import PageContext
+
+
+def test_derived_arrays_are_reused_for_the_current_image(text_page):
+    color = cv.cvtColor(text_page, cv.COLOR_GRAY2BGR)
+    ctx = PageContext(color)
+    gray = ctx.gray()
+    assert ctx.gray() is gray
+    ink = ctx.otsu_ink()
+    # Mảng do context sinh ra (ảnh xám, mask mực) được nhớ như ảnh hiện tại
+    assert ctx.otsu_ink(gray) is ink
+    assert ctx.components(ink) is ctx.components()
+    assert ctx.local_stats(15, gray) is ctx.local_stats(15, gray)
+
+
+def test_foreign_arrays_are_not_memoised(text_page):
+    ctx = PageContext(text_page)
+    ctx.otsu_ink()
+    size = len(ctx._memo)
+    for _ in range(3):
+        # Bản sao mới mỗi lần (như nơi gọi tự chuyển đổi ảnh) -> kết quả đúng nhưng không lưu
+        copy = text_page.copy()
+        np.testing.assert_array_equal(ctx.otsu_ink(copy), ctx.otsu_ink())
+        ctx.components(ctx.otsu_ink(copy))
+    assert len(ctx._memo) == size
+
+
+def test_update_drops_previous_page(text_page):
+    ctx = PageContext(text_page)
+    ink = ctx.otsu_ink()
+    ctx.components()
+    other = 255 - text_page
+    ctx.update(other)
+    assert not ctx._memo
+    assert ctx.otsu_ink() is not ink
+    # Mask của trang cũ không còn được coi là dữ liệu của trang hiện tại
+    size = len(ctx._memo)
+    ctx.components(ink)
+    assert len(ctx._memo) == size
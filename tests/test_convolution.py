@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from src.core.denoiser import ImageDenoiser
+
+
+def reference_correlation(image, kernel, border="constant"):
+    """Tương quan 2D trực tiếp (float64), cùng quy ước pad / cắt [0, 255] như manual_convolution."""
+    kh, kw = kernel.shape
+    padded = np.pad(image.astype(np.float64),
+                    ((kh // 2, kh - 1 - kh // 2), (kw // 2, kw - 1 - kw // 2)), mode=border)
+    h, w = image.shape
+    out = np.zeros((h, w))
+    for dy in range(kh):
+        for dx in range(kw):
+            out += kernel[dy, dx] * padded[dy:dy + h, dx:dx + w]
+    return np.clip(out, 0, 255)
+
+
+@pytest.fixture
+def image():
+    return np.random.default_rng(0).integers(0, 256, (40, 53)).astype(np.uint8)
+
+
+@pytest.mark.parametrize("method", ["direct", "fft", "auto"])
+@pytest.mark.parametrize("shape", [(3, 3), (5, 7), (15, 15)])
+def test_convolution_modes_match_direct(image, method, shape):
+    kernel = np.random.default_rng(1).random(shape).astype(np.float32)
+    kernel /= kernel.sum()
+    out = ImageDenoiser().manual_convolution(image, kernel, method=method, border="edge")
+    ref = reference_correlation(image, kernel.astype(np.float64), border="edge")
+    assert out.dtype == np.uint8
+    # Sai khác chỉ do làm tròn float32 khi ép về uint8
+    assert np.abs(out.astype(np.int16) - ref.astype(np.uint8)).max() <= 1
+
+
+@pytest.mark.parametrize("method", ["separable", "fft", "direct"])
+def test_separable_kernel_all_modes(image, method):
+    g = np.array([1, 4, 6, 4, 1], np.float32) / 16
+    kernel = np.outer(g, g)
+    out = ImageDenoiser().manual_convolution(image, kernel, method=method)
+    ref = reference_correlation(image, kernel.astype(np.float64))
+    assert np.abs(out.astype(np.int16) - ref.astype(np.uint8)).max() <= 1
+
+
+def test_separable_mode_rejects_full_rank_kernel(image):
+    with pytest.raises(ValueError):
+        ImageDenoiser().manual_convolution(image, np.eye(3, dtype=np.float32), method="separable")
+
+
+def test_apply_gaussian_close_to_opencv(image):
+    import cv2 as cv
+    out = ImageDenoiser().apply_gaussian(image, 5, 1.2)
+    ref = cv.GaussianBlur(image, (5, 5), 1.2, borderType=cv.BORDER_REFLECT_101)
+    assert np.abs(out.astype(np.int16) - ref).max() <= 1
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from src.core.denoiser import ImageDenoiser
+
+
+def reference_median(image, ksize):
+    """Cài đặt tham chiếu cũ: lặp từng pixel, pad 'edge'."""
+    h, w = image.shape
+    output = np.zeros_like(image)
+    pad = ksize // 2
+    img_padded = np.pad(image, ((pad, pad), (pad, pad)), mode='edge')
+    for i in range(h):
+        for j in range(w):
+            output[i, j] = np.median(np.sort(img_padded[i:i + ksize, j:j + ksize]))
+    return output
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16])
+@pytest.mark.parametrize("ksize", [1, 3, 5, 7, 27])
+def test_median_matches_reference(dtype, ksize):
+    rng = np.random.default_rng(ksize)
+    image = rng.integers(0, np.iinfo(dtype).max, (23, 31)).astype(dtype)
+    out = ImageDenoiser().manual_median_filter(image, ksize)
+    assert out.dtype == dtype
+    np.testing.assert_array_equal(out, reference_median(image, ksize))
+
+
+def test_median_edge_padding():
+    # Cột sáng ở mép: pad 'edge' giữ nguyên cột đó với ksize=3 (2/3 cửa sổ là 255)
+    image = np.zeros((9, 9), np.uint8)
+    image[:, 0] = 255
+    out = ImageDenoiser().manual_median_filter(image, 3)
+    np.testing.assert_array_equal(out, reference_median(image, 3))
+    assert (out[:, 0] == 255).all()
+
+
+def test_median_tiled_matches_untiled():
+    rng = np.random.default_rng(1)
+    image = rng.integers(0, 256, (70, 90)).astype(np.uint8)
+    den = ImageDenoiser()
+    full = den.manual_median_filter(image, 5)
+    tiled = den.manual_median_filter(image, 5, tile_size=32, workers=2)
+    np.testing.assert_array_equal(tiled, full)
+    np.testing.assert_array_equal(full, reference_median(image, 5))
+
+
+def test_median_rejects_even_ksize():
+    with pytest.raises(ValueError):
+        ImageDenoiser().manual_median_filter(np.zeros((5, 5), np.uint8), 4)
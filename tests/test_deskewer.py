@@ -0,0 +1,39 @@
+import cv2 as cv
+import numpy as np
+import pytest
+
+from scripts.benchmark import make_clean_page, make_degraded_page
+from src.core.deskewer import Deskewer
+from src.core.geometry import GeometryCorrector
+
+
+@pytest.fixture(scope="module")
+def page():
+    return cv.cvtColor(make_clean_page(1, np.random.RandomState(0)), cv.COLOR_BGR2GRAY)
+
+
+@pytest.mark.parametrize("skew", [2.0, -3.5])
+def test_detects_skew(page, skew):
+    angle, confidence = Deskewer().detect_skew_angle(GeometryCorrector().rotate_image(page, skew))
+    assert angle == pytest.approx(-skew, abs=0.1)
+    assert confidence > 0.5
+
+
+@pytest.mark.parametrize("skew", [5.6, -5.6])
+def test_angle_stays_within_max_angle_when_peak_is_on_boundary(page, skew):
+    # Góc thật nằm ngoài khoảng dò -> đỉnh quét thô rơi đúng biên +-max_angle
+    deskewer = Deskewer(max_angle=5.0)
+    angle, _ = deskewer.detect_skew_angle(GeometryCorrector().rotate_image(page, skew))
+    assert -5.0 <= angle <= 5.0
+    assert abs(angle) == pytest.approx(5.0, abs=0.1)
+
+
+@pytest.mark.parametrize("proxy_max_side", [1024, 512, 384])
+def test_shadowed_page_gives_consistent_angle(proxy_max_side):
+    # Trang benchmark: bóng đổ nửa trang + nhiễu; biên bóng không được kéo góc về biên khoảng dò
+    degraded = make_degraded_page(1, seed=0)
+    reference, _ = Deskewer().detect_skew_angle(degraded)
+    angle, confidence = Deskewer(proxy_max_side=proxy_max_side).detect_skew_angle(degraded)
+    assert abs(reference) < 5
+    assert angle == pytest.approx(reference, abs=0.3)
+    assert confidence > 0.2
@@ -0,0 +1,75 @@
+import cv2 as cv
+import numpy as np
+
+from scripts.benchmark import make_clean_page
+from src.core.dewarp import PageDewarper
+
+
+def _page():
+    return cv.cvtColor(make_clean_page(1, np.random.RandomState(0)), cv.COLOR_BGR2GRAY)
+
+
+def _ink_rows(gray):
+    rows = np.flatnonzero((gray < 128).any(axis=1))
+    return rows[0], rows[-1]
+
+
+def _bend(page, amplitude=12.0, profile=None):
+    """Uốn cong trang: dịch mỗi cột theo một parabol (giữa trang võng xuống).
+    profile(ys): hệ số độ cong theo hàng (None = như nhau trên cả trang)."""
+    h, w = page.shape[:2]
+    xs = np.arange(w, dtype=np.float32)
+    ys = np.arange(h, dtype=np.float32)[:, None]
+    shift = amplitude * (1 - ((xs - w / 2) / (w / 2)) ** 2)[None, :]
+    if profile is not None:
+        shift = shift * profile(ys)
+    map_x = np.broadcast_to(xs, (h, w)).astype(np.float32)
+    map_y = (ys - shift).astype(np.float32)
+    return cv.remap(page, map_x, map_y, cv.INTER_LINEAR, borderMode=cv.BORDER_REPLICATE)
+
+
+def _line_sharpness(gray):
+    """Độ sắc nét của profile ngang: dòng thẳng -> profile có đỉnh/đáy rõ, phương sai lớn."""
+    return float(np.var((gray < 128).mean(axis=1)))
+
+
+def test_generate_mesh_flat_curves_is_identity():
+    d = PageDewarper()
+    shape = (600, 800)
+    mesh_x, mesh_y = d.generate_mesh(shape, np.array([0.0, 0.0, 0.0, 70.0]),
+                                     np.array([0.0, 0.0, 0.0, 520.0]), 32)
+    ix, iy = d.identity_mesh(shape, 32)
+    np.testing.assert_allclose(mesh_x, ix)
+    np.testing.assert_allclose(mesh_y, iy, atol=1e-4)
+
+
+def test_flat_page_round_trips():
+    page = _page()
+    out = PageDewarper().dewarp(page)
+    assert out.shape == page.shape
+    assert _ink_rows(out) == _ink_rows(page)
+    assert np.abs(out.astype(np.int16) - page).mean() < 3
+
+
+def test_curved_page_is_straightened():
+    page = _page()
+    bent = _bend(page, amplitude=15.0)
+    out = PageDewarper().dewarp(bent)
+    assert _line_sharpness(out) > 1.5 * _line_sharpness(bent)
+    assert _line_sharpness(out) > 0.85 * _line_sharpness(page)
+    # Chiều cao vùng chữ không bị kéo giãn
+    top, bottom = _ink_rows(out)
+    ref_top, ref_bottom = _ink_rows(page)
+    assert abs((bottom - top) - (ref_bottom - ref_top)) < 12
+
+
+def test_curvature_varying_down_the_page_is_straightened():
+    # Võng mạnh ở giữa trang, gần như phẳng ở dòng đầu / cuối: lưới chỉ dựa trên
+    # 2 dòng ngoài cùng sẽ không nắn được phần giữa
+    page = _page()
+    top, bottom = _ink_rows(page)
+    bent = _bend(page, amplitude=25.0,
+                 profile=lambda ys: np.sin(np.pi * np.clip((ys - top) / (bottom - top), 0, 1)))
+    out = PageDewarper().dewarp(bent)
+    assert _line_sharpness(out) > 1.5 * _line_sharpness(bent)
+    assert _line_sharpness(out) > 0.85 * _line_sharpness(page)
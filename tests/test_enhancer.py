@@ -0,0 +1,30 @@
+import cv2 as cv
+import numpy as np
+import pytest
+
+from scripts.benchmark import make_clean_page, make_degraded_page
+from src.core.enhancer import ImageEnhancer
+from src.utils.augmentor import DataAugmentor
+
+
+def _shadowed_page(seed=0):
+    """Trang có bóng đổ + nhiễu Gauss (không có nhiễu muối tiêu)."""
+    np.random.seed(seed)
+    aug = DataAugmentor(noise_std=12, shadow_amount=0.6)
+    page = aug.add_noise_gaussian(aug.add_shadow(make_clean_page(1, np.random.RandomState(seed))))
+    return cv.cvtColor(page, cv.COLOR_BGR2GRAY)
+
+
+@pytest.mark.parametrize("make_page, mean_tol, p99_tol", [
+    (lambda: cv.cvtColor(make_degraded_page(1, seed=0), cv.COLOR_BGR2GRAY), 0.5, 2),
+    (_shadowed_page, 1.5, 8),
+])
+@pytest.mark.parametrize("downsample", [2, 2.7, 4])
+def test_downsampled_shadow_removal_follows_exact(make_page, mean_tol, p99_tol, downsample):
+    gray = make_page()
+    enhancer = ImageEnhancer()
+    exact = enhancer.remove_shadow(gray)
+    fast = enhancer.remove_shadow(gray, method="downsampled", downsample=downsample)
+    diff = np.abs(exact.astype(np.int16) - fast)
+    assert diff.mean() < mean_tol
+    assert np.percentile(diff, 99) <= p99_tol
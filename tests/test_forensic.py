@@ -0,0 +1,34 @@
+import numpy as np
+
+from src.core.forenstic import ForensicInk
+
+
+def test_inpaint_leaves_unmasked_pixels_unchanged():
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (64, 80)).astype(np.uint8)
+    mask = np.zeros(image.shape, np.uint8)
+    mask[20:35, 30:50] = 255
+    out = ForensicInk().inpaint_holes(image, mask)
+    assert out.shape == image.shape and out.dtype == image.dtype
+    np.testing.assert_array_equal(out[mask == 0], image[mask == 0])
+
+
+def test_inpaint_fills_smooth_gradient():
+    # Nghiệm Laplace của gradient tuyến tính chính là gradient đó
+    image = np.tile(np.linspace(0, 200, 100), (60, 1)).astype(np.uint8)
+    mask = np.zeros(image.shape, np.uint8)
+    mask[20:40, 30:70] = 1
+    damaged = image.copy()
+    damaged[mask > 0] = 255
+    out = ForensicInk().inpaint_holes(damaged, mask)
+    assert np.abs(out.astype(np.int16) - image)[mask > 0].max() <= 2
+
+
+def test_inpaint_color_image_and_empty_mask():
+    image = np.random.default_rng(1).integers(0, 256, (30, 30, 3)).astype(np.uint8)
+    ink = ForensicInk()
+    np.testing.assert_array_equal(ink.inpaint_holes(image, np.zeros((30, 30), np.uint8)), image)
+    mask = np.zeros((30, 30), np.uint8)
+    mask[10:15, 10:15] = 1
+    out = ink.inpaint_holes(image, mask)
+    np.testing.assert_array_equal(out[mask == 0], image[mask == 0])
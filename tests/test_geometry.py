@@ -0,0 +1,76 @@
+import cv2 as cv
+import numpy as np
+import pytest
+
+from scripts.benchmark import make_clean_page
+from src.core.dewarp import PageDewarper
+from src.core.geometry import GeometryCorrector
+from src.core.preprocessor import Preprocessor
+
+
+@pytest.fixture(scope="module")
+def page():
+    return make_clean_page(1, np.random.RandomState(0))
+
+
+def _ink_rows(image):
+    rows = np.flatnonzero((cv.cvtColor(image, cv.COLOR_BGR2GRAY) < 128).any(axis=1))
+    return rows[0], rows[-1]
+
+
+def _mean_diff(a, b):
+    return np.abs(a.astype(np.int16) - b).mean()
+
+
+def test_fused_rotation_matches_rotate_image(page):
+    geo = GeometryCorrector()
+    skewed = geo.rotate_image(page, 3.0)
+    ref = geo.rotate_image(skewed, -3.0)
+
+    plain = geo.fused_warp(skewed, angle=-3.0)
+    assert plain.shape == ref.shape
+    assert _mean_diff(plain, ref) < 1
+
+    # Trang phẳng: thêm khử cong không được làm thay đổi trang
+    dewarped = geo.fused_warp(skewed, angle=-3.0, dewarper=PageDewarper())
+    assert dewarped.shape == ref.shape
+    assert abs(_ink_rows(dewarped)[0] - _ink_rows(ref)[0]) <= 1
+    assert abs(_ink_rows(dewarped)[1] - _ink_rows(ref)[1]) <= 1
+    assert _mean_diff(dewarped, ref) < 4
+
+
+def test_fused_perspective_matches_four_point_transform(page):
+    geo = GeometryCorrector()
+    h, w = page.shape[:2]
+    corners = np.float32([[60, 40], [840, 80], [870, 1200], [30, 1230]])
+    H = cv.getPerspectiveTransform(np.float32([[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]]),
+                                   corners)
+    photo = cv.warpPerspective(page, H, (920, 1280), flags=cv.INTER_CUBIC,
+                               borderValue=(255, 255, 255))
+    # fused_warp xoay với keep_size=False ngay cả khi angle=0 -> so với đúng chuỗi đó
+    ref = geo.four_point_transform(geo.rotate_image(photo, 0.0), corners)
+
+    plain = geo.fused_warp(photo, pts=corners)
+    assert plain.shape == ref.shape
+    assert _mean_diff(plain, ref) < 1
+
+    dewarped = geo.fused_warp(photo, pts=corners, dewarper=PageDewarper())
+    assert dewarped.shape == ref.shape
+    assert abs(_ink_rows(dewarped)[0] - _ink_rows(ref)[0]) <= 1
+    assert abs(_ink_rows(dewarped)[1] - _ink_rows(ref)[1]) <= 1
+    assert _mean_diff(dewarped, ref) < 4
+
+
+def test_fused_warp_reuses_pipeline_proxy(page):
+    geo = GeometryCorrector()
+    skewed = geo.rotate_image(page, 3.0)
+    proxy = Preprocessor().make_proxy(skewed, 512)
+    assert proxy.shape[0] < skewed.shape[0]
+
+    ref = geo.rotate_image(skewed, -3.0)
+    reused = geo.fused_warp(skewed, angle=-3.0, dewarper=PageDewarper(), proxy_max_side=512,
+                            proxy=proxy)
+    assert reused.shape == ref.shape
+    assert abs(_ink_rows(reused)[0] - _ink_rows(ref)[0]) <= 1
+    assert abs(_ink_rows(reused)[1] - _ink_rows(ref)[1]) <= 1
+    assert _mean_diff(reused, ref) < 4
@@ -0,0 +1,89 @@
+import re
+
+import cv2 as cv
+import numpy as np
+
+from conftest import make_text_page
+from src.core.vectorizer import Vectorizer
+from src.utils.io import IOManager
+
+_TOKEN = re.compile(r"[MmCcLlZz]|-?(?:\d+\.?\d*|\.\d+)")
+_ARITY = {"m": 2, "l": 2, "c": 6}
+
+
+def _subpath_starts(d):
+    """Điểm đầu (tuyệt đối) của từng subpath trong chuỗi d (chỉ các lệnh M/m/L/l/C/c/Z/z)."""
+    tokens = _TOKEN.findall(d)
+    starts, cur, sub, i, cmd = [], np.zeros(2), np.zeros(2), 0, None
+    while i < len(tokens):
+        t = tokens[i]
+        if t.isalpha():
+            cmd = t
+            i += 1
+            if t in "Zz":
+                cur = sub.copy()
+            continue
+        n = _ARITY[cmd.lower()]
+        vals = np.array(tokens[i:i + n], dtype=np.float64).reshape(-1, 2)
+        i += n
+        end = vals[-1] if cmd.isupper() else cur + vals[-1]
+        if cmd in "Mm":
+            sub = end.copy()
+            starts.append(end)
+            cmd = "L" if cmd == "M" else "l"  # cặp số tiếp theo sau m là lệnh l ngầm định
+        cur = end
+    return np.array(starts).reshape(-1, 2)
+
+
+def _paths_in(svg_path):
+    with open(svg_path, encoding="utf-8") as f:
+        return re.findall(r'<path d="([^"]*)"', f.read())
+
+
+def _vectorize(page):
+    _, binary = cv.threshold(page, 0, 255, cv.THRESH_BINARY + cv.THRESH_OTSU)
+    return Vectorizer().vectorize(binary)
+
+
+def test_save_svg_merges_separate_vectorizations(tmp_path):
+    a = _vectorize(make_text_page(h=300, w=400, seed=0))
+    b = _vectorize(make_text_page(h=300, w=400, seed=1))
+    # 2 dict cùng fill, tổng số path < merge -> 2 chuỗi d được nối vào cùng 1 <path>
+    out = tmp_path / "page.svg"
+    assert IOManager.save_svg([a, b], str(out), 400, 300, precision=1)
+    paths = _paths_in(out)
+    assert len(paths) == 1 and paths[0].count("M") == 2
+
+    starts = np.concatenate([_subpath_starts(d) for d in paths])
+    expected = np.round(np.concatenate([a["start"], b["start"]]).astype(np.float64), 1)
+    np.testing.assert_allclose(starts, expected, atol=1e-6)
+
+
+def test_path_data_chunks_start_absolute():
+    vec = _vectorize(make_text_page(h=300, w=400))
+    chunks = list(IOManager.path_data(vec, precision=0, paths_per_element=5))
+    assert len(chunks) > 1
+    assert all(d.startswith("M") for d in chunks)
+    starts = _subpath_starts(" ".join(chunks))
+    np.testing.assert_allclose(starts, np.round(vec["start"].astype(np.float64)), atol=1e-6)
+
+
+def test_save_svg_keeps_raw_strings_separate(tmp_path):
+    # Chuỗi thô không được gộp: 2 hình chồng nhau vẫn tô theo nonzero như khi ghi riêng
+    out = tmp_path / "raw.svg"
+    raw = ["m10 10 l20 0 0 20 -20 0z", "m15 15 l5 0 0 5 -5 0z", ("M40 40 l5 0z", "red")]
+    assert IOManager.save_svg(raw, str(out), 100, 100)
+    paths = _paths_in(out)
+    assert paths == ["m10 10 l20 0 0 20 -20 0z", "m15 15 l5 0 0 5 -5 0z", "M40 40 l5 0z"]
+    text = out.read_text(encoding="utf-8")
+    assert "evenodd" not in text and 'fill="red"' in text
+
+
+def test_save_svg_merges_vectorizer_output_around_raw_strings(tmp_path):
+    vec = _vectorize(make_text_page(h=300, w=400, seed=0))
+    out = tmp_path / "mixed.svg"
+    assert IOManager.save_svg([vec, "m1 1 l2 0z", vec], str(out), 400, 300)
+    paths = _paths_in(out)
+    # Thứ tự vẽ giữ nguyên: glyph gộp / chuỗi thô riêng / glyph gộp
+    assert len(paths) == 3 and paths[1] == "m1 1 l2 0z"
+    assert paths[0] == paths[2] and paths[0].count("M") == 1
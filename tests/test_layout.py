@@ -0,0 +1,126 @@
+import cv2 as cv
+import numpy as np
+import pytest
+
+from conftest import make_text_page
+from src.core.layout import LayoutAnalyzer, RegionIndex
+from src.core.segmentor import DocumentSegmentor
+
+
+def _random_boxes(n, size, seed=0):
+    rng = np.random.default_rng(seed)
+    xy = rng.integers(0, size, (n, 2))
+    wh = rng.integers(0, 120, (n, 2))
+    return np.concatenate([xy, wh], axis=1).astype(np.int32)
+
+
+def _brute_force(b, rect, mode):
+    b = b.astype(np.int64)
+    x, y, w, h = rect
+    if mode == "intersect":
+        hit = (b[:, 0] < x + w) & (b[:, 0] + b[:, 2] > x) & (b[:, 1] < y + h) & (b[:, 1] + b[:, 3] > y)
+    elif mode == "center":
+        cx, cy = b[:, 0] + b[:, 2] / 2.0, b[:, 1] + b[:, 3] / 2.0
+        hit = (cx >= x) & (cx < x + w) & (cy >= y) & (cy < y + h)
+    else:
+        hit = (b[:, 0] >= x) & (b[:, 0] + b[:, 2] <= x + w) & (b[:, 1] >= y) & (b[:, 1] + b[:, 3] <= y + h)
+    return np.flatnonzero(hit)
+
+
+@pytest.mark.parametrize("mode", ["intersect", "center", "inside"])
+def test_region_index_matches_brute_force(mode):
+    boxes = _random_boxes(2000, 1000)
+    index = RegionIndex(boxes, cell_size=64)
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        x, y = rng.integers(-50, 1000, 2)
+        w, h = rng.integers(1, 400, 2)
+        rect = (x, y, w, h)
+        np.testing.assert_array_equal(index.query(rect, mode), _brute_force(boxes, rect, mode))
+
+
+def test_region_index_empty_and_bad_mode():
+    index = RegionIndex(np.zeros((0, 4), np.int32))
+    assert len(index) == 0
+    assert len(index.query((0, 0, 10, 10))) == 0
+    with pytest.raises(ValueError):
+        RegionIndex(_random_boxes(5, 100)).query((0, 0, 10, 10), mode="bogus")
+
+
+def test_profiles_match_direct_sums(text_page):
+    la = LayoutAnalyzer()
+    integral = la.ink_integral(text_page)
+    _, ink = cv.threshold(text_page, 0, 1, cv.THRESH_BINARY_INV + cv.THRESH_OTSU)
+    ink = ink.astype(np.int64)
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        x, y = rng.integers(0, 500), rng.integers(0, 400)
+        w, h = rng.integers(1, 300), rng.integers(1, 200)
+        sub = ink[y:y + h, x:x + w]
+        np.testing.assert_array_equal(la.row_profile(integral, (x, y, w, h)), sub.sum(axis=1))
+        np.testing.assert_array_equal(la.col_profile(integral, (x, y, w, h)), sub.sum(axis=0))
+        assert la.ink_count(integral, (x, y, w, h)) == sub.sum()
+
+
+def test_box_integral_matches_mask():
+    boxes = _random_boxes(50, 300)
+    shape = (360, 400)
+    mask = np.zeros(shape, dtype=np.int64)
+    for x, y, w, h in boxes:
+        mask[y:y + h, x:x + w] = 1
+    integral = LayoutAnalyzer.box_integral(boxes, shape)
+    np.testing.assert_array_equal(LayoutAnalyzer.row_profile(integral), mask.sum(axis=1))
+
+
+def test_auto_crop_is_tight_view(text_page):
+    la = LayoutAnalyzer()
+    crop = la.auto_crop(text_page, margin=3)
+    assert np.shares_memory(crop, text_page)
+    rows = np.flatnonzero((text_page < 128).any(axis=1))
+    cols = np.flatnonzero((text_page < 128).any(axis=0))
+    assert crop.shape == (rows[-1] - rows[0] + 1 + 6, cols[-1] - cols[0] + 1 + 6)
+    blank = np.full((50, 50), 255, np.uint8)
+    assert la.auto_crop(blank) is blank
+
+
+@pytest.fixture(scope="module")
+def three_columns():
+    page = make_text_page(columns=3)
+    segments = DocumentSegmentor().segment(page)
+    layout = LayoutAnalyzer().analyze(segments, page.shape, image=page)
+    return page, segments, layout
+
+
+def _column_of(x, width):
+    # make_text_page: cột c bắt đầu tại 30 + c * col_w
+    return (x - 30) // ((width - 60) // 3)
+
+
+def test_analyze_finds_columns(three_columns):
+    page, _, layout = three_columns
+    columns = layout["columns"]
+    assert len(columns) == 3
+    assert (columns[:, 0] < columns[:, 1]).all() and (columns[1:, 0] >= columns[:-1, 1]).all()
+    # X-Y cut: mỗi vùng nằm trọn trong 1 cột, vùng được đọc hết cột trái rồi mới sang phải
+    zones = layout["zones"]
+    first = _column_of(zones[:, 0], page.shape[1])
+    last = _column_of(zones[:, 0] + zones[:, 2] - 1, page.shape[1])
+    np.testing.assert_array_equal(first, last)
+    assert (np.diff(first) >= 0).all()
+
+
+def test_analyze_reading_order(three_columns):
+    page, segments, layout = three_columns
+    lines = segments["lines"]["bbox"]
+    order = layout["line_order"]
+    np.testing.assert_array_equal(np.sort(order), np.arange(len(lines)))
+    ordered = lines[order]
+    col = _column_of(ordered[:, 0], page.shape[1])
+    assert (np.diff(col) >= 0).all()
+    for c in range(3):
+        assert (np.diff(ordered[col == c, 1]) > 0).all()
+    # Chỉ mục dòng: các dòng trong cột giữa
+    mid = layout["index"].query((layout["columns"][1, 0], 0,
+                                 layout["columns"][1, 1] - layout["columns"][1, 0], page.shape[0]),
+                                mode="inside")
+    assert len(mid) and (_column_of(lines[mid, 0], page.shape[1]) == 1).all()
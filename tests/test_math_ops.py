@@ -0,0 +1,65 @@
+import cv2 as cv
+import numpy as np
+import pytest
+
+from src.utils.math_ops import (bilinear_interpolation, calc_gradient_sobel,
+                                dominant_orientation, gradient_orientation_histogram)
+
+
+def _maps(h, w, seed=0):
+    rng = np.random.default_rng(seed)
+    # Có cả tọa độ ngoài ảnh để đi qua nhánh kẹp biên
+    map_x = rng.uniform(-5, w + 5, (h, w)).astype(np.float32)
+    map_y = rng.uniform(-5, h + 5, (h, w)).astype(np.float32)
+    return map_x, map_y
+
+
+@pytest.mark.parametrize("border_value", [None, 255])
+@pytest.mark.parametrize("interpolation", ["bilinear", "nearest"])
+def test_bilinear_does_not_modify_maps(text_page, border_value, interpolation):
+    map_x, map_y = _maps(*text_page.shape)
+    before_x, before_y = map_x.copy(), map_y.copy()
+    bilinear_interpolation(text_page, map_x, map_y, border_value=border_value,
+                           interpolation=interpolation, band_elements=4096)
+    np.testing.assert_array_equal(map_x, before_x)
+    np.testing.assert_array_equal(map_y, before_y)
+
+
+def test_bilinear_matches_remap(text_page):
+    map_x, map_y = _maps(*text_page.shape, seed=1)
+    out = bilinear_interpolation(text_page, map_x, map_y, band_elements=4096)
+    ref = cv.remap(text_page, np.clip(map_x, 0, text_page.shape[1] - 1),
+                   np.clip(map_y, 0, text_page.shape[0] - 1), cv.INTER_LINEAR)
+    assert np.abs(out.astype(np.int16) - ref).max() <= 1
+
+
+@pytest.mark.parametrize("angle", [0.0, 30.0, 60.0, 135.0])
+def test_dominant_orientation_of_straight_line(angle):
+    # Đường thẳng sáng trên nền đen (không có gradient ở biên ảnh): gradient vuông góc với đường
+    image = np.zeros((201, 201), dtype=np.uint8)
+    rad = np.deg2rad(angle)
+    d = np.array([np.cos(rad), -np.sin(rad)]) * 90
+    p0, p1 = np.rint(100 - d).astype(int), np.rint(100 + d).astype(int)
+    cv.line(image, tuple(map(int, p0)), tuple(map(int, p1)), 255, 5, cv.LINE_AA)
+    hist = gradient_orientation_histogram(image.astype(np.float32))
+    # Trục y hướng xuống: đường nghiêng angle (ngược chiều kim đồng hồ) -> gradient 90 - angle
+    expected = (90.0 - angle) % 180.0
+    diff = abs((dominant_orientation(hist) - expected + 90.0) % 180.0 - 90.0)
+    assert diff < 2.0
+
+
+def test_horizontal_line_reports_90_degrees():
+    image = np.zeros((64, 64), dtype=np.float32)
+    image[30:33] = 255
+    hist = gradient_orientation_histogram(image)
+    assert int(np.argmax(hist)) == 90
+    assert dominant_orientation(hist) == pytest.approx(90.0)
+
+
+def test_histogram_returns_gradients_like_calc_gradient_sobel(text_page):
+    hist, magnitude, angle = gradient_orientation_histogram(text_page.astype(np.float32),
+                                                            return_gradients=True)
+    ref_mag, ref_angle = calc_gradient_sobel(text_page.astype(np.float32))
+    np.testing.assert_array_equal(magnitude, ref_mag)
+    np.testing.assert_allclose(angle, ref_angle, atol=1e-6)
+    assert hist.shape == (180,)
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from conftest import make_text_page
+from scripts.benchmark import make_degraded_page
+from src.pipeline import DocumentRestorationPipeline
+
+
+def test_invalid_retain_reports_error_status(text_page):
+    results = DocumentRestorationPipeline().run(text_page, {"retain": "bogus"})
+    assert results["status"] == "error"
+    assert "retain" in results["error"]
+
+
+def test_retain_final_keeps_only_final(text_page):
+    params = {"retain": "final", "dewarp": False, "assume_rgb": False}
+    results = DocumentRestorationPipeline().run(text_page, params)
+    assert results["status"] == "ok", results.get("error")
+    arrays = {k for k, v in results["images"].items() if isinstance(v, np.ndarray)}
+    assert arrays == {"final"}
+    meta = results["meta"]
+    assert meta["retained_bytes"] == results["images"]["final"].nbytes
+    assert meta["peak_retained_bytes"] >= meta["retained_bytes"]
+
+
+def test_kernel_normalization_scales_variant_windows():
+    # Nhiễu để các cửa sổ khác nhau cho ra ảnh nhị phân khác nhau
+    page = make_text_page(noise=60)
+    params = {"dewarp": False, "assume_rgb": False, "x_height_normalize": "kernels",
+              "target_x_height": 5,
+              "threshold_variants": [{"method": "sauvola", "window_size": 15},
+                                     {"method": "niblack", "window_size": 15, "name": "nb"}]}
+    results = DocumentRestorationPipeline().run(page, params)
+    assert results["status"] == "ok", results.get("error")
+    scale = results["meta"]["kernel_scale"]
+    assert scale > 1.5
+    window = max(3, int(round(15 * scale)) | 1)
+    # Biến thể đầu là đầu ra ("binary"), các biến thể sau giữ theo tên
+    assert "binary_nb" in results["images"]
+    pipe = DocumentRestorationPipeline()
+    ref = pipe.seg.binarize_multi(results["images"]["enhanced"],
+                                  [{"method": "sauvola", "window_size": window},
+                                   {"method": "sauvola", "window_size": 15}])
+    np.testing.assert_array_equal(results["images"]["binary"], ref[f"sauvola_{window}"])
+    assert (results["images"]["binary"] != ref["sauvola_15"]).any()
+
+
+def test_small_analysis_proxy_does_not_change_skew_estimate():
+    page = make_degraded_page(1, seed=0)
+    params = {"dewarp": False, "retain": "final"}
+    full = DocumentRestorationPipeline().run(page, params)["meta"]
+    for max_side in (768, 384):
+        meta = DocumentRestorationPipeline().run(page, dict(params, analysis_max_side=max_side))["meta"]
+        assert meta["skew_angle"] == pytest.approx(full["skew_angle"], abs=0.05)
+        assert meta["skew_confidence"] == pytest.approx(full["skew_confidence"], abs=0.05)
+
+
+def test_restore_passes_tiling_to_denoiser(text_page, monkeypatch):
+    pipe = DocumentRestorationPipeline()
+    seen = []
+    original = pipe.denoiser.manual_median_filter
+
+    def spy(image, ksize=3, tile_size=None, workers=1):
+        seen.append((tile_size, workers))
+        return original(image, ksize, tile_size=tile_size, workers=workers)
+
+    monkeypatch.setattr(pipe.denoiser, "manual_median_filter", spy)
+    params = {"dewarp": False, "assume_rgb": False, "retain": "all"}
+    ref = DocumentRestorationPipeline().run(text_page, params)
+    results = pipe.run(text_page, dict(params, tile_size=128, tile_workers=2))
+    assert results["status"] == "ok", results.get("error")
+    assert seen[0] == (128, 2)  # các lời gọi sau là từng tile
+    np.testing.assert_array_equal(results["images"]["denoised"], ref["images"]["denoised"])
+
+
+def test_measure_memory_reports_traced_peak(text_page):
+    import tracemalloc
+
+    params = {"retain": "final", "dewarp": False, "assume_rgb": False, "measure_memory": True}
+    results = DocumentRestorationPipeline().run(text_page, params)
+    assert results["status"] == "ok", results.get("error")
+    meta = results["meta"]
+    # Đỉnh thực gồm cả mảng tạm nên không nhỏ hơn ước lượng theo ảnh được giữ
+    assert meta["peak_traced_bytes"] >= meta["peak_retained_bytes"]
+    assert not tracemalloc.is_tracing()
+    assert "peak_traced_bytes" not in DocumentRestorationPipeline().run(
+        text_page, {"retain": "final", "dewarp": False})["meta"]
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from conftest import make_text_page
+from src.core.segmentor import DocumentSegmentor
+
+LEVELS = ("glyphs", "words", "lines", "blocks")
+
+
+def _contains(outer, inner):
+    """outer[i] chứa inner[i] (bbox [x, y, w, h])."""
+    return ((outer[:, 0] <= inner[:, 0]) & (outer[:, 1] <= inner[:, 1])
+            & (outer[:, 0] + outer[:, 2] >= inner[:, 0] + inner[:, 2])
+            & (outer[:, 1] + outer[:, 3] >= inner[:, 1] + inner[:, 3]))
+
+
+@pytest.fixture(scope="module")
+def two_columns():
+    page = make_text_page(columns=2)
+    return page, DocumentSegmentor().segment(page)
+
+
+def test_segment_struct_of_arrays(two_columns):
+    page, seg = two_columns
+    assert seg["shape"] == page.shape
+    n = {level: len(seg[level]["bbox"]) for level in LEVELS}
+    assert n["glyphs"] > n["words"] > n["lines"] >= n["blocks"] > 0
+    for level in LEVELS:
+        for key, arr in seg[level].items():
+            assert isinstance(arr, np.ndarray) and arr.dtype == np.int32, (level, key)
+            assert len(arr) == n[level]
+    # Id liên tục 0..n-1 ở mọi cấp
+    g = seg["glyphs"]
+    for key, level in (("word", "words"), ("line", "lines"), ("block", "blocks")):
+        np.testing.assert_array_equal(np.unique(g[key]), np.arange(n[level]))
+
+
+def test_segment_hierarchy_is_consistent(two_columns):
+    _, seg = two_columns
+    g, words, lines, blocks = (seg[level] for level in LEVELS)
+    assert _contains(words["bbox"][g["word"]], g["bbox"]).all()
+    assert _contains(lines["bbox"][words["line"]], words["bbox"]).all()
+    assert _contains(blocks["bbox"][lines["block"]], lines["bbox"]).all()
+    np.testing.assert_array_equal(g["line"], words["line"][g["word"]])
+    np.testing.assert_array_equal(g["block"], lines["block"][g["line"]])
+    np.testing.assert_array_equal(words["block"], lines["block"][words["line"]])
+
+
+def test_segment_lines_and_reading_order(two_columns):
+    page, seg = two_columns
+    lines, blocks = seg["lines"], seg["blocks"]
+    # make_text_page: mỗi cột có 1 dòng chữ mỗi 32 px từ y=60 tới h-40
+    assert len(lines["bbox"]) == 2 * len(range(60, page.shape[0] - 40, 32))
+    # Khối không vắt qua 2 cột
+    mid = page.shape[1] // 2
+    x0, x1 = blocks["bbox"][:, 0], blocks["bbox"][:, 0] + blocks["bbox"][:, 2]
+    assert ((x1 <= mid) | (x0 >= mid)).all()
+    # Khối: trên -> dưới, trái -> phải; dòng trong khối: trên -> dưới
+    keys = list(zip(blocks["bbox"][:, 1], blocks["bbox"][:, 0]))
+    assert keys == sorted(keys)
+    assert (np.diff(lines["block"]) >= 0).all()
+    for b in range(len(blocks["bbox"])):
+        assert (np.diff(lines["bbox"][lines["block"] == b, 1]) > 0).all()
+    # Từ trong dòng: trái -> phải
+    words = seg["words"]
+    for ln in range(len(lines["bbox"])):
+        assert (np.diff(words["bbox"][words["line"] == ln, 0]) > 0).all()
+
+
+def test_crops_are_views(two_columns):
+    page, seg = two_columns
+    seg_ = DocumentSegmentor()
+    for level in LEVELS:
+        x, y, w, h = seg[level]["bbox"][0]
+        crop = seg_.crop(page, seg, 0, level)
+        assert crop.shape == (h, w)
+        assert np.shares_memory(crop, page)
+    crops = list(seg_.iter_crops(page, seg, "lines", pad=2))
+    assert len(crops) == len(seg["lines"]["bbox"])
+    assert all(np.shares_memory(c, page) for c in crops)
+
+
+def test_segment_drops_small_blocks_and_empty_page():
+    page = make_text_page()
+    page[5:9, 5:9] = 20  # vết bẩn nhỏ, tách biệt
+    seg = DocumentSegmentor().segment(page, min_area=500)
+    assert (seg["glyphs"]["bbox"][:, 1] > 20).all()
+
+    empty = DocumentSegmentor().segment(np.full((100, 100), 255, np.uint8))
+    assert all(len(empty[level]["bbox"]) == 0 for level in LEVELS)
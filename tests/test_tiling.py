@@ -0,0 +1,69 @@
+import cv2 as cv
+import numpy as np
+import pytest
+
+from scripts.benchmark import make_degraded_page
+from src.core.denoiser import ImageDenoiser
+from src.core.enhancer import ImageEnhancer
+from src.core.segmentor import DocumentSegmentor
+from src.utils.tiling import iter_tiles
+
+# Tile không chia hết kích thước trang -> có tile lẻ ở biên phải / dưới
+TILE = 200
+
+
+@pytest.fixture(scope="module")
+def color_page():
+    return make_degraded_page(0.5, seed=0)
+
+
+@pytest.fixture(scope="module")
+def gray_page(color_page):
+    return cv.cvtColor(color_page, cv.COLOR_BGR2GRAY)
+
+
+def test_tiles_cover_page_once():
+    shape = (1003, 517)
+    count = np.zeros(shape, dtype=np.int32)
+    for core, padded, inner in iter_tiles(shape, TILE, halo=(7, 11), align=(4, 6)):
+        count[core] += 1
+        assert padded[0].start <= core[0].start and padded[1].stop >= core[1].stop
+    assert (count == 1).all()
+
+
+@pytest.mark.parametrize("method, ksize", [("median", 3), ("median", 7), ("gaussian", 5)])
+def test_denoise_tiled_matches_untiled(color_page, method, ksize):
+    denoiser = ImageDenoiser()
+    ref = denoiser.denoise(color_page, method=method, ksize=ksize)
+    tiled = denoiser.denoise(color_page, method=method, ksize=ksize, tile_size=TILE, workers=2)
+    np.testing.assert_array_equal(tiled, ref)
+
+
+def test_sauvola_tiled_matches_untiled(gray_page):
+    seg = DocumentSegmentor()
+    np.testing.assert_array_equal(seg.binarize_sauvola(gray_page, 25, tile_size=TILE, workers=2),
+                                  seg.binarize_sauvola(gray_page, 25))
+
+
+def test_unsharp_tiled_matches_untiled(color_page):
+    enhancer = ImageEnhancer()
+    np.testing.assert_array_equal(enhancer.unsharp_mask(color_page, tile_size=TILE, workers=2),
+                                  enhancer.unsharp_mask(color_page))
+
+
+def test_remove_shadow_tiled_matches_untiled(gray_page):
+    enhancer = ImageEnhancer()
+    np.testing.assert_array_equal(enhancer.remove_shadow(gray_page, 31, tile_size=TILE, workers=2),
+                                  enhancer.remove_shadow(gray_page, 31))
+
+
+@pytest.mark.parametrize("channels", [1, 3])
+def test_clahe_tiled_is_close_to_untiled(color_page, gray_page, channels):
+    # Không bit-exact: OpenCV nội suy LUT bằng float32 theo tọa độ trong tile (xem apply_clahe)
+    page = gray_page if channels == 1 else color_page
+    enhancer = ImageEnhancer()
+    ref = enhancer.apply_clahe(page)
+    tiled = enhancer.apply_clahe(page, tile_size=TILE, workers=2)
+    diff = np.abs(tiled.astype(np.int16) - ref)
+    assert diff.max() <= (1 if channels == 1 else 2)
+    assert (diff > 0).mean() < 1e-3
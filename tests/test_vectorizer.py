@@ -0,0 +1,87 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2 as cv
+import numpy as np
+import pytest
+
+from conftest import make_text_page
+from src.core import vectorizer as vectorizer_module
+from src.core.vectorizer import Vectorizer
+
+
+@pytest.fixture(scope="module")
+def binary_page():
+    page = make_text_page(h=1200, w=1600, columns=2)
+    _, binary = cv.threshold(page, 0, 255, cv.THRESH_BINARY + cv.THRESH_OTSU)
+    return binary
+
+
+@pytest.fixture(scope="module")
+def serial(binary_page):
+    return Vectorizer().vectorize(binary_page)
+
+
+def _assert_same(a, b):
+    assert a.keys() == b.keys()
+    for key in a:
+        np.testing.assert_array_equal(a[key], b[key], err_msg=key)
+
+
+def test_vectorize_structure(serial):
+    vec = serial
+    n_contours = len(vec["start"])
+    assert n_contours > vectorizer_module._PATHS_PER_CHUNK
+    assert vec["seg_offset"].shape == (n_contours + 1,)
+    assert vec["seg_offset"][-1] == len(vec["ctrl"]) == len(vec["is_line"])
+    assert vec["path_offset"][-1] == n_contours
+    assert (np.diff(vec["seg_offset"]) > 0).all()
+
+
+def test_small_page_does_not_start_process_pool(binary_page, serial, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("process pool started for a small page")
+
+    monkeypatch.setattr(vectorizer_module, "ProcessPoolExecutor", fail)
+    _assert_same(Vectorizer().vectorize(binary_page, workers=4), serial)
+
+
+def test_injected_pool_matches_serial(binary_page, serial):
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        for _ in range(2):  # dùng lại cùng pool cho nhiều lần gọi
+            _assert_same(Vectorizer().vectorize(binary_page, pool=pool), serial)
+
+
+def test_process_pool_matches_serial(binary_page, serial, monkeypatch):
+    monkeypatch.setattr(vectorizer_module, "_MIN_PARALLEL_POINTS", 0)
+    _assert_same(Vectorizer().vectorize(binary_page, workers=2), serial)
+
+
+def _reference_breaks(contour, tolerance):
+    """Đỉnh approxPolyDP trên contour dày, dò tuần tự từng đỉnh (cách làm cũ)."""
+    c = contour.reshape(-1, 2)
+    approx = cv.approxPolyDP(contour, tolerance, True).reshape(-1, 2)
+    vidx, pos = [], 0
+    for vx, vy in approx:
+        hit = np.flatnonzero((c[pos:, 0] == vx) & (c[pos:, 1] == vy))
+        if len(hit):
+            pos += int(hit[0])
+            vidx.append(pos)
+    if not vidx or vidx[0] != 0:
+        vidx.insert(0, 0)
+    return np.concatenate([c, c[:1]])[vidx[1:] + [len(c)]]
+
+
+def test_vertex_matching_on_thin_strokes():
+    # Nét mảnh 1 pixel: contour đi qua cùng 1 pixel 2 lần (đi và về)
+    img = np.full((120, 160), 255, np.uint8)
+    cv.line(img, (10, 10), (150, 100), 0, 1)
+    cv.polylines(img, [np.array([[20, 110], [60, 30], [100, 110], [140, 20]])], False, 0, 1)
+    cv.circle(img, (40, 70), 15, 0, 1)
+    contours, sizes = Vectorizer().trace(img, min_area=1)
+    assert any(len(np.unique(c.reshape(-1, 2), axis=0)) < len(c) for c in contours)
+
+    for tolerance in (0.5, 1.0, 3.0):
+        vec = vectorizer_module._fit_paths(contours, sizes, tolerance, fit_tolerance=1e9)
+        for i, contour in enumerate(contours):
+            ends = vec["ctrl"][vec["seg_offset"][i]:vec["seg_offset"][i + 1], 2]
+            np.testing.assert_array_equal(ends, _reference_breaks(contour, tolerance) + 0.5)